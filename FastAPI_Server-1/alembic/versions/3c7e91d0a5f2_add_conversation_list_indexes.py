@@ -0,0 +1,35 @@
+"""Add conversation list indexes
+
+Revision ID: 3c7e91d0a5f2
+Revises: b82b328f3704
+Create Date: 2026-10-18 13:05:12.402871
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7e91d0a5f2'
+down_revision: Union[str, None] = 'b82b328f3704'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_conversations_timestamp_id', 'conversations', ['timestamp', 'id'], unique=False)
+    op.create_index('ix_conversations_initial_review_by', 'conversations', ['initial_review_by', 'timestamp', 'id'],
+                    unique=False, postgresql_where=sa.text('initial_review_by IS NOT NULL'))
+    op.create_index('ix_conversations_final_review_by', 'conversations', ['final_review_by', 'timestamp', 'id'],
+                    unique=False, postgresql_where=sa.text('final_review_by IS NOT NULL'))
+    op.create_index('ix_conversations_conversation_id_prefix', 'conversations', ['conversation_id'], unique=False,
+                    postgresql_ops={'conversation_id': 'varchar_pattern_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conversations_conversation_id_prefix', table_name='conversations')
+    op.drop_index('ix_conversations_final_review_by', table_name='conversations')
+    op.drop_index('ix_conversations_initial_review_by', table_name='conversations')
+    op.drop_index('ix_conversations_timestamp_id', table_name='conversations')
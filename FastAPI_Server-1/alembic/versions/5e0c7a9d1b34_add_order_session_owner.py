@@ -0,0 +1,28 @@
+"""Add order session owner
+
+Revision ID: 5e0c7a9d1b34
+Revises: 8d41f6b2c9e7
+Create Date: 2026-10-18 16:12:05.204918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e0c7a9d1b34'
+down_revision: Union[str, None] = '8d41f6b2c9e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('order_sessions', sa.Column('owner', sa.String(length=64), nullable=True))
+    op.add_column('order_sessions', sa.Column('owned_until', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('order_sessions', 'owned_until')
+    op.drop_column('order_sessions', 'owner')
@@ -0,0 +1,36 @@
+"""Add review claims
+
+Revision ID: 8d41f6b2c9e7
+Revises: 3c7e91d0a5f2
+Create Date: 2026-10-18 13:48:37.915402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41f6b2c9e7'
+down_revision: Union[str, None] = '3c7e91d0a5f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('conversations', sa.Column('claimed_by', sa.Integer(), nullable=True))
+    op.add_column('conversations', sa.Column('claimed_until', sa.DateTime(timezone=True), nullable=True))
+    op.create_foreign_key('conversations_claimed_by_fkey', 'conversations', 'users', ['claimed_by'], ['id'], ondelete='SET NULL')
+    op.create_index('ix_conversations_awaiting_initial_review', 'conversations', ['timestamp', 'id'], unique=False,
+                    postgresql_where=sa.text('initial_review_by IS NULL'))
+    op.create_index('ix_conversations_awaiting_final_review', 'conversations', ['timestamp', 'id'], unique=False,
+                    postgresql_where=sa.text('initial_review_by IS NOT NULL AND final_review_by IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_conversations_awaiting_final_review', table_name='conversations')
+    op.drop_index('ix_conversations_awaiting_initial_review', table_name='conversations')
+    op.drop_constraint('conversations_claimed_by_fkey', 'conversations', type_='foreignkey')
+    op.drop_column('conversations', 'claimed_until')
+    op.drop_column('conversations', 'claimed_by')
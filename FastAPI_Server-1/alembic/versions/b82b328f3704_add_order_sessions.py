@@ -0,0 +1,72 @@
+"""Add order sessions
+
+Revision ID: b82b328f3704
+Revises: f2dafb45d72a
+Create Date: 2026-10-18 10:12:41.318265
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b82b328f3704'
+down_revision: Union[str, None] = 'f2dafb45d72a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('order_sessions',
+    sa.Column('id', sa.String(length=100), nullable=False),
+    sa.Column('next_version', sa.Integer(), nullable=False),
+    sa.Column('latest_conversation_id', sa.String(length=100), nullable=True),
+    sa.Column('latest_context', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_order_sessions_active', 'order_sessions', ['updated_at'], unique=False,
+                    postgresql_where=sa.text("status = 'active'"))
+
+    # Backfill one session per '<base>_<version>' prefix, pointing at its latest row
+    op.execute("""
+        INSERT INTO order_sessions
+            (id, next_version, latest_conversation_id, latest_context, status, created_at, updated_at)
+        SELECT DISTINCT ON (base_id)
+            base_id, max_version + 1, conversation_id, context, 'closed', first_timestamp, timestamp
+        FROM (
+            SELECT
+                split_part(conversation_id, '_', 1) AS base_id,
+                conversation_id,
+                context,
+                timestamp,
+                max(split_part(conversation_id, '_', 2)::integer)
+                    OVER (PARTITION BY split_part(conversation_id, '_', 1)) AS max_version,
+                min(timestamp)
+                    OVER (PARTITION BY split_part(conversation_id, '_', 1)) AS first_timestamp
+            FROM conversations
+            WHERE conversation_id ~ '^[^_]+_[0-9]+$'
+        ) AS versions
+        ORDER BY base_id, timestamp DESC NULLS LAST, conversation_id DESC
+    """)
+
+    # The session of the most recent conversation is the one still taking orders
+    op.execute("""
+        UPDATE order_sessions SET status = 'active'
+        WHERE id = (
+            SELECT split_part(conversation_id, '_', 1)
+            FROM conversations
+            WHERE conversation_id ~ '^[^_]+_[0-9]+$'
+            ORDER BY timestamp DESC NULLS LAST, conversation_id DESC
+            LIMIT 1
+        )
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_order_sessions_active', table_name='order_sessions', postgresql_where=sa.text("status = 'active'"))
+    op.drop_table('order_sessions')
@@ -1,127 +1,150 @@
 import json
-from fastapi import APIRouter, HTTPException, Depends, status
+import time
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import Optional
-from .models import Conversation, RequestBody
-from .schemas import OrderOutput
+from typing import Literal, Optional
+from .models import Conversation, OrderSession, RequestBody, SESSION_ACTIVE, SESSION_CLOSED
+from .schemas import OrderOutput, ConversationSchema, ConversationPageSchema
 from app.utils.db_base import get_db
-from app.settings import logger, OPENAI_KEY
-from sqlalchemy import nulls_last, func
-import os
-import pandas as pd
-from wonderwords import RandomWord
-from datetime import datetime, timezone
-from sqlalchemy import Integer
+from app.utils.security import check_if_admin
+from app.utils.pagination import parse_fields, keyset_query, page_rows
+from app.utils.metrics import STAGE_SECONDS, ORDER_SOURCE, OPENAI_REQUESTS
+from app.settings import logger, AsyncSessionLocal, OPENAI_KEY, OPENAI_MODEL, OPENAI_BASE_URL, LOCAL_PARSER_ENABLED, LOCAL_PARSER_MIN_CONFIDENCE, ORDER_CACHE_ENABLED
+from app.settings import PAGE_SIZE, PAGE_MAX_SIZE, ORDER_SESSION_LEASE
+from sqlalchemy import exists, func, or_, update
+from datetime import datetime, timedelta, timezone
 import openai
 from openai import AsyncOpenAI
-from better_profanity import profanity
+from .order_parser import parse_order_locally
+from .cache import get_cached_order, cache_order, get_cache_stats
+from .streaming import PartialJSONFields
+from .prompt import build_order_messages, log_prompt_usage, get_prompt_stats
+from .validation import validate_order
+from .id_pool import allocate_conversation_id, random_word
+from .llm_gateway import llm_gateway, request_deadline, LLMUnavailable
+from .conversation_writer import pending_conversations
+from sse_starlette.sse import EventSourceResponse
 conversation_router = APIRouter()
 
 
 # Initialize OpenAI client
-client = AsyncOpenAI(api_key=OPENAI_KEY)
+client = AsyncOpenAI(api_key=OPENAI_KEY, base_url=OPENAI_BASE_URL)
 
 
-# Load menu once at module level
-menu_path = os.path.join(os.path.dirname(__file__), 'menu.csv')
-df = pd.read_csv(menu_path)
-menu_string = df.set_index("Item").apply(
-    lambda row: {"sizes": row["Size Options"].split(","), "toppings": row["Topping Options"].split(",")}, axis=1
-).to_dict()
+ORDER_FIELDS = ("order_details", "sizes", "toppings", "answer")
+REPEAT_ANSWER = "Sorry, I didn't catch that. Could you please repeat your order?"
 
 
-# System prompt for the order processing
-SYSTEM_PROMPT = """You are a highly skilled waiter processing customer orders according to these strict rules:
+async def get_fast_order_result(transcription: str, previous_output: str) -> Optional[dict]:
+    """Result from the local parser or the cache, None when the LLM is needed"""
+    if LOCAL_PARSER_ENABLED:
+        with STAGE_SECONDS.labels("local_parser").time():
+            local = parse_order_locally(transcription, previous_output)
+        if local.result is not None and local.confidence >= LOCAL_PARSER_MIN_CONFIDENCE:
+            logger.debug(f"Order parsed locally with confidence {local.confidence:.2f}")
+            ORDER_SOURCE.labels("local").inc()
+            return local.result
 
+    if ORDER_CACHE_ENABLED:
+        with STAGE_SECONDS.labels("cache_lookup").time():
+            cached = await get_cached_order(transcription, previous_output)
+        if cached is not None:
+            logger.debug("Order served from cache")
+            ORDER_SOURCE.labels("cache").inc()
+            return cached
 
-1. MENU VALIDATION:
-- ONLY accept items that align with the provided menu.
-- Ignore items that do not align with given menu.
+    return None
 
-2. SIZE HANDLING:
-- Use '?' only for items whose size isn't specified by customer.
-- Use '!' only when customer requests an unavailable size for an item that exists in menu.
-- Use 'One Size Option' only for items that have exactly one size option in the menu.
-- Never assume or default to any size - if not specified, it must be '?'.
-- When customer changes size by saying something like 'make it large', only modify the last item mentioned.
 
+async def process_order(transcription: str, previous_output: str, deadline: Optional[float] = None) -> dict:
+    """Process an order locally or from cache when possible, otherwise with OpenAI"""
+    result = await get_fast_order_result(transcription, previous_output)
+    if result is not None:
+        return result
 
-3. TOPPING HANDLING:
-- Use '?' only for items whose topping isn't specified by customer.
-- Use '!' only when customer requests an unavailable topping for an item that exists in menu.
-- Use 'No Topping Option' only for items that have no topping option in the menu.
-- Never assume or default to any topping - if not specified, it must be '?'.
-- Separate multiple toppings for the same item with a slash ('/').
-- When the customer changes a topping, update the most recently mentioned item.
-
-
-4. ORDER MANAGEMENT:
-- Clear the order on 'clear everything', 'get rid of everything', or 'cancel all.'
-- Replace the entire order when customer says 'scratch that, just X.'
-
-
-5. ANSWERING QUESTIONS:
--If the customer asks a question about the menu, answer it concisely and do not directly add that item to the order
--If the customer mentions an addition to **those**, answer with the phrase: "what item are you referencing when you say: **input customer response here** ?"
--If the customer asks for something that does not align with the menu, answer with either the phrase: "Sorry, not available" or "Sorry, not in menu" -- Never use the same response twice in a row.
-
-6. OUTPUT FORMAT:
-Your response must be a JSON object with these exact keys:
-- order_details: String containing the formatted order
-- sizes: String of all sizes used
-- toppings: String of all toppings used
-- answer: String of answer to a customer's question about the menu
-
-7. SPECIAL CASES:
-If the customer just says the item by itself, do not clear the order and write down that item. Just append that item to the current order
-If the customer just says the toppings by itself without food-items, append the toppings to the right-most item in the context
-If the customer orders an item and asks a question about another food item in the menu in the same sentence, do not append the quesitoned item
-If the customer orders n amount of an item and then changes the order, separate the items, sizes, and toppings accordingly
-
-Format rules:
-- Items: 'n x Item Name'
-- Sizes: 'n x Size' or 'n x One Size Option' or 'n x ?' or 'n x !'
-- Toppings: 'n x Topping' or 'n x No Topping Option' or 'n x ?' or 'n x !'
-- Mixed sizes/toppings: separate with commas
-- Multiple toppings: separate with slash ('/')
-
-Note: Never put toppings or sizes in Items, and vice versa
-Note: If there are n separate items in order_details, there should also be n separate sizes and n separate toppings
-
-
-"""
-#If the *answer* string includes **what item are you referencing**, extract customer input from *answer* string and adjust **previous output** but replace **those** with current **customer input**
-
+    try:
+        result = await process_order_with_llm(transcription, previous_output, deadline)
+    except LLMUnavailable as e:
+        return degraded_order(transcription, previous_output, str(e))
+    await remember_llm_result(transcription, previous_output, result)
+    return result
+
+
+async def remember_llm_result(transcription: str, previous_output: str, result: dict):
+    """Count and cache a result the LLM produced for a chunk"""
+    ORDER_SOURCE.labels("llm").inc()
+    if ORDER_CACHE_ENABLED:
+        with STAGE_SECONDS.labels("cache_store").time():
+            await cache_order(transcription, previous_output, result)
+
+
+def degraded_order(transcription: str, previous_output: str, reason: str) -> dict:
+    """Answer without the LLM: the local parse when it is confident, else keep the
+    order as it was and ask the customer to repeat"""
+    logger.warning(f"LLM unavailable ({reason}), answering in degraded mode")
+    ORDER_SOURCE.labels("degraded").inc()
+    # When the parser is enabled get_fast_order_result already found it wasn't
+    # confident. A guess could do the opposite of what was asked ("no coke" adding a Coke)
+    if not LOCAL_PARSER_ENABLED:
+        local = parse_order_locally(transcription, previous_output)
+        if local.result is not None and local.confidence >= LOCAL_PARSER_MIN_CONFIDENCE:
+            return local.result
 
-async def process_order(transcription: str, previous_output: str) -> dict:
-    """Process an order using OpenAI API"""
     try:
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": f"""
-Previous order state: {previous_output}
-Menu: {menu_string}
-Customer order: {transcription}
-
-
-Process this order according to the rules and return a JSON response."""}
-        ]
-
-        response = await client.chat.completions.create(
-            model="gpt-4o",  # or your preferred model
-            messages=messages,
-            temperature=0,
-            response_format={"type": "json_object"}
-        )
+        previous = json.loads(previous_output) if previous_output.strip() else {}
+    except ValueError:
+        previous = {}
+    if not isinstance(previous, dict):
+        previous = {}
+    return {
+        "order_details": previous.get("order_details", ""),
+        "sizes": previous.get("sizes", ""),
+        "toppings": previous.get("toppings", ""),
+        "answer": REPEAT_ANSWER,
+    }
+
+
+def repair_order(result: dict) -> dict:
+    """Check the LLM output against the menu and fix it locally"""
+    with STAGE_SECONDS.labels("validation").time():
+        result, issues = validate_order(result)
+    if issues:
+        logger.warning(f"Repaired order from OpenAI: {'; '.join(issues)}")
+    return result
+
+
+async def process_order_with_llm(transcription: str, previous_output: str, deadline: Optional[float] = None) -> dict:
+    """Process an order using OpenAI API, raises LLMUnavailable when the gateway turns it away"""
+    try:
+        messages = build_order_messages(transcription, previous_output)
+
+        async with llm_gateway.admit(deadline) as timeout, asyncio.timeout(timeout):
+            with STAGE_SECONDS.labels("openai").time():
+                response = await client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=messages,
+                    temperature=0,
+                    response_format={"type": "json_object"},
+                    timeout=timeout
+                )
+        OPENAI_REQUESTS.labels("success").inc()
 
 
+        log_prompt_usage(response.usage)
+
         # Extract and parse the JSON response
-        result = json.loads(response.choices[0].message.content)
-        return result
+        with STAGE_SECONDS.labels("json_parse").time():
+            result = json.loads(response.choices[0].message.content)
+        return repair_order(result)
 
 
+    except LLMUnavailable:
+        OPENAI_REQUESTS.labels("rejected").inc()
+        raise
     except Exception as e:
+        OPENAI_REQUESTS.labels("error").inc()
         logger.error(f"Error processing order with OpenAI: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -129,6 +152,65 @@ Process this order according to the rules and return a JSON response."""}
         )
 
 
+async def stream_order_with_llm(transcription: str, previous_output: str, deadline: Optional[float] = None):
+    """Stream an order from OpenAI, yielding ('partial', changed fields) while the
+    JSON is generated and ('final', result) once it is complete.
+
+    Raises LLMUnavailable when the gateway turns the call away or the deadline
+    passes mid-stream; partials may already have been sent by then.
+    """
+    started = time.perf_counter()
+    try:
+        async with llm_gateway.admit(deadline) as timeout:
+            deadline = time.monotonic() + timeout
+            async with asyncio.timeout(timeout):
+                stream = await client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=build_order_messages(transcription, previous_output),
+                    temperature=0,
+                    response_format={"type": "json_object"},
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    timeout=timeout
+                )
+
+            fields = PartialJSONFields()
+            content = []
+            async for chunk in stream:
+                # Checked between chunks, a stalled stream is bounded by the client read timeout
+                if time.monotonic() > deadline:
+                    await stream.close()
+                    raise TimeoutError
+                # The usage arrives on a last chunk without choices
+                log_prompt_usage(chunk.usage)
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not content:
+                    STAGE_SECONDS.labels("openai_first_token").observe(time.perf_counter() - started)
+                content.append(delta)
+                changed = {k: v for k, v in fields.feed(delta).items() if k in ORDER_FIELDS}
+                if changed:
+                    yield "partial", changed
+    except LLMUnavailable:
+        OPENAI_REQUESTS.labels("rejected").inc()
+        raise
+    except Exception:
+        OPENAI_REQUESTS.labels("error").inc()
+        raise
+    # Includes the time the consumer spent on the partial updates
+    STAGE_SECONDS.labels("openai_stream").observe(time.perf_counter() - started)
+    OPENAI_REQUESTS.labels("success").inc()
+    ORDER_SOURCE.labels("llm").inc()
+
+    with STAGE_SECONDS.labels("json_parse").time():
+        result = json.loads("".join(content))
+    result = repair_order(result)
+    if ORDER_CACHE_ENABLED:
+        await cache_order(transcription, previous_output, result)
+    yield "final", result
+
+
 # Keep the database helper functions unchanged
 async def get_conversation_or_404(id: int, session: AsyncSession) -> Conversation:
     conversation = await session.get(Conversation, id)
@@ -141,26 +223,26 @@ async def get_conversation_or_404(id: int, session: AsyncSession) -> Conversatio
 
 
 async def generate_unique_conversation_id(session: AsyncSession) -> str:
-
+    """Take an id from the Redis pool, probing the database only if Redis is down"""
+    random_id = await allocate_conversation_id()
+    if random_id is not None:
+        return random_id
 
     max_attempts = 100  # Prevent infinite loops
     attempt = 0
    
     while attempt < max_attempts:
-        # Generate random word
-        random_id = RandomWord().word()
+        # Generate random profanity-free word
+        random_id = random_word()
        
-        # Check for profanity
-        if profanity.contains_profanity(random_id):
-            attempt += 1
-            continue
-           
-        # Check if ID exists in database
-        result = await session.execute(
-            select(Conversation).where(Conversation.conversation_id.like(f"{random_id}_%"))
-        )
+        # Check if ID exists in database, as a session or in the ids of conversations
+        # ('<id>_<version>'), which may outlive their session
+        taken = await session.scalar(select(or_(
+            exists().where(OrderSession.id == random_id),
+            exists().where(Conversation.conversation_id.startswith(f"{random_id}_", autoescape=True)),
+        )))
        
-        if not result.scalars().first():
+        if not taken:
             return random_id
            
         attempt += 1
@@ -168,60 +250,252 @@ async def generate_unique_conversation_id(session: AsyncSession) -> str:
     raise RuntimeError("Failed to generate unique profanity-free ID after maximum attempts")
 
 
-async def get_latest_order_context(session: AsyncSession, base_id: str) -> str:
+@conversation_router.get("/cache_stats", dependencies=[Depends(check_if_admin)])
+async def order_cache_stats():
+    return await get_cache_stats()
+
+
+@conversation_router.get("/prompt_stats", dependencies=[Depends(check_if_admin)])
+async def order_prompt_stats():
+    return get_prompt_stats()
+
+
+CONVERSATION_FIELDS = tuple(ConversationSchema.model_fields)
+CONVERSATION_KEYS = (Conversation.timestamp, Conversation.id)
+
+
+@conversation_router.get("", response_model=ConversationPageSchema, dependencies=[Depends(check_if_admin)])
+async def list_conversations(
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_MAX_SIZE),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, all by default"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    initial_review_by: Optional[int] = None,
+    final_review_by: Optional[int] = None,
+    base_id: Optional[str] = Query(None, description="Only the conversations of this customer session"),
+    order: Literal["asc", "desc"] = "desc",
+    session: AsyncSession = Depends(get_db)
+):
+    """Conversations by timestamp, a page at a time"""
+    selected = parse_fields(fields, CONVERSATION_FIELDS)
+    query = select(Conversation)
+    if since is not None:
+        query = query.where(Conversation.timestamp >= since)
+    if until is not None:
+        query = query.where(Conversation.timestamp < until)
+    if initial_review_by is not None:
+        query = query.where(Conversation.initial_review_by == initial_review_by)
+    if final_review_by is not None:
+        query = query.where(Conversation.final_review_by == final_review_by)
+    if base_id:
+        query = query.where(Conversation.conversation_id.startswith(f"{base_id}_", autoescape=True))
+
+    result = await session.execute(keyset_query(
+        Conversation, selected, CONVERSATION_KEYS, query, cursor,
+        (datetime.fromisoformat, int), limit, descending=order == "desc"
+    ))
+    items, next_cursor = page_rows(result.mappings().all(), selected, CONVERSATION_KEYS, limit)
+    # Validated and serialized in one go, not row by row by the response_model
+    page = ConversationPageSchema(items=items, next_cursor=next_cursor)
+    return Response(page.model_dump_json(exclude_unset=True), media_type="application/json")
+
+
+async def get_active_session(session: AsyncSession) -> Optional[OrderSession]:
+    """The session new chunks are added to, found through the partial index on active sessions"""
     result = await session.execute(
-        select(Conversation.context)
-        .where(Conversation.conversation_id.like(f"{base_id}_%"))
-        .order_by(nulls_last(Conversation.timestamp.desc()))
+        select(OrderSession)
+        .where(OrderSession.status == SESSION_ACTIVE)
+        .order_by(OrderSession.updated_at.desc())
         .limit(1)
     )
-    context = result.scalar()
-    return context if context else " "
+    return result.scalar()
 
 
-async def get_conversation_version(session: AsyncSession, base_id: str) -> int:
-    try:
-        result = await session.execute(
-            select(func.max(
-                func.cast(
-                    func.regexp_replace(
-                        Conversation.conversation_id,
-                        f'^{base_id}_',
-                        ''
-                    ),
-                    type_=Integer
+async def new_customer_session(session: AsyncSession) -> tuple[str, str]:
+    """Close the active session and start a new one (committed), returns it like resolve_order_session"""
+    await session.execute(select(func.pg_advisory_xact_lock(NEW_SESSION_LOCK)))
+    now = datetime.now(timezone.utc)
+    await session.execute(
+        update(OrderSession)
+        .where(OrderSession.status == SESSION_ACTIVE)
+        .values(status=SESSION_CLOSED, updated_at=now)
+    )
+
+    base_id = await generate_unique_conversation_id(session)
+    session.add(OrderSession(id=base_id, next_version=0, latest_context="", status=SESSION_ACTIVE, created_at=now, updated_at=now))
+    await session.flush()
+    await record_conversation(session, base_id, "New customer session", "")
+    return base_id, ""
+
+
+async def resolve_order_session(session: AsyncSession) -> tuple[str, str]:
+    """Find the session the next chunk belongs to as (base id, latest context)"""
+    order_session = await get_active_session(session)
+
+    if order_session is None:
+        # Another worker may be starting one right now
+        await session.execute(select(func.pg_advisory_xact_lock(NEW_SESSION_LOCK)))
+        order_session = await get_active_session(session)
+        if order_session is None:
+            return await new_customer_session(session)
+        base_id, latest_context = order_session.id, order_session.latest_context
+        # Releases the lock
+        await session.commit()
+        return base_id, latest_context
+
+    return order_session.id, order_session.latest_context
+
+
+# Chunks of one session are processed one at a time, whichever worker they reach:
+# the row of the session is locked (SELECT ... FOR UPDATE) from reading its
+# latest context until the result is committed, so every chunk is parsed against
+# the result of the one before it instead of racing it. Sessions are started
+# under a transaction-level advisory lock, so two workers never start one each.
+#
+# A WebSocket connection claims the session once instead, for ORDER_SESSION_LEASE
+# seconds at a time (owner, owned_until), and keeps the order in memory. Its rows
+# go through the conversation writer, which moves the session pointer along, and
+# HTTP chunks for the session are turned away until the lease is released or
+# runs out.
+NEW_SESSION_LOCK = 0x6F726465725F73  # 'order_s'
+
+
+def session_in_use():
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="The order session is in use by a WebSocket connection"
+    )
+
+
+async def lock_order_session(session: AsyncSession) -> tuple[str, str]:
+    """Lock the row of the active session until the transaction ends, returns
+    (base id, latest context) read under the lock"""
+    with STAGE_SECONDS.labels("session_lock_wait").time():
+        while True:
+            base_id, _ = await resolve_order_session(session)
+            row = (await session.execute(
+                select(OrderSession.latest_context, (OrderSession.owned_until > func.now()).label("owned"))
+                .where(OrderSession.id == base_id, OrderSession.status == SESSION_ACTIVE)
+                .with_for_update()
+            )).first()
+            if row is not None:
+                if row.owned:
+                    raise session_in_use()
+                return base_id, row.latest_context
+            # Closed by a 'done' while waiting for the lock, a new session is active now
+
+
+async def claim_order_session(session: AsyncSession, owner: str) -> tuple[str, str, int]:
+    """Make `owner` the owner of the active session for ORDER_SESSION_LEASE seconds
+    (committed), returns (base id, latest context, next version). Claiming again
+    renews the lease."""
+    while True:
+        base_id, _ = await resolve_order_session(session)
+        now = func.now()
+        row = (await session.execute(
+            update(OrderSession)
+            .where(
+                OrderSession.id == base_id,
+                OrderSession.status == SESSION_ACTIVE,
+                or_(
+                    OrderSession.owned_until.is_(None),
+                    OrderSession.owned_until < now,
+                    OrderSession.owner == owner,
                 )
-            )).where(
-                Conversation.conversation_id.like(f"{base_id}_%")
             )
+            .values(owner=owner, owned_until=now + timedelta(seconds=ORDER_SESSION_LEASE))
+            .returning(OrderSession.latest_context, OrderSession.next_version)
+        )).first()
+        await session.commit()
+        if row is not None:
+            return base_id, row.latest_context, row.next_version
+        if await session.scalar(select(OrderSession.status).where(OrderSession.id == base_id)) == SESSION_ACTIVE:
+            raise session_in_use()
+        # Closed by a 'done' in the meantime
+
+
+async def release_order_session(session: AsyncSession, base_id: str, owner: str, context: str, next_version: int):
+    """Give up the session, with the latest order of its owner. The writer may not
+    have moved the pointer that far yet, the next HTTP chunk reads it right away."""
+    now = datetime.now(timezone.utc)
+    await session.execute(
+        update(OrderSession)
+        .where(OrderSession.id == base_id, OrderSession.owner == owner, OrderSession.next_version < next_version)
+        .values(
+            next_version=next_version,
+            latest_conversation_id=f"{base_id}_{next_version - 1}",
+            latest_context=context,
+            updated_at=now
         )
-        latest_version = result.scalar()
-        return 0 if latest_version is None else latest_version + 1
-    except Exception as e:
-        logger.error(f"Error getting conversation version: {str(e)}")
-        result = await session.execute(
-            select(func.count()).where(
-                Conversation.conversation_id.like(f"{base_id}_%")
+    )
+    await session.execute(
+        update(OrderSession)
+        .where(OrderSession.id == base_id, OrderSession.owner == owner)
+        .values(owner=None, owned_until=None)
+    )
+    await session.commit()
+
+
+async def record_conversation(session: AsyncSession, base_id: str, chunk: str, context: str, commit: bool = True) -> str:
+    """Store a Conversation row under the next version of its order session.
+
+    The version is taken by an UPDATE ... RETURNING on the session row, so
+    concurrent writers (other workers included) always get distinct versions and
+    the latest pointer moves in version order. The row itself is spooled with the
+    commit and inserted in the background by the conversation writer (in the
+    transaction when the writer isn't running, outside the app).
+    Returns the conversation id.
+    """
+    now = datetime.now(timezone.utc)
+    with STAGE_SECONDS.labels("version_allocate").time():
+        conversation_id = await session.scalar(
+            update(OrderSession)
+            .where(OrderSession.id == base_id)
+            .values(
+                next_version=OrderSession.next_version + 1,
+                latest_conversation_id=func.concat(OrderSession.id, "_", OrderSession.next_version),
+                latest_context=context,
+                updated_at=now
             )
+            .returning(OrderSession.latest_conversation_id)
         )
-        count = result.scalar()
-        return count
+    if conversation_id is None:
+        raise ValueError(f"Order session {base_id} does not exist")
+
+    pending_conversations(session).append({
+        "chunk": chunk,
+        "context": context,
+        "conversation_id": conversation_id,
+        "timestamp": now
+    })
+    if commit:
+        with STAGE_SECONDS.labels("commit").time():
+            await session.commit()
+    return conversation_id
 
 
-async def get_latest_conversation_id(session: AsyncSession) -> Optional[str]:
-    try:
-        result = await session.execute(
-            select(Conversation.conversation_id)
-            .order_by(
-                nulls_last(Conversation.timestamp.desc()),
-                Conversation.conversation_id.desc()
-            )
-            .limit(1)
-        )
-        return result.scalar()
-    except Exception as e:
-        logger.error(f"Error getting latest conversation ID: {str(e)}")
-        return None
+async def save_conversation(session: AsyncSession, base_id: str, chunk: str, result: dict, commit: bool = True) -> str:
+    """Store a processed chunk in the Conversation table"""
+    return await record_conversation(session, base_id, chunk, json.dumps(result), commit)
+
+
+async def finish_order_session(session: AsyncSession, transcription: str, deadline: Optional[float] = None) -> dict:
+    """Handle 'done': process whatever was said before it and start a new customer session"""
+    before_done = transcription.lower().split('done')[0].strip()
+
+    active = await get_active_session(session)
+    if active is not None and active.owned_until is not None and active.owned_until > datetime.now(timezone.utc):
+        raise session_in_use()
+    if before_done and active is not None:
+        base_id, latest_context = await lock_order_session(session)
+        crew_result = await process_order(before_done, latest_context, deadline)
+        # Committed together with the new customer session
+        await save_conversation(session, base_id, before_done, crew_result, commit=False)
+
+    await new_customer_session(session)
+
+    return {"order_details": "", "sizes": "", "toppings": ""}
 
 
 @conversation_router.post(
@@ -229,99 +503,84 @@ async def get_latest_conversation_id(session: AsyncSession) -> Optional[str]:
     status_code=status.HTTP_201_CREATED
 )
 async def parse_request(
+    request: Request,
     request_body: RequestBody,
     session: AsyncSession = Depends(get_db)
 ):
     """Process a customer order and store it in the Conversation table"""
     transcription = request_body.text.strip()
+    deadline = request_deadline(request)
 
 
     try:
         # Handle 'done' case
         if "done" in transcription.lower():
-            before_done = transcription.lower().split('done')[0].strip()
-           
-            if before_done:
-                latest_conv_id = await get_latest_conversation_id(session)
-                if latest_conv_id:
-                    base_id = latest_conv_id.split('_')[0]
-                    latest_context = await get_latest_order_context(session, base_id)
-                    version = await get_conversation_version(session, base_id)
-
-
-                    crew_result = await process_order(before_done, latest_context)
-                    #filtered_crew_result = {k: v for k, v in crew_result.items() if k != 'answer'}
-                    final_conversation = Conversation(
-                        chunk=before_done,
-                        context=json.dumps(crew_result),
-                        conversation_id=f"{base_id}_{version}",
-                        timestamp=datetime.now(timezone.utc)
-                    )
-                    session.add(final_conversation)
-                    await session.commit()
-           
-            new_base_id = await generate_unique_conversation_id(session)
-           
-            new_conversation = Conversation(
-                chunk="New customer session",
-                context="",
-                conversation_id=f"{new_base_id}_0",
-                timestamp=datetime.now(timezone.utc)
-            )
-            session.add(new_conversation)
-            await session.commit()
-           
-            return {"order_details": "", "sizes": "", "toppings": ""}
-
-
-        # For non-done cases
-        latest_conv_id = await get_latest_conversation_id(session)
-       
-        if not latest_conv_id:
-            base_id = await generate_unique_conversation_id(session)
-            version = 0
-            latest_context = " "
-        else:
-            result = await session.execute(
-                select(Conversation)
-                .where(Conversation.conversation_id == latest_conv_id)
-                .limit(1)
-            )
-            latest_conv = result.scalar()
-           
-            if latest_conv and latest_conv.chunk == "New customer session":
-                base_id = latest_conv_id.split('_')[0]
-                version = 1
-                latest_context = ""
-            else:
-                base_id = latest_conv_id.split('_')[0]
-                version = await get_conversation_version(session, base_id)
-                latest_context = await get_latest_order_context(session, base_id)
+            return await finish_order_session(session, transcription, deadline)
 
+        # For non-done cases, the session stays locked until the result is saved
+        base_id, latest_context = await lock_order_session(session)
 
         # Process order
-        result = await process_order(transcription, latest_context)
-        #filtered_result = {k: v for k, v in result.items() if k != 'answer'}
-
+        with STAGE_SECONDS.labels("process_order").time():
+            result = await process_order(transcription, latest_context, deadline)
 
         # Save to database
-        new_conversation = Conversation(
-            chunk=transcription,
-            context=json.dumps(result),
-            conversation_id=f"{base_id}_{version}",
-            timestamp=datetime.now(timezone.utc)
-        )
-        session.add(new_conversation)
-        await session.commit()
-
+        with STAGE_SECONDS.labels("save_conversation").time():
+            await save_conversation(session, base_id, transcription, result)
 
         return result
 
 
+    except HTTPException:
+        await session.rollback()
+        raise
     except Exception as e:
         await session.rollback()
         logger.error(f"Error processing order: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process order: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@conversation_router.post("/create_and_update/stream")
+async def parse_request_stream(request: Request, request_body: RequestBody):
+    """Same as create_and_update, but pushes partial order fields as Server-Sent Events.
+
+    Emits 'partial' events with the order fields that changed while the model is
+    still generating, then a single 'final' event (or 'error') once the chunk is
+    stored in the Conversation table.
+    """
+    transcription = request_body.text.strip()
+    return EventSourceResponse(stream_order_events(transcription, request_deadline(request)))
+
+
+async def stream_order_events(transcription: str, deadline: Optional[float] = None):
+    # The request scoped session from get_db is closed before a streaming body runs
+    async with AsyncSessionLocal() as session:
+        try:
+            if "done" in transcription.lower():
+                result = await finish_order_session(session, transcription, deadline)
+                yield {"event": "final", "data": json.dumps(result)}
+                return
+
+            base_id, latest_context = await lock_order_session(session)
+            result = await get_fast_order_result(transcription, latest_context)
+            if result is None:
+                try:
+                    async for event, data in stream_order_with_llm(transcription, latest_context, deadline):
+                        if event == "partial":
+                            yield {"event": "partial", "data": json.dumps(data)}
+                        else:
+                            result = data
+                except LLMUnavailable as e:
+                    # The final event replaces whatever partials were sent
+                    result = degraded_order(transcription, latest_context, str(e))
+
+            await save_conversation(session, base_id, transcription, result)
+            yield {"event": "final", "data": json.dumps(result)}
+
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"Error streaming order: {str(e)}")
+            yield {"event": "error", "data": json.dumps({"detail": f"Failed to process order: {str(e)}"})}
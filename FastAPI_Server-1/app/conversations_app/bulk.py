@@ -0,0 +1,166 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import AsyncIterator, Iterable, Optional
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy.future import select
+from app.utils.security import check_if_admin
+from app.settings import logger, AsyncSessionLocal, BULK_CONCURRENCY, BULK_MAX_CONCURRENCY
+from .models import Conversation
+from .schemas import BulkSession, BulkProcessRequest
+from .api import process_order
+
+# Runs many recorded sessions through process_order: sessions run concurrently,
+# the chunks of a session run in order (each one builds on the previous result)
+# and at most `concurrency` orders are processed at any time. Nothing is written
+# to the Conversation table.
+
+bulk_router = APIRouter()
+
+EMPTY_ORDER = {"order_details": "", "sizes": "", "toppings": ""}
+
+
+async def process_session(bulk_session: BulkSession, semaphore: asyncio.Semaphore) -> AsyncIterator[dict]:
+    """Results of the chunks of one session, in order"""
+    context = ""
+    for index, chunk in enumerate(bulk_session.chunks):
+        line = {"session": bulk_session.id, "index": index, "chunk": chunk}
+        transcription = chunk.strip()
+        # Same 'done' handling as create_and_update: the order is finished and the next chunk starts a new one
+        done = "done" in transcription.lower()
+        if done:
+            transcription = transcription.lower().split('done')[0].strip()
+
+        try:
+            result = None
+            if transcription:
+                async with semaphore:
+                    started = time.perf_counter()
+                    result = await process_order(transcription, context)
+                    line["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+                context = json.dumps(result)
+            if done:
+                result, context = EMPTY_ORDER, ""
+            line["result"] = result
+        except Exception as e:
+            # Keep going from the last good state, like the live endpoint would
+            logger.error(f"Error processing bulk chunk {bulk_session.id}[{index}]: {str(e)}")
+            line["error"] = str(e)
+        yield line
+
+
+async def process_sessions(sessions: Iterable[BulkSession], concurrency: int = BULK_CONCURRENCY) -> AsyncIterator[dict]:
+    """Results of all sessions as they complete, one dict per chunk"""
+    semaphore = asyncio.Semaphore(concurrency)
+    # Bounded so a slow reader pushes back on the workers instead of buffering everything
+    results: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 4)
+
+    async def run(bulk_session: BulkSession):
+        try:
+            async for line in process_session(bulk_session, semaphore):
+                await results.put(line)
+        except Exception as e:
+            logger.error(f"Error processing bulk session {bulk_session.id}: {str(e)}")
+        # Marks the session as finished
+        await results.put(None)
+
+    tasks = [asyncio.create_task(run(bulk_session)) for bulk_session in sessions]
+    remaining = len(tasks)
+
+    try:
+        while remaining:
+            line = await results.get()
+            if line is None:
+                remaining -= 1
+                continue
+            yield line
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def ndjson_lines(sessions: list[BulkSession], concurrency: int) -> AsyncIterator[str]:
+    async for line in process_sessions(sessions, concurrency):
+        yield json.dumps(line) + "\n"
+
+
+@bulk_router.post("/bulk_process", dependencies=[Depends(check_if_admin)])
+async def bulk_process(request_body: BulkProcessRequest):
+    """Process a batch of sessions, streaming one NDJSON line per chunk as it completes.
+
+    Lines are {"session", "index", "chunk", "result", "latency_ms"} or {"session", "index", "chunk", "error"};
+    lines of different sessions interleave, use "index" to order a session's chunks.
+    """
+    concurrency = min(request_body.concurrency or BULK_CONCURRENCY, BULK_MAX_CONCURRENCY)
+    return StreamingResponse(
+        ndjson_lines(request_body.sessions, concurrency),
+        media_type="application/x-ndjson"
+    )
+
+
+#################################### CLI #####################################
+def split_conversation_id(conversation_id: str) -> Optional[tuple[str, int]]:
+    """'<base id>_<version>' as (base id, version), None for other ids"""
+    base_id, _, version = conversation_id.rpartition("_")
+    if not base_id or not version.isdigit():
+        return None
+    return base_id, int(version)
+
+
+async def load_sessions_from_db(limit: Optional[int] = None) -> list[BulkSession]:
+    """Historical sessions rebuilt from the chunks in the Conversation table"""
+    sessions: dict[str, list[tuple[int, str]]] = {}
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(
+            select(Conversation.conversation_id, Conversation.chunk)
+            .where(Conversation.chunk.is_not(None))
+            .execution_options(yield_per=1000)
+        )
+        async for conversation_id, chunk in result:
+            parts = split_conversation_id(conversation_id)
+            # Version 0 is the 'New customer session' marker row
+            if parts is None or parts[1] == 0:
+                continue
+            sessions.setdefault(parts[0], []).append((parts[1], chunk))
+
+    bulk_sessions = [
+        BulkSession(id=base_id, chunks=[chunk for _, chunk in sorted(chunks)])
+        for base_id, chunks in sessions.items()
+    ]
+    return bulk_sessions[:limit] if limit else bulk_sessions
+
+
+def load_sessions_from_file(path: str) -> list[BulkSession]:
+    """One session per line: {"id": "...", "chunks": ["...", ...]}"""
+    with open(path, encoding="utf-8") as file:
+        return [BulkSession.model_validate_json(line) for line in file if line.strip()]
+
+
+async def main(args: argparse.Namespace):
+    if args.input:
+        sessions = load_sessions_from_file(args.input)
+    else:
+        sessions = await load_sessions_from_db(args.limit)
+    logger.info(f"Bulk processing {len(sessions)} sessions with concurrency {args.concurrency}")
+
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        async for line in process_sessions(sessions, args.concurrency):
+            output.write(json.dumps(line) + "\n")
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run recorded sessions through the order pipeline and write NDJSON results"
+    )
+    parser.add_argument("input", nargs="?", help="NDJSON file of sessions; defaults to the sessions in the Conversation table")
+    parser.add_argument("-o", "--output", help="Output file, stdout by default")
+    parser.add_argument("-c", "--concurrency", type=int, default=BULK_CONCURRENCY)
+    parser.add_argument("--limit", type=int, help="Only process the first LIMIT sessions from the database")
+    asyncio.run(main(parser.parse_args()))
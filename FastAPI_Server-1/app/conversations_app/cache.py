@@ -0,0 +1,97 @@
+import re
+import json
+import time
+import hashlib
+from typing import Optional
+import redis
+from app.settings import logger, ORDER_CACHE_TTL, ORDER_CACHE_MAX_ENTRIES
+from app.utils.redis_pool import get_redis_client
+from .menu import MENU_VERSION
+from .prompt import PROMPT_VERSION
+
+# Response cache for process_order. Keys are a hash of the normalized chunk, the
+# previous order state and the menu and prompt versions, so a menu or prompt
+# change never serves stale orders. A sorted set of last access times bounds the cache to
+# ORDER_CACHE_MAX_ENTRIES with LRU eviction, independent of the Redis maxmemory
+# policy (the same Redis also holds Celery queues and verification tokens).
+
+CACHE_PREFIX = "order_cache:"
+LRU_INDEX_KEY = "order_cache_meta:lru"
+HITS_KEY = "order_cache_meta:hits"
+MISSES_KEY = "order_cache_meta:misses"
+
+
+def normalize_transcription(transcription: str) -> str:
+    text = " ".join(transcription.lower().split())
+    return re.sub(r"[\s.,!]+$", "", text)
+
+
+def cache_key(transcription: str, previous_output: Optional[str]) -> str:
+    payload = json.dumps([
+        normalize_transcription(transcription),
+        (previous_output or "").strip(),
+        MENU_VERSION,
+        PROMPT_VERSION,
+    ])
+    return CACHE_PREFIX + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def get_cached_order(transcription: str, previous_output: Optional[str]) -> Optional[dict]:
+    """Return the cached result for this chunk and order state, if any"""
+    key = cache_key(transcription, previous_output)
+    redis_client = get_redis_client()
+    try:
+        cached = await redis_client.get(key)
+        if cached is None:
+            await redis_client.incr(MISSES_KEY)
+            return None
+
+        async with redis_client.pipeline() as pipe:
+            pipe.zadd(LRU_INDEX_KEY, {key: time.time()})
+            pipe.expire(key, ORDER_CACHE_TTL)
+            pipe.incr(HITS_KEY)
+            await pipe.execute()
+        return json.loads(cached)
+    except (redis.RedisError, ValueError) as e:
+        # The cache is an optimisation, never fail an order because of it
+        logger.warning(f"Order cache lookup failed: {str(e)}")
+        return None
+
+
+async def cache_order(transcription: str, previous_output: Optional[str], result: dict):
+    """Store a process_order result and evict the least recently used entries"""
+    key = cache_key(transcription, previous_output)
+    now = time.time()
+    redis_client = get_redis_client()
+    try:
+        async with redis_client.pipeline() as pipe:
+            pipe.setex(key, ORDER_CACHE_TTL, json.dumps(result))
+            pipe.zadd(LRU_INDEX_KEY, {key: now})
+            # Entries that expired on their own don't need to stay in the index
+            pipe.zremrangebyscore(LRU_INDEX_KEY, 0, now - ORDER_CACHE_TTL)
+            pipe.zcard(LRU_INDEX_KEY)
+            size = (await pipe.execute())[-1]
+
+        if size > ORDER_CACHE_MAX_ENTRIES:
+            evicted = await redis_client.zpopmin(LRU_INDEX_KEY, size - ORDER_CACHE_MAX_ENTRIES)
+            if evicted:
+                await redis_client.delete(*[member for member, _ in evicted])
+    except redis.RedisError as e:
+        logger.warning(f"Order cache store failed: {str(e)}")
+
+
+async def get_cache_stats() -> dict:
+    async with get_redis_client().pipeline() as pipe:
+        pipe.get(HITS_KEY)
+        pipe.get(MISSES_KEY)
+        pipe.zcard(LRU_INDEX_KEY)
+        hits, misses, entries = await pipe.execute()
+    hits, misses = int(hits or 0), int(misses or 0)
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "entries": entries,
+        "menu_version": MENU_VERSION,
+        "prompt_version": PROMPT_VERSION,
+    }
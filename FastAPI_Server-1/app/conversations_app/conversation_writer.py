@@ -0,0 +1,279 @@
+import os
+import glob
+import json
+import uuid
+import fcntl
+import asyncio
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import event, update
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+from app.settings import (
+    logger,
+    AsyncSessionLocal,
+    CONVERSATION_BATCH_SIZE,
+    CONVERSATION_FLUSH_INTERVAL,
+    CONVERSATION_SPOOL_DIR,
+)
+from app.utils.metrics import STAGE_SECONDS, CONVERSATION_BACKLOG, CONVERSATION_BATCH_ROWS
+from .models import Conversation, OrderSession
+
+# Write-behind for Conversation rows. Requests only commit the order session
+# pointer (the next chunk needs it), the row itself is queued here and inserted
+# in multi-row batches by a background task started in the app lifespan.
+#
+# The rows of a transaction are appended to a spool file of this process before
+# it commits, and queued once it has. Rows of a transaction that rolled back
+# after all are marked as such in the spool. The spool is emptied whenever
+# everything spooled so far is in the database. After a crash the next start
+# inserts what is left in the spool files of dead processes (a live process
+# holds a lock on its own, every process starts a new one). conversation_id is
+# unique, so rows that made it in before the crash are skipped.
+#
+# Where the writer isn't running (scripts, the CLI) the rows are inserted in
+# the transaction itself.
+#
+# WebSocket connections own their order session and write their rows outside
+# of any transaction (write_conversations). Those rows are ahead of the session
+# pointer, which is moved to them when they are inserted.
+
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 30
+
+
+def pending_conversations(session) -> list[dict]:
+    """Rows to queue once the transaction of this session commits"""
+    return session.info.setdefault("pending_conversations", [])
+
+
+@event.listens_for(Session, "before_commit")
+def _spool_conversations(session):
+    rows = session.info.pop("pending_conversations", None)
+    if not rows:
+        return
+    if not conversation_writer.running:
+        session.execute(insert_statement(rows))
+        return
+    conversation_writer.spool(rows)
+    session.info["spooled_conversations"] = rows
+
+
+@event.listens_for(Session, "after_commit")
+def _queue_committed_conversations(session):
+    rows = session.info.pop("spooled_conversations", None)
+    if rows:
+        conversation_writer.submit(rows)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_rolled_back_conversations(session, previous_transaction):
+    session.info.pop("pending_conversations", None)
+    rows = session.info.pop("spooled_conversations", None)
+    if rows:
+        # The commit failed after the rows were spooled
+        conversation_writer.discard(rows)
+
+
+def _to_json(row: dict) -> str:
+    return json.dumps({**row, "timestamp": row["timestamp"].isoformat()})
+
+
+def read_spool(spool) -> list[dict]:
+    """The rows of a spool file, without the ones marked as rolled back"""
+    rows = {}
+    for number, line in enumerate(spool, 1):
+        # NULs are what a truncate without seek left before the next rows
+        line = line.strip().lstrip("\x00")
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            # The last line of a process that died while writing it
+            logger.warning(f"Skipping unreadable line {number} of {getattr(spool, 'name', 'the spool')}")
+            continue
+        if "rolled_back" in entry:
+            for conversation_id in entry["rolled_back"]:
+                rows.pop(conversation_id, None)
+            continue
+        entry["timestamp"] = datetime.fromisoformat(entry["timestamp"])
+        rows[entry["conversation_id"]] = entry
+    return list(rows.values())
+
+
+def insert_statement(rows: list[dict]):
+    """One multi-row INSERT, rows already in the table are skipped"""
+    return insert(Conversation).values(rows).on_conflict_do_nothing(index_elements=["conversation_id"])
+
+
+def advance_statements(rows: list[dict]) -> list:
+    """UPDATEs moving the pointer of each order session to its latest row, unless
+    it is there already (rows versioned by record_conversation)"""
+    latest = {}
+    for row in rows:
+        base_id, version = row["conversation_id"].rsplit("_", 1)
+        if base_id not in latest or int(version) > latest[base_id][0]:
+            latest[base_id] = (int(version), row)
+    return [
+        update(OrderSession)
+        .where(OrderSession.id == base_id, OrderSession.next_version <= version)
+        .values(
+            next_version=version + 1,
+            latest_conversation_id=row["conversation_id"],
+            latest_context=row["context"],
+            updated_at=row["timestamp"]
+        )
+        for base_id, (version, row) in latest.items()
+    ]
+
+
+async def insert_conversations(rows: list[dict]):
+    with STAGE_SECONDS.labels("conversation_flush").time():
+        async with AsyncSessionLocal() as session:
+            await session.execute(insert_statement(rows))
+            for statement in advance_statements(rows):
+                await session.execute(statement)
+            await session.commit()
+    CONVERSATION_BATCH_ROWS.observe(len(rows))
+
+
+async def write_conversations(rows: list[dict]):
+    """Store rows versioned outside of a transaction: spooled and queued, or
+    inserted right away where the writer isn't running"""
+    if not conversation_writer.running:
+        await insert_conversations(rows)
+        return
+    conversation_writer.spool(rows)
+    conversation_writer.submit(rows)
+
+
+class ConversationWriter:
+    def __init__(self, spool_dir: str = CONVERSATION_SPOOL_DIR):
+        self.spool_dir = spool_dir
+        self._queue: asyncio.Queue[Optional[dict]] = asyncio.Queue()
+        self._spool = None
+        self._task: Optional[asyncio.Task] = None
+        # Rows spooled by transactions still committing
+        self._committing = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def spool(self, rows: list[dict]):
+        """Append the Conversation rows (chunk, context, conversation_id, timestamp) of
+        a transaction about to commit to the spool"""
+        self._spool.write("".join(_to_json(row) + "\n" for row in rows))
+        # Flushed to the OS right away, so a crash of the process loses nothing
+        self._spool.flush()
+        self._committing += len(rows)
+
+    def submit(self, rows: list[dict]):
+        """Queue the spooled rows of a committed transaction"""
+        self._committing -= len(rows)
+        if not self.running:
+            # Stopped during the commit, the rows are in the spool for the next start
+            return
+        for row in rows:
+            self._queue.put_nowait(row)
+        CONVERSATION_BACKLOG.set(self._queue.qsize())
+
+    def discard(self, rows: list[dict]):
+        """The spooled rows of a transaction that rolled back"""
+        self._committing -= len(rows)
+        if self._spool is not None:
+            self._spool.write(json.dumps({"rolled_back": [row["conversation_id"] for row in rows]}) + "\n")
+            self._spool.flush()
+
+    async def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # Never the file of an earlier process, pids repeat across container restarts
+        name = f"conversations-{os.getpid()}-{uuid.uuid4().hex}.jsonl"
+        self._spool = open(os.path.join(self.spool_dir, name), "x", encoding="utf-8")
+        fcntl.flock(self._spool, fcntl.LOCK_EX)
+        await self.recover()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10):
+        """Insert what is queued, anything left over stays in the spool for the next start"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Conversation writer stopped with {self._queue.qsize()} rows left in the spool")
+        self._task = None
+        self._spool.close()
+        if not self._committing and os.path.getsize(self._spool.name) == 0:
+            os.remove(self._spool.name)
+        self._spool = None
+
+    async def recover(self):
+        """Insert the rows left in the spool files of processes that are gone"""
+        own = os.path.abspath(self._spool.name) if self._spool else None
+        for path in glob.glob(os.path.join(self.spool_dir, "conversations-*.jsonl")):
+            if os.path.abspath(path) == own:
+                continue
+            rows = []
+            with open(path, encoding="utf-8", errors="replace") as spool:
+                try:
+                    fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # A running worker
+                try:
+                    rows = read_spool(spool)
+                    for start in range(0, len(rows), CONVERSATION_BATCH_SIZE):
+                        await insert_conversations(rows[start:start + CONVERSATION_BATCH_SIZE])
+                except Exception as e:
+                    # Kept for the next start, inserting a row twice is harmless
+                    logger.error(f"Failed to recover conversations from {path}: {str(e)}")
+                    continue
+                os.remove(path)
+            if rows:
+                logger.info(f"Recovered {len(rows)} conversations from {path}")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            rows = []
+            row = await self._queue.get()
+            deadline = loop.time() + CONVERSATION_FLUSH_INTERVAL
+            while row is not None:
+                rows.append(row)
+                if len(rows) >= CONVERSATION_BATCH_SIZE:
+                    break
+                try:
+                    row = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    try:
+                        row = await asyncio.wait_for(self._queue.get(), deadline - loop.time())
+                    except asyncio.TimeoutError:
+                        break
+            stopping = row is None
+            if rows:
+                await self._write(rows)
+
+    async def _write(self, rows: list[dict]):
+        delay = RETRY_DELAY
+        while True:
+            try:
+                await insert_conversations(rows)
+                break
+            except Exception as e:
+                # The rows stay queued in order (and spooled) until the database is back
+                logger.error(f"Failed to insert {len(rows)} conversations, retrying in {delay}s: {str(e)}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+        CONVERSATION_BACKLOG.set(self._queue.qsize())
+        if self._queue.empty() and not self._committing:
+            # Everything spooled so far is in the database. Back to the start too,
+            # truncate alone leaves the position where it was
+            self._spool.seek(0)
+            self._spool.truncate()
+
+
+conversation_writer = ConversationWriter()
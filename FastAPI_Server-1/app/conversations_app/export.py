@@ -0,0 +1,234 @@
+import io
+import sys
+import csv
+import json
+import asyncio
+import argparse
+from datetime import datetime
+from typing import AsyncIterator, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.future import select
+from app.utils.security import check_if_admin
+from app.settings import logger, AsyncSessionLocal, EXPORT_BATCH_ROWS
+from .models import Conversation
+from .api import ORDER_FIELDS
+
+# Exports the Conversation table for training data review and model evaluation.
+# Rows are read from a server-side cursor EXPORT_BATCH_ROWS at a time, and each
+# batch is written out before the next one is fetched, so memory stays the same
+# for a thousand rows or ten million. Over HTTP the next batch is only fetched
+# once the client has taken the previous one.
+#
+#   python -m app.conversations_app.export -f parquet -o conversations.parquet --since 2026-01-01
+#
+# The order stored as JSON in `context` is exported as one column per field.
+# Parquet is written with pyarrow.
+
+export_router = APIRouter()
+
+ExportFormat = Literal["ndjson", "csv", "parquet"]
+ReviewStatus = Literal["unreviewed", "initial", "final"]
+
+CONVERSATION_COLUMNS = (
+    "id", "conversation_id", "timestamp", "chunk", "inferred_command", "ideal_inference",
+    "initial_review_by", "final_review_by",
+)
+# Context that isn't an order in JSON is kept as is, in context_raw
+COLUMNS = CONVERSATION_COLUMNS + ORDER_FIELDS + ("context_raw",)
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def export_query(since: Optional[datetime] = None, until: Optional[datetime] = None, review: Optional[ReviewStatus] = None):
+    query = select(*(getattr(Conversation, column) for column in CONVERSATION_COLUMNS), Conversation.context)
+    if since is not None:
+        query = query.where(Conversation.timestamp >= since)
+    if until is not None:
+        query = query.where(Conversation.timestamp < until)
+    if review == "unreviewed":
+        query = query.where(Conversation.initial_review_by.is_(None), Conversation.final_review_by.is_(None))
+    elif review == "initial":
+        query = query.where(Conversation.initial_review_by.is_not(None), Conversation.final_review_by.is_(None))
+    elif review == "final":
+        query = query.where(Conversation.final_review_by.is_not(None))
+    return query.order_by(Conversation.timestamp, Conversation.id)
+
+
+def export_row(row) -> dict:
+    """A conversation with the order in its context as columns"""
+    values = dict(zip(CONVERSATION_COLUMNS, row))
+    context = row[-1]
+    try:
+        order = json.loads(context) if context else {}
+    except ValueError:
+        order = None
+    if isinstance(order, dict):
+        values.update({field: _as_text(order.get(field)) for field in ORDER_FIELDS})
+        values["context_raw"] = None
+    else:
+        values.update(dict.fromkeys(ORDER_FIELDS))
+        values["context_raw"] = context
+    return values
+
+
+def _as_text(value) -> Optional[str]:
+    if value is None or isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+class NdjsonWriter:
+    def write(self, rows: list[dict]) -> bytes:
+        return "".join(json.dumps(row, default=datetime.isoformat) + "\n" for row in rows).encode()
+
+    def close(self) -> bytes:
+        return b""
+
+
+class CsvWriter:
+    def __init__(self):
+        self._header = True
+
+    def write(self, rows: list[dict]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+        if self._header:
+            writer.writeheader()
+            self._header = False
+        writer.writerows(rows)
+        return buffer.getvalue().encode()
+
+    def close(self) -> bytes:
+        # An export without rows still has its header
+        return self.write([]) if self._header else b""
+
+
+class _Chunks(io.RawIOBase):
+    """Write-only file keeping what was written until it's taken"""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ParquetWriter:
+    """One row group per batch, the footer is written on close"""
+
+    def __init__(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema(
+            [("id", pa.int64()), ("conversation_id", pa.string()), ("timestamp", pa.timestamp("us", tz="UTC"))]
+            + [(column, pa.string()) for column in ("chunk", "inferred_command", "ideal_inference")]
+            + [("initial_review_by", pa.int64()), ("final_review_by", pa.int64())]
+            + [(column, pa.string()) for column in ORDER_FIELDS + ("context_raw",)]
+        )
+        self._file = _Chunks()
+        self._writer = pq.ParquetWriter(self._file, self._schema, compression="zstd")
+
+    def write(self, rows: list[dict]) -> bytes:
+        self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+        return self._file.take()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._file.take()
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+WRITERS = {"ndjson": NdjsonWriter, "csv": CsvWriter, "parquet": ParquetWriter}
+
+
+async def export_conversations(
+    fmt: ExportFormat,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    review: Optional[ReviewStatus] = None,
+    batch_rows: int = EXPORT_BATCH_ROWS,
+) -> AsyncIterator[bytes]:
+    """The export in `fmt`, a chunk of bytes per batch of rows"""
+    writer = WRITERS[fmt]()
+    exported = 0
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(
+            export_query(since, until, review).execution_options(yield_per=batch_rows)
+        )
+        async for rows in result.partitions():
+            chunk = writer.write([export_row(row) for row in rows])
+            exported += len(rows)
+            if chunk:
+                yield chunk
+    yield writer.close()
+    logger.info(f"Exported {exported} conversations as {fmt}")
+
+
+@export_router.get("/export", dependencies=[Depends(check_if_admin)])
+async def export(
+    format: ExportFormat = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    review: Optional[ReviewStatus] = None,
+):
+    """Stream the conversations from `since` to `until`, as NDJSON, CSV or Parquet.
+
+    review: 'unreviewed' (no review yet), 'initial' (only the initial review) or 'final'.
+    """
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Parquet export is not available, pyarrow is not installed.")
+    return StreamingResponse(
+        export_conversations(format, since, until, review),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="conversations.{format}"'}
+    )
+
+
+#################################### CLI #####################################
+async def main(args: argparse.Namespace):
+    if args.format == "parquet" and not parquet_available():
+        raise SystemExit("Parquet export needs pyarrow: pip install pyarrow")
+
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        async for chunk in export_conversations(args.format, args.since, args.until, args.review, args.batch_rows):
+            output.write(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the Conversation table as NDJSON, CSV or Parquet")
+    parser.add_argument("-f", "--format", choices=WRITERS, default="ndjson")
+    parser.add_argument("-o", "--output", help="Output file, stdout by default")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="Conversations from this time on (ISO 8601)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="Conversations before this time (ISO 8601)")
+    parser.add_argument("--review", choices=("unreviewed", "initial", "final"), help="Only conversations in this review stage")
+    parser.add_argument("--batch-rows", type=int, default=EXPORT_BATCH_ROWS, help="Rows fetched and written at once")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,228 @@
+import re
+import random
+import asyncio
+from typing import Optional
+import redis
+from better_profanity import profanity
+from wonderwords import RandomWord
+from sqlalchemy.future import select
+from app.settings import (
+    logger,
+    AsyncSessionLocal,
+    CONVERSATION_ID_POOL_SIZE,
+    CONVERSATION_ID_POOL_LOW_WATERMARK,
+    CONVERSATION_ID_REFILL_INTERVAL,
+    CONVERSATION_ID_BLOOM_BITS,
+    CONVERSATION_ID_BLOOM_HASHES,
+)
+from app.utils.redis_pool import get_redis_client
+from .models import OrderSession
+
+# Pool of ready-to-use conversation ids kept in Redis. The wordlist is filtered
+# for profanity once, a background task keeps the pool topped up and every id
+# ever handed out is remembered in a Bloom filter, so allocating an id is a
+# single SPOP with no database probe. Once the plain words run out the refill
+# switches to words with a numeric suffix ("apple42"; no '_', which separates
+# versions).
+#
+# The Bloom filter is a plain Redis bitmap (SETBIT/GETBIT from Lua, no Redis
+# module needed) of a fixed CONVERSATION_ID_BLOOM_BITS bits, however many ids
+# are handed out. It never forgets an id; a false positive only makes the
+# allocator skip an id that was in fact free.
+
+POOL_KEY = "conversation_ids:pool"
+USED_KEY = "conversation_ids:used_bloom"
+SEEDED_KEY = "conversation_ids:used_bloom_seeded"
+# The set of used ids the Bloom filter replaces, dropped once the filter is seeded
+LEGACY_USED_KEY = "conversation_ids:used"
+SUFFIX_DIGITS = (0, 2, 3, 4, 6)
+SEED_BATCH_SIZE = 1000
+
+# KEYS[1] is the bitmap, ARGV[1] and ARGV[2] its size and number of hashes.
+# Bit positions come from double hashing the SHA1 of the id.
+BLOOM_LUA = """
+local bits = tonumber(ARGV[1])
+local hashes = tonumber(ARGV[2])
+local function positions(id)
+    local digest = redis.sha1hex(id)
+    local h1 = tonumber(string.sub(digest, 1, 8), 16)
+    local h2 = tonumber(string.sub(digest, 9, 16), 16)
+    local result = {}
+    for i = 0, hashes - 1 do
+        result[i + 1] = (h1 + i * h2) % bits
+    end
+    return result
+end
+-- 1 when the id was not in the filter yet
+local function bloom_add(id)
+    local added = 0
+    for _, position in ipairs(positions(id)) do
+        if redis.call('SETBIT', KEYS[1], position, 1) == 0 then
+            added = 1
+        end
+    end
+    return added
+end
+local function bloom_contains(id)
+    for _, position in ipairs(positions(id)) do
+        if redis.call('GETBIT', KEYS[1], position) == 0 then
+            return 0
+        end
+    end
+    return 1
+end
+"""
+
+# Pop ids until one that was never handed out (the fallback path below can
+# race with the refill), and mark it used in the same round trip. KEYS[2] is the pool.
+ALLOCATE_SCRIPT = BLOOM_LUA + """
+for _ = 1, 10 do
+    local id = redis.call('SPOP', KEYS[2])
+    if not id then
+        return nil
+    end
+    if bloom_add(id) == 1 then
+        return id
+    end
+end
+return nil
+"""
+
+# ARGV[3...] ids, returns 1 for each one that was not in the filter yet
+ADD_SCRIPT = BLOOM_LUA + """
+local added = {}
+for i = 3, #ARGV do
+    added[i - 2] = bloom_add(ARGV[i])
+end
+return added
+"""
+
+# ARGV[3...] ids, returns 1 for each one that may have been handed out
+CONTAINS_SCRIPT = BLOOM_LUA + """
+local found = {}
+for i = 3, #ARGV do
+    found[i - 2] = bloom_contains(ARGV[i])
+end
+return found
+"""
+
+BLOOM_ARGS = (CONVERSATION_ID_BLOOM_BITS, CONVERSATION_ID_BLOOM_HASHES)
+
+
+async def mark_used(redis_client, ids: list[str]) -> list[bool]:
+    """Adds the ids to the used ids, True for the ones that weren't there yet"""
+    added = await redis_client.eval(ADD_SCRIPT, 1, USED_KEY, *BLOOM_ARGS, *ids)
+    return [bool(flag) for flag in added]
+
+
+async def maybe_used(redis_client, ids: list[str]) -> list[bool]:
+    found = await redis_client.eval(CONTAINS_SCRIPT, 1, USED_KEY, *BLOOM_ARGS, *ids)
+    return [bool(flag) for flag in found]
+
+
+_words: list[str] = []
+_refill_needed = asyncio.Event()
+
+
+def load_words() -> list[str]:
+    """Every profanity-free word RandomWord().word() could return"""
+    words = {word for word in RandomWord().filter() if re.fullmatch(r"[a-z]+", word)}
+    return sorted(word for word in words if not profanity.contains_profanity(word))
+
+
+def random_word() -> str:
+    if _words:
+        return random.choice(_words)
+    # Wordlist still loading
+    while True:
+        word = RandomWord().word()
+        if re.fullmatch(r"[a-z]+", word) and not profanity.contains_profanity(word):
+            return word
+
+
+def _candidates(count: int, digits: int) -> list[str]:
+    if digits == 0:
+        return random.sample(_words, min(count, len(_words)))
+    return [f"{random.choice(_words)}{random.randrange(10 ** digits)}" for _ in range(count)]
+
+
+async def refill_pool() -> int:
+    """Top the pool up to CONVERSATION_ID_POOL_SIZE, returns the number of ids added"""
+    redis_client = get_redis_client()
+    added = 0
+    for digits in SUFFIX_DIGITS:
+        # A few rounds per scheme before deciding the scheme is exhausted
+        for _ in range(3):
+            missing = CONVERSATION_ID_POOL_SIZE - await redis_client.scard(POOL_KEY)
+            if missing <= 0:
+                return added
+            candidates = list(set(_candidates(missing * 2, digits)))
+            used = await maybe_used(redis_client, candidates)
+            fresh = [candidate for candidate, is_used in zip(candidates, used) if not is_used][:missing]
+            if fresh:
+                added += await redis_client.sadd(POOL_KEY, *fresh)
+    return added
+
+
+async def allocate_conversation_id() -> Optional[str]:
+    """A never used, profanity-free id, or None when Redis can't be reached"""
+    redis_client = get_redis_client()
+    try:
+        # Pops the id and reads the pool size in one round trip
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.eval(ALLOCATE_SCRIPT, 2, USED_KEY, POOL_KEY, *BLOOM_ARGS)
+            pipe.scard(POOL_KEY)
+            conversation_id, pool_size = await pipe.execute()
+        if pool_size < CONVERSATION_ID_POOL_LOW_WATERMARK:
+            _refill_needed.set()
+        if conversation_id is not None:
+            return conversation_id.decode("utf-8")
+
+        # The pool ran dry before the refill caught up
+        for _ in range(10):
+            candidate = f"{random_word()}{random.randrange(10 ** 4)}"
+            if (await mark_used(redis_client, [candidate]))[0]:
+                return candidate
+    except redis.RedisError as e:
+        logger.warning(f"Conversation id pool unavailable: {str(e)}")
+    return None
+
+
+async def seed_used_ids():
+    """Load the ids of existing sessions into the used ids, once per Redis instance"""
+    redis_client = get_redis_client()
+    if not await redis_client.set(SEEDED_KEY, 1, nx=True):
+        return
+    try:
+        async with AsyncSessionLocal() as session:
+            result = await session.stream_scalars(
+                select(OrderSession.id).execution_options(yield_per=SEED_BATCH_SIZE)
+            )
+            async for batch in result.partitions(SEED_BATCH_SIZE):
+                await mark_used(redis_client, list(batch))
+    except Exception:
+        await redis_client.delete(SEEDED_KEY)
+        raise
+    await redis_client.unlink(LEGACY_USED_KEY)
+
+
+async def run_id_pool():
+    """Background task: filter the wordlist, seed the used ids and keep the pool filled"""
+    global _words
+    _words = await asyncio.to_thread(load_words)
+    logger.info(f"Conversation id wordlist loaded: {len(_words)} words")
+
+    while True:
+        try:
+            await seed_used_ids()
+            if await get_redis_client().scard(POOL_KEY) < CONVERSATION_ID_POOL_LOW_WATERMARK:
+                added = await refill_pool()
+                logger.info(f"Conversation id pool refilled with {added} ids")
+        except Exception as e:
+            logger.error(f"Error refilling conversation id pool: {str(e)}")
+
+        _refill_needed.clear()
+        try:
+            await asyncio.wait_for(_refill_needed.wait(), timeout=CONVERSATION_ID_REFILL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,178 @@
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+import openai
+from fastapi import Request
+from app.settings import (
+    logger,
+    LLM_WORKER_MAX_CONCURRENCY,
+    LLM_WORKER_MAX_QUEUE,
+    LLM_REQUEST_TIMEOUT,
+    LLM_MAX_REQUEST_TIMEOUT,
+    LLM_BREAKER_WINDOW,
+    LLM_WORKER_BREAKER_MIN_REQUESTS,
+    LLM_BREAKER_ERROR_RATE,
+    LLM_BREAKER_COOLDOWN,
+)
+from app.utils.metrics import LLM_IN_FLIGHT, LLM_QUEUE_DEPTH, LLM_REJECTED, LLM_BREAKER_OPEN
+
+# Admission control in front of every OpenAI call. At most LLM_MAX_CONCURRENCY
+# calls run at once, at most LLM_MAX_QUEUE wait for a slot (more fail at once),
+# every call has to finish before the deadline of the request it serves, and a
+# circuit breaker stops calling OpenAI for a while when most recent calls
+# failed. Callers handle LLMUnavailable by answering in degraded mode.
+#
+# The gateway lives in the process: each uvicorn worker enforces its share of
+# the limits (LLM_WORKER_*, the limits divided by WEB_CONCURRENCY) and opens
+# its breaker on the calls it made itself. Workers get an even share of the
+# requests, so together they stay within the limits without a round trip to
+# Redis on every call.
+
+DEADLINE_HEADER = "X-Request-Timeout"
+
+
+class LLMUnavailable(Exception):
+    """The LLM can't answer in time, the caller should degrade instead of failing"""
+
+
+def request_deadline(request: Optional[Request] = None) -> float:
+    """Deadline (time.monotonic) for the LLM work of a request, from its X-Request-Timeout header in seconds"""
+    timeout = LLM_REQUEST_TIMEOUT
+    if request is not None and request.headers.get(DEADLINE_HEADER):
+        try:
+            timeout = min(float(request.headers[DEADLINE_HEADER]), LLM_MAX_REQUEST_TIMEOUT)
+        except ValueError:
+            pass
+    return time.monotonic() + timeout
+
+
+class CircuitBreaker:
+    """Opens when the error rate over the last LLM_BREAKER_WINDOW seconds is too high.
+
+    After LLM_BREAKER_COOLDOWN seconds a single probe call is let through, its
+    outcome closes the breaker again or restarts the cooldown.
+    """
+
+    def __init__(self):
+        self._outcomes: deque[tuple[float, bool]] = deque()
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self._opened_at < LLM_BREAKER_COOLDOWN:
+            return False
+        self._probing = True
+        return True
+
+    def record(self, success: bool):
+        now = time.monotonic()
+        if self._probing:
+            self._probing = False
+            if success:
+                logger.info("LLM circuit breaker closed")
+                self._opened_at = None
+                self._outcomes.clear()
+            else:
+                self._opened_at = now
+            LLM_BREAKER_OPEN.set(int(self.is_open))
+            return
+
+        self._outcomes.append((now, success))
+        while self._outcomes and now - self._outcomes[0][0] > LLM_BREAKER_WINDOW:
+            self._outcomes.popleft()
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        if (self._opened_at is None and len(self._outcomes) >= LLM_WORKER_BREAKER_MIN_REQUESTS
+                and failures / len(self._outcomes) >= LLM_BREAKER_ERROR_RATE):
+            logger.error(f"LLM circuit breaker opened: {failures}/{len(self._outcomes)} recent calls failed")
+            self._opened_at = now
+            LLM_BREAKER_OPEN.set(1)
+
+    def abandon(self):
+        """The call ended without an outcome (cancelled), let another probe through"""
+        self._probing = False
+
+
+class LLMGateway:
+    """The gateway of this worker, see above"""
+
+    def __init__(self, max_concurrency: int = LLM_WORKER_MAX_CONCURRENCY, max_queue: int = LLM_WORKER_MAX_QUEUE):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._max_queue = max_queue
+        self._waiting = 0
+        self.breaker = CircuitBreaker()
+
+    def _reject(self, reason: str):
+        LLM_REJECTED.labels(reason).inc()
+        raise LLMUnavailable(reason)
+
+    @asynccontextmanager
+    async def admit(self, deadline: Optional[float] = None):
+        """Hold an LLM slot for the body and record its outcome for the breaker.
+
+        Yields the seconds left before the deadline. The body enforces it (the
+        gateway can't cancel across the yields of a streaming generator), a
+        TimeoutError or OpenAI timeout from the body becomes LLMUnavailable.
+        """
+        deadline = deadline or request_deadline()
+        if not self.breaker.allow():
+            self._reject("circuit_open")
+        if not self._semaphore.locked():
+            # A free slot is taken without suspending
+            await self._semaphore.acquire()
+        else:
+            if self._waiting >= self._max_queue:
+                self.breaker.abandon()
+                self._reject("queue_full")
+
+            self._waiting += 1
+            LLM_QUEUE_DEPTH.set(self._waiting)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                self.breaker.abandon()
+                self._reject("deadline_queued")
+            except BaseException:
+                # Cancelled while queued (a superseded speculation), a half-open
+                # probe would otherwise keep the breaker from ever closing
+                self.breaker.abandon()
+                raise
+            finally:
+                self._waiting -= 1
+                LLM_QUEUE_DEPTH.set(self._waiting)
+
+        LLM_IN_FLIGHT.inc()
+        recorded = False
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.breaker.abandon()
+                recorded = True
+                self._reject("deadline_queued")
+            try:
+                yield remaining
+            except (TimeoutError, openai.APITimeoutError):
+                self.breaker.record(False)
+                recorded = True
+                self._reject("deadline")
+            except Exception:
+                self.breaker.record(False)
+                recorded = True
+                raise
+            self.breaker.record(True)
+            recorded = True
+        finally:
+            if not recorded:
+                self.breaker.abandon()
+            LLM_IN_FLIGHT.dec()
+            self._semaphore.release()
+
+
+llm_gateway = LLMGateway()
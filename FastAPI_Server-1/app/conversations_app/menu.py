@@ -0,0 +1,140 @@
+import os
+import json
+import hashlib
+import pandas as pd
+from dataclasses import dataclass
+from typing import Optional
+
+ONE_SIZE_OPTION = "One Size Option"
+NO_TOPPING_OPTION = "No Topping Option"
+UNSPECIFIED = "?"
+UNAVAILABLE = "!"
+
+
+@dataclass(frozen=True)
+class MenuItem:
+    name: str
+    sizes: tuple[str, ...]
+    toppings: tuple[str, ...]
+
+    @property
+    def has_one_size(self) -> bool:
+        return self.sizes == (ONE_SIZE_OPTION,)
+
+    @property
+    def has_no_toppings(self) -> bool:
+        return self.toppings == (NO_TOPPING_OPTION,)
+
+
+@dataclass
+class OrderLine:
+    item: str
+    size: str = UNSPECIFIED
+    topping: str = UNSPECIFIED
+
+
+def _split_options(value: str) -> tuple[str, ...]:
+    # menu.csv has stray spaces in some option lists ("Large, Medium, Small")
+    return tuple(option.strip() for option in str(value).split(",") if option.strip())
+
+
+def load_menu(path: str) -> dict[str, MenuItem]:
+    """Load menu.csv into a dict keyed by the canonical item name"""
+    df = pd.read_csv(path)
+    menu = {}
+    for _, row in df.iterrows():
+        name = str(row["Item"]).strip()
+        menu[name] = MenuItem(
+            name=name,
+            sizes=_split_options(row["Size Options"]),
+            toppings=_split_options(row["Topping Options"]),
+        )
+    return menu
+
+
+# Load menu once at module level
+MENU_PATH = os.path.join(os.path.dirname(__file__), 'menu.csv')
+MENU = load_menu(MENU_PATH)
+
+# Changes whenever menu.csv does, used to key anything derived from the menu
+with open(MENU_PATH, 'rb') as menu_file:
+    MENU_VERSION = hashlib.sha256(menu_file.read()).hexdigest()[:12]
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+# Case and whitespace insensitive lookups, with plain plurals ("Cokes", "Egg Sandwiches")
+MENU_INDEX = {normalize_name(name): item for name, item in MENU.items()}
+
+
+def lookup_item(name: str) -> Optional[MenuItem]:
+    key = normalize_name(name)
+    for candidate in (key, key[:-1] if key.endswith("s") else None, key[:-2] if key.endswith("es") else None):
+        if candidate and candidate in MENU_INDEX:
+            return MENU_INDEX[candidate]
+    return None
+
+
+def match_option(value: str, options: tuple[str, ...]) -> Optional[str]:
+    """Canonical spelling of value among options, ignoring case and whitespace"""
+    key = normalize_name(value)
+    for option in options:
+        if normalize_name(option) == key:
+            return option
+    return None
+
+
+######################### ORDER STRINGS #########################
+def _split_entries(value: str) -> list[tuple[int, str]]:
+    """Split an 'n x A, n x B' string into (n, value) pairs"""
+    entries = []
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        quantity, sep, rest = part.partition(" x ")
+        if not sep or not quantity.strip().isdigit():
+            raise ValueError(f"Malformed order entry: {part!r}")
+        entries.append((int(quantity.strip()), rest.strip()))
+    return entries
+
+
+def _expand(value: str) -> list[str]:
+    return [rest for quantity, rest in _split_entries(value) for _ in range(quantity)]
+
+
+def parse_order_state(previous_output: Optional[str]) -> list[OrderLine]:
+    """Turn the stored JSON context of the previous chunk back into order lines.
+
+    Raises ValueError when the context can't be read back unambiguously.
+    """
+    if not previous_output or not previous_output.strip():
+        return []
+    state = json.loads(previous_output)
+    if not isinstance(state, dict):
+        raise ValueError("Order state must be a JSON object")
+
+    items = _expand(state.get("order_details") or "")
+    sizes = _expand(state.get("sizes") or "")
+    toppings = _expand(state.get("toppings") or "")
+    if not (len(items) == len(sizes) == len(toppings)):
+        raise ValueError("Mismatched counts between order_details, sizes and toppings")
+
+    return [OrderLine(item, size, topping) for item, size, topping in zip(items, sizes, toppings)]
+
+
+def format_order(lines: list[OrderLine], answer: str = "") -> dict:
+    """Render order lines in the same string format the LLM is asked to produce,
+    identical lines grouped into one entry ("2 x Fries")"""
+    groups: dict[tuple[str, str, str], int] = {}
+    for line in lines:
+        key = (line.item, line.size, line.topping)
+        groups[key] = groups.get(key, 0) + 1
+    return {
+        "order_details": ", ".join(f"{count} x {item}" for (item, _, _), count in groups.items()),
+        "sizes": ", ".join(f"{count} x {size}" for (_, size, _), count in groups.items()),
+        "toppings": ", ".join(f"{count} x {topping}" for (_, _, topping), count in groups.items()),
+        "answer": answer,
+    }
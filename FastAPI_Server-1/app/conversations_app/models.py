@@ -1,5 +1,5 @@
 from sqlalchemy.orm import mapped_column, Mapped, relationship
-from sqlalchemy import Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Integer, String, Text, DateTime, ForeignKey, Index, text
 from app.settings import Base
 from datetime import datetime, timezone
 from app.users_app.models import UserModel
@@ -24,7 +24,59 @@ class Conversation(Base):
     ideal_inference: Mapped[str] = mapped_column(Text, nullable=True)
     initial_review_by: Mapped[int | None] = mapped_column(ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
     final_review_by: Mapped[int | None] = mapped_column(ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    # Reviewer the conversation is handed to, until the lease runs out
+    claimed_by: Mapped[int | None] = mapped_column(ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    claimed_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     # Relationships
     initial_reviewer = relationship("UserModel", foreign_keys=[initial_review_by])
-    final_reviewer = relationship("UserModel", foreign_keys=[final_review_by])
\ No newline at end of file
+    final_reviewer = relationship("UserModel", foreign_keys=[final_review_by])
+
+    __table_args__ = (
+        # Pages of the list endpoint, in timestamp order, optionally by reviewer
+        Index('ix_conversations_timestamp_id', 'timestamp', 'id'),
+        Index('ix_conversations_initial_review_by', 'initial_review_by', 'timestamp', 'id',
+              postgresql_where=text('initial_review_by IS NOT NULL')),
+        Index('ix_conversations_final_review_by', 'final_review_by', 'timestamp', 'id',
+              postgresql_where=text('final_review_by IS NOT NULL')),
+        # conversation_id LIKE '<base id>_%', which the unique index can't answer outside the C locale
+        Index('ix_conversations_conversation_id_prefix', 'conversation_id',
+              postgresql_ops={'conversation_id': 'varchar_pattern_ops'}),
+        # The review queues, only the rows still waiting for a review stage are indexed
+        Index('ix_conversations_awaiting_initial_review', 'timestamp', 'id',
+              postgresql_where=text('initial_review_by IS NULL')),
+        Index('ix_conversations_awaiting_final_review', 'timestamp', 'id',
+              postgresql_where=text('initial_review_by IS NOT NULL AND final_review_by IS NULL')),
+    )
+
+
+SESSION_ACTIVE = "active"
+SESSION_CLOSED = "closed"
+
+class OrderSession(Base):
+    """One customer session: the base of every conversation_id in it ('<id>_<version>')"""
+    __tablename__ = 'order_sessions'
+
+    id: Mapped[str] = mapped_column(String(100), primary_key=True)
+    next_version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    latest_conversation_id: Mapped[str | None] = mapped_column(String(100), nullable=True)
+    latest_context: Mapped[str] = mapped_column(Text, nullable=False, default="")
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default=SESSION_ACTIVE)
+    # WebSocket connection that holds the session, until the lease runs out
+    owner: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    owned_until: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        nullable=False
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        nullable=False
+    )
+
+    __table_args__ = (
+        # Only a handful of sessions are ever active, so this index stays tiny
+        Index('ix_order_sessions_active', 'updated_at', postgresql_where=text(f"status = '{SESSION_ACTIVE}'")),
+    )
\ No newline at end of file
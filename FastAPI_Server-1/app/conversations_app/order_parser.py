@@ -0,0 +1,318 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+from .menu import (
+    MENU,
+    MenuItem,
+    OrderLine,
+    ONE_SIZE_OPTION,
+    NO_TOPPING_OPTION,
+    UNSPECIFIED,
+    UNAVAILABLE,
+    parse_order_state,
+    format_order,
+)
+
+# Rule based fast-path for the simple utterances that make up most chunks
+# ("a large coke", "two fries with ketchup", "make it large", ...).
+# Anything the grammar doesn't fully understand is left to the LLM.
+
+
+@dataclass
+class LocalParse:
+    result: Optional[dict]
+    confidence: float
+
+
+class _LowConfidence(Exception):
+    pass
+
+
+QUANTITIES = {
+    "a": 1, "an": 1, "one": 1, "another": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+SIZES = {"large": "Large", "medium": "Medium", "small": "Small"}
+FILLER_WORDS = {
+    "i", "i'd", "id", "i'll", "ill", "i'm", "im", "we", "we'd", "we'll", "us", "me",
+    "want", "wanna", "would", "like", "can", "could", "may", "get", "have", "give", "gimme",
+    "need", "take", "let", "let's", "lets", "add", "and", "also", "plus", "the", "some",
+    "of", "for", "to", "just", "please", "order", "um", "umm", "uh", "uhh", "oh", "okay", "ok",
+    "yeah", "yes", "hi", "hello", "hey", "thanks", "thank", "you", "will", "size", "sized",
+}
+QUESTION_WORDS = {
+    "what", "what's", "whats", "which", "how", "why", "when", "where", "does", "do", "is", "are",
+    "menu", "available", "those", "them",
+}
+# Spoken variants that don't follow from the menu names themselves
+ITEM_ALIASES = {
+    "cheese burger": "Cheeseburger",
+    "cheese burgers": "Cheeseburger",
+    "fry": "Fries",
+    "coca cola": "Coke",
+    "chocolate shake": "Chocolate Milkshake",
+    "chocolate shakes": "Chocolate Milkshake",
+    "chicken rice": "Chicken and Rice",
+    "chicken with rice": "Chicken and Rice",
+}
+TOPPING_ALIASES = {
+    "mayonnaise": "Mayo",
+    "barbecue": "BBQ",
+    "barbeque": "BBQ",
+    "b b q": "BBQ",
+    "whip cream": "Whipped Cream",
+    "cream": "Whipped Cream",
+}
+CLEAR_PATTERN = re.compile(
+    r"^(?:clear|cancel|get rid of|remove|delete) (?:everything|all|it all|the whole order|the order)\b"
+    r"|^start over\b"
+)
+SCRATCH_PATTERN = re.compile(r"^(?:scratch|scrap|forget) that(?: just)?\b")
+# Removals and negations ("no coke", "take off the ketchup") would otherwise
+# read as the item being added, they are left to the LLM
+NEGATION_WORDS = {
+    "no", "not", "don't", "dont", "didn't", "didnt", "never", "none", "nothing", "without", "except",
+    "but", "instead", "rather", "remove", "delete", "drop", "cancel", "minus", "off", "hold", "skip",
+    "less", "fewer", "replace", "swap",
+}
+MAKE_IT_WORDS = {"it", "that", "this"}
+# "ketchup to the cheeseburger" names the item an earlier word applies to,
+# which the grammar would read as another item being added
+TARGET_WORDS = {"to", "on", "onto", "in"}
+TARGET_DETERMINERS = {"the", "my", "that", "this", "those", "these", "each", "every", "both", "all", "a", "an"}
+
+
+def _plurals(name: str) -> set[str]:
+    if name.endswith(("s", "sh", "ch", "x")):
+        return {name, name + "es"}
+    return {name, name + "s"}
+
+
+def _build_phrases() -> tuple[dict[tuple[str, ...], str], dict[tuple[str, ...], str]]:
+    items = {}
+    for name in MENU:
+        for phrase in _plurals(name.lower()):
+            items[tuple(phrase.split())] = name
+    for phrase, name in ITEM_ALIASES.items():
+        items[tuple(phrase.split())] = name
+
+    toppings = {}
+    for menu_item in MENU.values():
+        for topping in menu_item.toppings:
+            if topping != NO_TOPPING_OPTION:
+                toppings[tuple(topping.lower().split())] = topping
+    for phrase, name in TOPPING_ALIASES.items():
+        toppings[tuple(phrase.split())] = name
+    return items, toppings
+
+
+ITEM_PHRASES, TOPPING_PHRASES = _build_phrases()
+_MAX_PHRASE = max(len(phrase) for phrase in [*ITEM_PHRASES, *TOPPING_PHRASES])
+
+
+def _normalize(text: str) -> str:
+    text = text.lower().replace("’", "'").replace("-", " ")
+    text = re.sub(r"[^a-z0-9' ]+", " ", text)
+    return " ".join(text.split())
+
+
+def _match(tokens: list[str], pos: int, phrases: dict) -> tuple[Optional[str], int]:
+    """Longest phrase starting at pos"""
+    for length in range(min(_MAX_PHRASE, len(tokens) - pos), 0, -1):
+        name = phrases.get(tuple(tokens[pos:pos + length]))
+        if name:
+            return name, length
+    return None, 0
+
+
+def _quantity(token: str) -> Optional[int]:
+    if token.isdigit() and 0 < int(token) <= 20:
+        return int(token)
+    return QUANTITIES.get(token)
+
+
+def _size_for(item: MenuItem, requested: Optional[str]) -> str:
+    if requested is None:
+        return ONE_SIZE_OPTION if item.has_one_size else UNSPECIFIED
+    if item.has_one_size or requested not in item.sizes:
+        return UNAVAILABLE
+    return requested
+
+
+def _default_topping(item: MenuItem) -> str:
+    return NO_TOPPING_OPTION if item.has_no_toppings else UNSPECIFIED
+
+
+def _add_topping(line: OrderLine, topping: str):
+    item = MENU[line.item]
+    if item.has_no_toppings or topping not in item.toppings:
+        if line.topping not in (UNSPECIFIED, UNAVAILABLE, NO_TOPPING_OPTION):
+            # Partially available toppings are a judgement call; leave it to the LLM
+            raise _LowConfidence()
+        line.topping = UNAVAILABLE
+        return
+    if line.topping in (UNSPECIFIED, UNAVAILABLE, NO_TOPPING_OPTION):
+        line.topping = topping
+    elif topping not in [part.strip() for part in line.topping.split("/")]:
+        line.topping = f"{line.topping} / {topping}"
+
+
+def _last_line(lines: list[OrderLine]) -> list[OrderLine]:
+    """The lines of the last entry of the order, "2 x Fries" being one entry of two lines"""
+    if not lines:
+        return []
+    start = len(lines) - 1
+    while start > 0 and lines[start - 1] == lines[-1]:
+        start -= 1
+    return lines[start:]
+
+
+def _names_target(tokens: list[str], pos: int) -> bool:
+    """True if the "to" at pos names an item, as in "ketchup to the cheeseburger" """
+    pos += 1
+    while pos < len(tokens) and (tokens[pos] in TARGET_DETERMINERS or _quantity(tokens[pos]) is not None):
+        pos += 1
+    return _match(tokens, pos, ITEM_PHRASES)[0] is not None
+
+
+def _parse_tokens(tokens: list[str], lines: list[OrderLine]) -> int:
+    """Apply the utterance to lines in place, returns the number of recognized tokens"""
+    recognized = 0
+    new_lines: list[OrderLine] = []
+    group: list[OrderLine] = []
+    pending_quantity: Optional[int] = None
+    pending_size: Optional[str] = None
+    pos = 0
+
+    while pos < len(tokens):
+        token = tokens[pos]
+
+        if token in QUESTION_WORDS or token in NEGATION_WORDS:
+            raise _LowConfidence()
+        if token in TARGET_WORDS and _names_target(tokens, pos):
+            raise _LowConfidence()
+
+        # "make it large" only modifies the last item mentioned, all of its units
+        if token in ("make", "change", "switch") and tokens[pos + 1:pos + 2] and tokens[pos + 1] in MAKE_IT_WORDS:
+            end = pos + 2
+            if end < len(tokens) and tokens[end] in ("a", "to"):
+                end += 1
+            targets = _last_line(new_lines or lines)
+            if end >= len(tokens) or tokens[end] not in SIZES or not targets:
+                raise _LowConfidence()
+            for line in targets:
+                line.size = _size_for(MENU[line.item], SIZES[tokens[end]])
+            recognized += end + 1 - pos
+            pos = end + 1
+            continue
+
+        item_name, length = _match(tokens, pos, ITEM_PHRASES)
+        if item_name:
+            item = MENU[item_name]
+            group = [
+                OrderLine(item_name, _size_for(item, pending_size), _default_topping(item))
+                for _ in range(pending_quantity or 1)
+            ]
+            new_lines.extend(group)
+            pending_quantity = pending_size = None
+            recognized += length
+            pos += length
+            continue
+
+        topping, length = _match(tokens, pos, TOPPING_PHRASES)
+        if topping:
+            if pending_quantity is not None or pending_size is not None:
+                raise _LowConfidence()
+            if not group:
+                if new_lines or not lines:
+                    raise _LowConfidence()
+                # Toppings on their own go to the right-most item of the current order
+                group = [lines[-1]]
+            for line in group:
+                _add_topping(line, topping)
+            recognized += length
+            pos += length
+            continue
+
+        if token == "with":
+            if not group and not lines:
+                raise _LowConfidence()
+            recognized += 1
+            pos += 1
+            continue
+
+        if token in SIZES:
+            if pending_size is not None:
+                raise _LowConfidence()
+            if group and pending_quantity is None and all(line.size == UNSPECIFIED for line in group):
+                # "a coke, large", but "a coke and a sprite, large" could mean both
+                if any(line.size == UNSPECIFIED for line in new_lines if not any(line is member for member in group)):
+                    raise _LowConfidence()
+                for line in group:
+                    line.size = _size_for(MENU[line.item], SIZES[token])
+            else:
+                pending_size = SIZES[token]
+            recognized += 1
+            pos += 1
+            continue
+
+        quantity = _quantity(token)
+        if quantity is not None:
+            if pending_quantity is not None:
+                raise _LowConfidence()
+            pending_quantity = quantity
+            group = []
+            recognized += 1
+            pos += 1
+            continue
+
+        if token in FILLER_WORDS:
+            recognized += 1
+        pos += 1
+
+    # A dangling "two large" without an item is not something we can resolve
+    if pending_size is not None or pending_quantity is not None:
+        raise _LowConfidence()
+
+    lines.extend(new_lines)
+    return recognized
+
+
+def parse_order_locally(transcription: str, previous_output: Optional[str]) -> LocalParse:
+    """Apply a chunk to the previous order state without calling the LLM.
+
+    Returns the result in the same order_details/sizes/toppings format as
+    process_order along with a confidence in [0, 1]. A confidence of 1 means
+    every word of the chunk was understood by the grammar.
+    """
+    try:
+        lines = parse_order_state(previous_output)
+    except (ValueError, KeyError, TypeError):
+        return LocalParse(None, 0.0)
+
+    text = _normalize(transcription)
+    if not text:
+        return LocalParse(None, 0.0)
+
+    previous = [OrderLine(**vars(line)) for line in lines]
+    words = len(text.split())
+    recognized = 0
+    clear = CLEAR_PATTERN.match(text) or SCRATCH_PATTERN.match(text)
+    if clear:
+        lines = []
+        recognized = len(clear.group(0).split())
+        text = text[clear.end():].strip()
+        if not text and SCRATCH_PATTERN.match(clear.group(0)):
+            # "scratch that" alone could mean the last item or everything
+            return LocalParse(None, 0.0)
+
+    try:
+        recognized += _parse_tokens(text.split(), lines)
+    except (_LowConfidence, KeyError):
+        return LocalParse(None, 0.0)
+
+    if not clear and lines == previous:
+        # Nothing changed: chit-chat or something we don't understand
+        return LocalParse(None, 0.0)
+
+    return LocalParse(format_order(lines), recognized / words)
@@ -0,0 +1,160 @@
+import hashlib
+from typing import Optional
+from app.settings import logger
+from app.utils.metrics import OPENAI_TOKENS
+from .menu import MENU, MenuItem
+
+# The prompt is laid out so that everything that doesn't change between requests
+# (rules + menu) forms one stable prefix in the system message. Only the order
+# state and the transcript follow it, which lets the provider reuse its cached
+# prefix and keeps the per-request input tokens small.
+
+
+# System prompt for the order processing
+SYSTEM_PROMPT = """You are a highly skilled waiter processing customer orders according to these strict rules:
+
+
+1. MENU VALIDATION:
+- ONLY accept items that align with the provided menu.
+- Ignore items that do not align with given menu.
+
+2. SIZE HANDLING:
+- Use '?' only for items whose size isn't specified by customer.
+- Use '!' only when customer requests an unavailable size for an item that exists in menu.
+- Use 'One Size Option' only for items that have exactly one size option in the menu.
+- Never assume or default to any size - if not specified, it must be '?'.
+- When customer changes size by saying something like 'make it large', only modify the last item mentioned.
+
+
+3. TOPPING HANDLING:
+- Use '?' only for items whose topping isn't specified by customer.
+- Use '!' only when customer requests an unavailable topping for an item that exists in menu.
+- Use 'No Topping Option' only for items that have no topping option in the menu.
+- Never assume or default to any topping - if not specified, it must be '?'.
+- Separate multiple toppings for the same item with a slash ('/').
+- When the customer changes a topping, update the most recently mentioned item.
+
+
+4. ORDER MANAGEMENT:
+- Clear the order on 'clear everything', 'get rid of everything', or 'cancel all.'
+- Replace the entire order when customer says 'scratch that, just X.'
+
+
+5. ANSWERING QUESTIONS:
+-If the customer asks a question about the menu, answer it concisely and do not directly add that item to the order
+-If the customer mentions an addition to **those**, answer with the phrase: "what item are you referencing when you say: **input customer response here** ?"
+-If the customer asks for something that does not align with the menu, answer with either the phrase: "Sorry, not available" or "Sorry, not in menu" -- Never use the same response twice in a row.
+
+6. OUTPUT FORMAT:
+Your response must be a JSON object with these exact keys:
+- order_details: String containing the formatted order
+- sizes: String of all sizes used
+- toppings: String of all toppings used
+- answer: String of answer to a customer's question about the menu
+
+7. SPECIAL CASES:
+If the customer just says the item by itself, do not clear the order and write down that item. Just append that item to the current order
+If the customer just says the toppings by itself without food-items, append the toppings to the right-most item in the context
+If the customer orders an item and asks a question about another food item in the menu in the same sentence, do not append the quesitoned item
+If the customer orders n amount of an item and then changes the order, separate the items, sizes, and toppings accordingly
+
+Format rules:
+- Items: 'n x Item Name'
+- Sizes: 'n x Size' or 'n x One Size Option' or 'n x ?' or 'n x !'
+- Toppings: 'n x Topping' or 'n x No Topping Option' or 'n x ?' or 'n x !'
+- Mixed sizes/toppings: separate with commas
+- Multiple toppings: separate with slash ('/')
+
+Note: Never put toppings or sizes in Items, and vice versa
+Note: If there are n separate items in order_details, there should also be n separate sizes and n separate toppings
+
+
+"""
+#If the *answer* string includes **what item are you referencing**, extract customer input from *answer* string and adjust **previous output** but replace **those** with current **customer input**
+
+
+def compile_menu(menu: dict[str, MenuItem]) -> str:
+    """Render the menu in a compact canonical form, one item per line"""
+    return "\n".join(
+        f"{item.name} | sizes: {', '.join(item.sizes)} | toppings: {', '.join(item.toppings)}"
+        for item in menu.values()
+    )
+
+
+MENU_PROMPT = compile_menu(MENU)
+STATIC_PREFIX = f"{SYSTEM_PROMPT}MENU (item | sizes | toppings):\n{MENU_PROMPT}\n"
+
+# Changes whenever the rules or the menu do, used to key cached responses
+PROMPT_VERSION = hashlib.sha256(STATIC_PREFIX.encode("utf-8")).hexdigest()[:12]
+
+
+def build_order_messages(transcription: str, previous_output: str) -> list[dict]:
+    return [
+        {"role": "system", "content": STATIC_PREFIX},
+        {"role": "user", "content": f"""Previous order state: {previous_output}
+Customer order: {transcription}
+
+Process this order according to the rules and return a JSON response."""}
+    ]
+
+
+######################### TOKEN ACCOUNTING #########################
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4o tokenizer
+except Exception:  # not installed, or the encoding can't be downloaded
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # Roughly 4 characters per token for English text
+    return (len(text) + 3) // 4
+
+
+def prompt_sections(transcription: str = "", previous_output: str = "") -> dict:
+    """Token count of every section of the prompt"""
+    sections = {
+        "rules": count_tokens(SYSTEM_PROMPT),
+        "menu": count_tokens(MENU_PROMPT),
+        "order_state": count_tokens(previous_output),
+        "transcript": count_tokens(transcription),
+    }
+    sections["static_prefix"] = sections["rules"] + sections["menu"]
+    sections["total"] = sections["static_prefix"] + sections["order_state"] + sections["transcript"]
+    return sections
+
+
+# Usage reported by OpenAI since startup
+_usage_totals = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+
+def log_prompt_usage(usage: Optional[object]):
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    _usage_totals["requests"] += 1
+    _usage_totals["prompt_tokens"] += usage.prompt_tokens
+    _usage_totals["cached_tokens"] += cached
+    _usage_totals["completion_tokens"] += usage.completion_tokens
+    OPENAI_TOKENS.labels("prompt").inc(usage.prompt_tokens)
+    OPENAI_TOKENS.labels("cached").inc(cached)
+    OPENAI_TOKENS.labels("completion").inc(usage.completion_tokens)
+    logger.info(
+        f"OpenAI usage: {usage.prompt_tokens} prompt tokens ({cached} cached), "
+        f"{usage.completion_tokens} completion tokens"
+    )
+
+
+def get_prompt_stats() -> dict:
+    return {
+        "prompt_version": PROMPT_VERSION,
+        "tokenizer": "tiktoken" if _encoding is not None else "approximate",
+        "sections": prompt_sections(),
+        "usage": dict(_usage_totals),
+    }
+
+
+logger.info(f"Order prompt {PROMPT_VERSION}: {prompt_sections()}")
@@ -0,0 +1,264 @@
+import sys
+import json
+import asyncio
+import argparse
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+from sqlalchemy.future import select
+from app.settings import logger, AsyncSessionLocal, BULK_CONCURRENCY, OPENAI_MODEL
+from . import api
+from .models import Conversation
+from .schemas import BulkSession
+from .bulk import process_sessions, split_conversation_id
+from .menu import MENU_VERSION
+from .prompt import PROMPT_VERSION, get_prompt_stats
+from .validation import expand_lenient
+
+# Replays reviewed sessions through the current process_order pipeline and
+# scores every reviewed chunk against its ideal_inference, so a prompt, model
+# or parser change comes with measured accuracy and latency.
+#
+#   python -m app.conversations_app.replay                   # recorded LLM responses
+#   python -m app.conversations_app.replay --backend live    # OpenAI (OPENAI_MODEL)
+#
+# The recorded backend answers the chunks that reach the LLM with the response
+# stored for the same chunk on the same order (inferred_command, else the stored
+# context), so local parser and validation changes can be measured without any
+# API calls. A recorded response is a whole order, it only answers the chunk
+# given the order it was recorded on; anything else is a miss.
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+@dataclass
+class ReplaySession:
+    session: BulkSession
+    # Expected result for each reviewed chunk, by index
+    ideals: dict[int, str] = field(default_factory=dict)
+
+
+def normalize_chunk(transcription: str) -> str:
+    return " ".join(transcription.lower().split())
+
+
+def response_key(transcription: str, previous_output: str) -> tuple:
+    """The chunk and the order it was given, the answer aside"""
+    return normalize_chunk(transcription), tuple(order_lines(_as_order(previous_output)))
+
+
+def _as_order(value) -> Optional[dict]:
+    if isinstance(value, dict):
+        return value
+    if not value:
+        return None
+    try:
+        value = json.loads(value)
+    except ValueError:
+        # Plain text ideal inferences only list the items
+        return {"order_details": value}
+    return value if isinstance(value, dict) else None
+
+
+class RecordedBackend:
+    """Stand-in for process_order_with_llm serving recorded responses"""
+
+    def __init__(self, latency_ms: float = 0):
+        self.responses: dict[tuple, dict] = {}
+        self.latency = latency_ms / 1000
+        self.calls = 0
+        self.misses = 0
+
+    def record(self, chunk: str, previous_output: str, response: Optional[dict]):
+        if chunk and response is not None:
+            self.responses[response_key(chunk, previous_output)] = response
+
+    async def process_order_with_llm(self, transcription: str, previous_output: str, deadline: Optional[float] = None) -> dict:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = self.responses.get(response_key(transcription, previous_output))
+        if response is None:
+            self.misses += 1
+            raise ValueError(f"No recorded response for {transcription!r}")
+        return api.repair_order(dict(response))
+
+
+@contextmanager
+def pipeline_backend(backend: Optional[RecordedBackend], use_cache: bool):
+    """Point process_order at the replay backend for the duration of a run"""
+    original = api.process_order_with_llm, api.ORDER_CACHE_ENABLED
+    if backend is not None:
+        api.process_order_with_llm = backend.process_order_with_llm
+    api.ORDER_CACHE_ENABLED = use_cache
+    try:
+        yield
+    finally:
+        api.process_order_with_llm, api.ORDER_CACHE_ENABLED = original
+
+
+async def load_reviewed_sessions(backend: Optional[RecordedBackend], final_only: bool = False,
+                                 limit: Optional[int] = None) -> list[ReplaySession]:
+    """Sessions with at least one reviewed chunk, with every chunk in version order"""
+    rows: dict[str, list[tuple[int, Conversation]]] = {}
+    async with AsyncSessionLocal() as session:
+        result = await session.stream_scalars(
+            select(Conversation)
+            .where(Conversation.chunk.is_not(None))
+            .execution_options(yield_per=1000)
+        )
+        async for conversation in result:
+            parts = split_conversation_id(conversation.conversation_id)
+            # Version 0 is the 'New customer session' marker row
+            if parts is None or parts[1] == 0:
+                continue
+            rows.setdefault(parts[0], []).append((parts[1], conversation))
+
+    sessions = []
+    for base_id, versions in rows.items():
+        replay_session = ReplaySession(BulkSession(id=base_id, chunks=[]))
+        previous_context = ""
+        for index, (_, conversation) in enumerate(sorted(versions, key=lambda version: version[0])):
+            replay_session.session.chunks.append(conversation.chunk)
+            reviewed = conversation.final_review_by is not None or not final_only
+            if conversation.ideal_inference and reviewed:
+                replay_session.ideals[index] = conversation.ideal_inference
+            if backend is not None:
+                backend.record(conversation.chunk, previous_context,
+                               _as_order(conversation.inferred_command) or _as_order(conversation.context))
+            previous_context = conversation.context
+        if replay_session.ideals:
+            sessions.append(replay_session)
+    return sessions[:limit] if limit else sessions
+
+
+#################################### SCORING #####################################
+def order_lines(order: Optional[dict]) -> list[tuple[str, str, str]]:
+    """(item, size, topping) per ordered unit, normalized for comparison"""
+    if not order:
+        return []
+    items = expand_lenient(order.get("order_details"))
+    sizes = expand_lenient(order.get("sizes"))
+    toppings = expand_lenient(order.get("toppings"))
+    sizes = (sizes + [""] * len(items))[:len(items)]
+    toppings = (toppings + [""] * len(items))[:len(items)]
+    return [
+        (
+            item.strip().lower(),
+            size.strip().lower(),
+            " / ".join(sorted(part.strip().lower() for part in topping.split("/"))),
+        )
+        for item, size, topping in zip(items, sizes, toppings)
+    ]
+
+
+def _overlap(predicted: list, expected: list) -> float:
+    if not predicted and not expected:
+        return 1.0
+    matched = sum((Counter(predicted) & Counter(expected)).values())
+    return matched / max(len(predicted), len(expected))
+
+
+def score_chunk(result: Optional[dict], ideal: str) -> dict[str, float]:
+    """Item, size and topping accuracy of a result against the ideal inference, from 0 to 1"""
+    predicted = order_lines(result)
+    expected = order_lines(_as_order(ideal))
+    return {
+        "items": _overlap([line[0] for line in predicted], [line[0] for line in expected]),
+        "sizes": _overlap([line[:2] for line in predicted], [line[:2] for line in expected]),
+        "toppings": _overlap([line[::2] for line in predicted], [line[::2] for line in expected]),
+        "exact": float(Counter(predicted) == Counter(expected)),
+    }
+
+
+def percentile(values: list[float], p: float) -> Optional[float]:
+    """Linear interpolation between the closest ranks"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = (len(values) - 1) * p / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return round(values[lower] + (values[upper] - values[lower]) * (rank - lower), 2)
+
+
+async def replay(sessions: list[ReplaySession], concurrency: int, details=None) -> dict:
+    """Run the sessions and summarize accuracy and latency"""
+    ideals = {(replay_session.session.id, index): ideal for replay_session in sessions for index, ideal in replay_session.ideals.items()}
+    scores: dict[str, list[float]] = {"items": [], "sizes": [], "toppings": [], "exact": []}
+    latencies = []
+    errors = 0
+
+    async for line in process_sessions([replay_session.session for replay_session in sessions], concurrency):
+        if "error" in line:
+            errors += 1
+        if "latency_ms" in line:
+            latencies.append(line["latency_ms"])
+        ideal = ideals.get((line["session"], line["index"]))
+        if ideal is not None:
+            line["score"] = score_chunk(line.get("result"), ideal)
+            for name, value in line["score"].items():
+                scores[name].append(value)
+        if details is not None:
+            details.write(json.dumps(line) + "\n")
+
+    return {
+        "sessions": len(sessions),
+        "chunks": sum(len(replay_session.session.chunks) for replay_session in sessions),
+        "scored_chunks": len(scores["exact"]),
+        "errors": errors,
+        "accuracy": {
+            name: round(sum(values) / len(values), 4) if values else None
+            for name, values in scores.items()
+        },
+        "latency_ms": {
+            **{f"p{p}": percentile(latencies, p) for p in PERCENTILES},
+            "max": max(latencies, default=None),
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        },
+    }
+
+
+async def main(args: argparse.Namespace):
+    backend = RecordedBackend(args.recorded_latency_ms) if args.backend == "recorded" else None
+    sessions = await load_reviewed_sessions(backend, args.final_only, args.limit)
+    logger.info(f"Replaying {len(sessions)} reviewed sessions against the {args.backend} backend")
+
+    details = open(args.details, "w", encoding="utf-8") if args.details else None
+    try:
+        with pipeline_backend(backend, args.use_cache):
+            report = await replay(sessions, args.concurrency, details)
+    finally:
+        if details is not None:
+            details.close()
+
+    report = {
+        "backend": args.backend,
+        "model": OPENAI_MODEL if backend is None else None,
+        "prompt_version": PROMPT_VERSION,
+        "menu_version": MENU_VERSION,
+        **report,
+    }
+    if backend is not None:
+        report["llm_calls"] = backend.calls
+        report["recorded_misses"] = backend.misses
+    else:
+        report["prompt_usage"] = get_prompt_stats()
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Replay reviewed conversations and score them against ideal_inference"
+    )
+    parser.add_argument("--backend", choices=("recorded", "live"), default="recorded")
+    parser.add_argument("-c", "--concurrency", type=int, default=BULK_CONCURRENCY)
+    parser.add_argument("--limit", type=int, help="Only replay the first LIMIT sessions")
+    parser.add_argument("--final-only", action="store_true", help="Only score chunks with a final review")
+    parser.add_argument("--use-cache", action="store_true", help="Allow results from the Redis order cache")
+    parser.add_argument("--recorded-latency-ms", type=float, default=0,
+                        help="Simulated LLM latency of the recorded backend")
+    parser.add_argument("--details", help="Write every replayed chunk with its score to this NDJSON file")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,138 @@
+from datetime import timedelta
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy import case, func, or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from app.utils.db_base import get_db
+from app.utils.security import check_if_reviewer
+from app.settings import logger, REVIEW_BATCH_SIZE, REVIEW_MAX_BATCH_SIZE, REVIEW_LEASE_SECONDS
+from .models import Conversation
+from .schemas import (
+    ConversationSchema,
+    ClaimedConversationsSchema,
+    ReviewStage,
+    SubmitReviewsRequest,
+    SubmitReviewsResponse,
+    ReleaseClaimsRequest,
+)
+
+# Work queue of the two review stages: the initial review, then a final review
+# by someone else. Reviewers claim a batch of conversations awaiting a stage,
+# which are theirs for REVIEW_LEASE_SECONDS, and submit the reviews. Rows are
+# claimed with SELECT ... FOR UPDATE SKIP LOCKED, so reviewers claiming at the
+# same moment neither wait on each other nor get the same conversations, and
+# a conversation whose lease ran out is handed to the next reviewer asking.
+# The rows awaiting each stage have a partial index, claims never scan the
+# reviewed ones.
+
+review_router = APIRouter()
+
+
+def awaiting_review(stage: ReviewStage, reviewer_id: int) -> tuple:
+    """Conditions of the conversations the reviewer can review in `stage`"""
+    if stage == ReviewStage.initial:
+        return (Conversation.initial_review_by.is_(None),)
+    return (
+        Conversation.initial_review_by.is_not(None),
+        Conversation.final_review_by.is_(None),
+        # Nobody gives the final review of their own initial review
+        Conversation.initial_review_by != reviewer_id,
+    )
+
+
+@review_router.post("/review/claim", response_model=ClaimedConversationsSchema, dependencies=[Depends(check_if_reviewer)])
+async def claim_conversations(
+    request: Request,
+    stage: ReviewStage = ReviewStage.initial,
+    limit: int = Query(REVIEW_BATCH_SIZE, ge=1, le=REVIEW_MAX_BATCH_SIZE),
+    session: AsyncSession = Depends(get_db)
+):
+    """Hand the oldest conversations awaiting `stage` to the reviewer.
+
+    Conversations the reviewer already holds come first, with a new lease, so
+    claiming again after a reload doesn't lose them.
+    """
+    reviewer_id = request.state.user.id
+    now = func.now()
+    claimable = (
+        select(Conversation.id)
+        .where(
+            *awaiting_review(stage, reviewer_id),
+            or_(
+                Conversation.claimed_until.is_(None),
+                Conversation.claimed_until < now,
+                Conversation.claimed_by == reviewer_id,
+            )
+        )
+        .order_by(Conversation.timestamp, Conversation.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .cte("claimable")
+    )
+    result = await session.execute(
+        update(Conversation)
+        .where(Conversation.id == claimable.c.id)
+        .values(claimed_by=reviewer_id, claimed_until=now + timedelta(seconds=REVIEW_LEASE_SECONDS))
+        .returning(*Conversation.__table__.c)
+        .execution_options(synchronize_session=False)
+    )
+    rows = sorted(result.mappings().all(), key=lambda row: (row["timestamp"], row["id"]))
+    await session.commit()
+
+    logger.debug(f"Reviewer {reviewer_id} claimed {len(rows)} conversations for the {stage.value} review")
+    return ClaimedConversationsSchema(
+        stage=stage,
+        lease_expires_at=rows[0]["claimed_until"] if rows else None,
+        conversations=[ConversationSchema.model_validate(row) for row in rows],
+    )
+
+
+@review_router.post("/review/submit", response_model=SubmitReviewsResponse, dependencies=[Depends(check_if_reviewer)])
+async def submit_reviews(request: Request, request_body: SubmitReviewsRequest, session: AsyncSession = Depends(get_db)):
+    """Store the reviews of claimed conversations, in one statement.
+
+    A review is accepted while the reviewer still holds the conversation, even
+    past the lease, as long as nobody else claimed it in the meantime.
+    """
+    reviewer_id = request.state.user.id
+    stage = request_body.stage
+    ideal_inferences = {review.id: review.ideal_inference for review in request_body.reviews}
+    if not ideal_inferences:
+        return SubmitReviewsResponse(accepted=[], rejected=[])
+
+    reviewed_by = "initial_review_by" if stage == ReviewStage.initial else "final_review_by"
+    result = await session.execute(
+        update(Conversation)
+        .where(
+            Conversation.id.in_(ideal_inferences),
+            Conversation.claimed_by == reviewer_id,
+            *awaiting_review(stage, reviewer_id)
+        )
+        .values({
+            reviewed_by: reviewer_id,
+            "ideal_inference": case(ideal_inferences, value=Conversation.id),
+            "claimed_by": None,
+            "claimed_until": None,
+        })
+        .returning(Conversation.id)
+        .execution_options(synchronize_session=False)
+    )
+    accepted = set(result.scalars().all())
+    await session.commit()
+
+    return SubmitReviewsResponse(accepted=sorted(accepted), rejected=sorted(set(ideal_inferences) - accepted))
+
+
+@review_router.post("/review/release", dependencies=[Depends(check_if_reviewer)])
+async def release_claims(request: Request, request_body: ReleaseClaimsRequest, session: AsyncSession = Depends(get_db)):
+    """Give claimed conversations back, so others don't wait for the lease to run out"""
+    result = await session.execute(
+        update(Conversation)
+        .where(Conversation.id.in_(request_body.ids), Conversation.claimed_by == request.state.user.id)
+        .values(claimed_by=None, claimed_until=None)
+        .returning(Conversation.id)
+        .execution_options(synchronize_session=False)
+    )
+    released = sorted(result.scalars().all())
+    await session.commit()
+    return {"released": released}
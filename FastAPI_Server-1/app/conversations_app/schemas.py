@@ -46,6 +46,17 @@ class ConversationSchema(ConversationBase):
     class Config:
         from_attributes = True
 
+class ConversationFieldsSchema(ConversationSchema):
+    """ConversationSchema with only the fields asked for set"""
+    id: Optional[int] = None
+    timestamp: Optional[datetime] = None
+    conversation_id: Optional[str] = None
+    context: Optional[str] = None
+
+class ConversationPageSchema(BaseModel):
+    items: list[ConversationFieldsSchema]
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to get the next page, None on the last one.")
+
 class CreateConversationSchema(ConversationBase):
     initial_review_by_id: Optional[int] = None
     final_review_by_id: Optional[int] = None
@@ -62,4 +73,36 @@ class UpdateConversationSchema(BaseModel):
     final_review_by_id: Optional[int] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class ReviewStage(str, Enum):
+    initial = "initial"
+    final = "final"
+
+class ClaimedConversationsSchema(BaseModel):
+    stage: ReviewStage
+    lease_expires_at: Optional[datetime] = Field(None, description="Submit the reviews before this, the conversations are handed to others after it.")
+    conversations: list[ConversationSchema]
+
+class ReviewSchema(BaseModel):
+    id: int
+    ideal_inference: str = Field(..., description="The order the chunk should have been inferred as.")
+
+class SubmitReviewsRequest(BaseModel):
+    stage: ReviewStage
+    reviews: list[ReviewSchema] = Field(..., max_length=1000)
+
+class SubmitReviewsResponse(BaseModel):
+    accepted: list[int]
+    rejected: list[int] = Field(..., description="Conversations no longer claimed by the reviewer, or already reviewed in this stage.")
+
+class ReleaseClaimsRequest(BaseModel):
+    ids: list[int] = Field(..., max_length=1000)
+
+class BulkSession(BaseModel):
+    id: Optional[str] = Field(None, description="Caller's identifier for the session, echoed back with every result.")
+    chunks: list[str] = Field(..., description="Transcript chunks of the session, in the order they were spoken.")
+
+class BulkProcessRequest(BaseModel):
+    sessions: list[BulkSession]
+    concurrency: Optional[int] = Field(None, ge=1, description="Orders processed at once, capped by BULK_MAX_CONCURRENCY.")
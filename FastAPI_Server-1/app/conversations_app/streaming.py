@@ -0,0 +1,109 @@
+import json
+import re
+
+# Incomplete unicode escape at the end of a partial string ("\u00")
+_TRAILING_UNICODE_ESCAPE = re.compile(r"(\\+)u[0-9a-fA-F]{0,3}$")
+
+
+class PartialJSONFields:
+    """Incrementally extracts the top-level string fields of a streamed JSON object.
+
+    Feed it the content deltas from the OpenAI stream as they arrive; every call
+    returns the fields whose (possibly still growing) value changed.
+    """
+
+    def __init__(self):
+        self.fields: dict[str, str] = {}
+        self._state = "start"
+        self._key: list[str] = []
+        self._raw: list[str] = []
+        self._escape = False
+        self._depth = 0
+        self._in_nested_string = False
+
+    def feed(self, delta: str) -> dict[str, str]:
+        changed = set()
+        for char in delta:
+            state = self._state
+            if state == "start":
+                if char == "{":
+                    self._state = "key"
+            elif state == "key":
+                if char == '"':
+                    self._key = []
+                    self._state = "in_key"
+            elif state == "in_key":
+                if self._escape:
+                    self._key.append(char)
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._state = "colon"
+                else:
+                    self._key.append(char)
+            elif state == "colon":
+                if char == ":":
+                    self._state = "value"
+            elif state == "value":
+                if char == '"':
+                    self._raw = []
+                    self._state = "in_string"
+                    self.fields[self.key] = ""
+                    changed.add(self.key)
+                elif not char.isspace():
+                    # Numbers, nulls and nested values are skipped
+                    self._depth = 1 if char in "{[" else 0
+                    self._state = "other"
+            elif state == "in_string":
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self.fields[self.key] = self._decode("".join(self._raw))
+                    self._state = "key"
+                    continue
+                self._raw.append(char)
+                changed.add(self.key)
+            elif state == "other":
+                self._skip_value(char)
+
+        if self._state == "in_string":
+            self.fields[self.key] = self._decode("".join(self._raw), self._escape)
+        return {key: self.fields[key] for key in changed}
+
+    @property
+    def key(self) -> str:
+        return "".join(self._key)
+
+    def _skip_value(self, char: str):
+        if self._in_nested_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_nested_string = False
+        elif char == '"':
+            self._in_nested_string = True
+        elif char in "{[":
+            self._depth += 1
+        elif char in "}]":
+            self._depth -= 1
+            if self._depth < 0:
+                self._state = "done"
+        elif char == "," and self._depth == 0:
+            self._state = "key"
+
+    @staticmethod
+    def _decode(raw: str, pending_escape: bool = False) -> str:
+        if pending_escape:
+            raw = raw[:-1]
+        match = _TRAILING_UNICODE_ESCAPE.search(raw)
+        if match and len(match.group(1)) % 2:
+            raw = raw[:match.start()] + match.group(1)[:-1]
+        try:
+            return json.loads(f'"{raw}"')
+        except ValueError:
+            return raw
@@ -0,0 +1,97 @@
+import re
+from .menu import (
+    MenuItem,
+    OrderLine,
+    ONE_SIZE_OPTION,
+    NO_TOPPING_OPTION,
+    UNSPECIFIED,
+    UNAVAILABLE,
+    lookup_item,
+    match_option,
+    format_order,
+)
+
+# Checks LLM output against the menu and repairs it with the same '?' / '!'
+# rules the prompt asks for, instead of sending the customer around for
+# another utterance and another LLM call.
+
+_ENTRY = re.compile(r"^\s*(\d+)\s*x\s*(.*?)\s*$", re.IGNORECASE)
+_MARKERS = (UNSPECIFIED, UNAVAILABLE)
+
+
+def expand_lenient(value) -> list[str]:
+    """Like the strict 'n x ...' parser but tolerant of missing counts"""
+    if not isinstance(value, str):
+        return []
+    # The model sometimes echoes the field name ("sizes: 1 x Large")
+    value = re.sub(r"^\s*(?:order_details|sizes|toppings)\s*:", "", value, flags=re.IGNORECASE)
+    expanded = []
+    for part in value.split(","):
+        if not part.strip():
+            continue
+        match = _ENTRY.match(part)
+        quantity, rest = (int(match.group(1)), match.group(2)) if match else (1, part.strip())
+        expanded.extend([rest] * max(quantity, 1))
+    return expanded
+
+
+def _repair_size(item: MenuItem, size: str) -> str:
+    if size in _MARKERS:
+        return size
+    if item.has_one_size:
+        return ONE_SIZE_OPTION if match_option(size, (ONE_SIZE_OPTION,)) else UNAVAILABLE
+    if match_option(size, (ONE_SIZE_OPTION,)):
+        return UNSPECIFIED
+    return match_option(size, item.sizes) or UNAVAILABLE
+
+
+def _repair_topping(item: MenuItem, topping: str) -> str:
+    if topping in _MARKERS:
+        return NO_TOPPING_OPTION if item.has_no_toppings and topping == UNSPECIFIED else topping
+    if item.has_no_toppings:
+        return NO_TOPPING_OPTION if match_option(topping, (NO_TOPPING_OPTION,)) else UNAVAILABLE
+    if match_option(topping, (NO_TOPPING_OPTION,)):
+        return UNSPECIFIED
+
+    toppings = [match_option(part, item.toppings) for part in topping.split("/") if part.strip()]
+    if not toppings or None in toppings:
+        return UNAVAILABLE
+    return " / ".join(dict.fromkeys(toppings))
+
+
+def validate_order(result: dict) -> tuple[dict, list[str]]:
+    """Check an order result against the menu.
+
+    Returns the result (untouched when it is valid, otherwise rebuilt from the
+    repaired lines) and the list of problems that were repaired.
+    """
+    items = expand_lenient(result.get("order_details"))
+    sizes = expand_lenient(result.get("sizes"))
+    toppings = expand_lenient(result.get("toppings"))
+    issues = []
+
+    if not (len(items) == len(sizes) == len(toppings)):
+        issues.append(f"counts differ: {len(items)} items, {len(sizes)} sizes, {len(toppings)} toppings")
+    # Pad missing sizes/toppings as unspecified, drop the extra ones
+    sizes = (sizes + [UNSPECIFIED] * len(items))[:len(items)]
+    toppings = (toppings + [UNSPECIFIED] * len(items))[:len(items)]
+
+    lines = []
+    for name, size, topping in zip(items, sizes, toppings):
+        item = lookup_item(name)
+        if item is None:
+            issues.append(f"unknown item {name!r} dropped")
+            continue
+
+        line = OrderLine(item.name, _repair_size(item, size.strip()), _repair_topping(item, topping.strip()))
+        if line.size != size.strip():
+            issues.append(f"size {size!r} for {item.name} repaired to {line.size!r}")
+        if [part.strip() for part in line.topping.split("/")] != [part.strip() for part in topping.split("/")]:
+            issues.append(f"topping {topping!r} for {item.name} repaired to {line.topping!r}")
+        if line.item != name:
+            issues.append(f"item {name!r} repaired to {item.name!r}")
+        lines.append(line)
+
+    if not issues:
+        return result, issues
+    return {**result, **format_order(lines, answer=result.get("answer", ""))}, issues
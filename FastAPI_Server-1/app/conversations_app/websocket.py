@@ -0,0 +1,233 @@
+import re
+import json
+import uuid
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, status
+from app.settings import logger, AsyncSessionLocal, SPECULATION_ENABLED, SPECULATION_DELAY, ORDER_SESSION_LEASE
+from app.utils.metrics import SPECULATIONS
+from .api import (
+    process_order,
+    get_fast_order_result,
+    process_order_with_llm,
+    remember_llm_result,
+    claim_order_session,
+    release_order_session,
+    new_customer_session,
+)
+from .conversation_writer import write_conversations
+
+conversation_ws_router = APIRouter()
+
+
+def normalize_transcript(transcription: str) -> str:
+    """Interim and final results of the same speech can differ in case and punctuation"""
+    return " ".join(re.sub(r"[^\w\s']", " ", transcription.lower()).split())
+
+
+@dataclass
+class Speculation:
+    key: str
+    context: str
+    task: Optional[asyncio.Task] = None
+    # Set when the final transcript is here, no need to wait for the text to settle
+    settled: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Superseded speculations nobody awaits would log "Task exception was never retrieved"
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug(f"Speculative order failed: {str(task.exception())}")
+
+
+class OrderingSession:
+    """Order state of one WebSocket connection.
+
+    The connection owns the active order session (claim_order_session), so its
+    order is kept here rather than read and locked in the database for every
+    chunk, and chunks sent over HTTP meanwhile are turned away. Rows are versioned
+    here and stored by the conversation writer. The lease is renewed by a chunk
+    once half of it has gone by; if it ran out and someone else moved the order
+    on, the chunk builds on their order instead.
+
+    Interim transcripts are processed speculatively: when the final transcript
+    matches the latest interim one, its result is usually ready by the time
+    it arrives. Superseded speculations are cancelled, so are pending ones
+    when the socket closes.
+    """
+
+    def __init__(self, owner: str, base_id: str, context: str, next_version: int):
+        self.owner = owner
+        self.base_id = base_id
+        self.context = context
+        self.next_version = next_version
+        self._renew_at = asyncio.get_running_loop().time() + ORDER_SESSION_LEASE / 2
+        self._speculation: Optional[Speculation] = None
+
+    @classmethod
+    async def start(cls) -> "OrderingSession":
+        """Claim the active session, HTTPException 409 if another connection has it"""
+        owner = uuid.uuid4().hex
+        async with AsyncSessionLocal() as session:
+            base_id, context, next_version = await claim_order_session(session, owner)
+        return cls(owner, base_id, context, next_version)
+
+    async def _claim(self, session):
+        base_id, context, next_version = await claim_order_session(session, self.owner)
+        if base_id != self.base_id or next_version > self.next_version:
+            # Not ours for a while, or a new session: the database has the latest order
+            self.base_id, self.context, self.next_version = base_id, context, next_version
+        self._renew_at = asyncio.get_running_loop().time() + ORDER_SESSION_LEASE / 2
+
+    async def _renew(self):
+        if asyncio.get_running_loop().time() >= self._renew_at:
+            async with AsyncSessionLocal() as session:
+                await self._claim(session)
+
+    async def _record(self, chunk: str, result: dict):
+        context = json.dumps(result)
+        await write_conversations([{
+            "chunk": chunk,
+            "context": context,
+            "conversation_id": f"{self.base_id}_{self.next_version}",
+            "timestamp": datetime.now(timezone.utc)
+        }])
+        self.context = context
+        self.next_version += 1
+
+    def speculate(self, transcription: str):
+        """Start processing an interim transcript ahead of its final version"""
+        key = normalize_transcript(transcription)
+        if not SPECULATION_ENABLED or not key or "done" in key:
+            return
+        current = self._speculation
+        if current is not None and current.key == key and current.context == self.context:
+            return
+
+        self._cancel_speculation()
+        speculation = Speculation(key, self.context)
+        speculation.task = asyncio.create_task(self._speculative_result(speculation, transcription))
+        speculation.task.add_done_callback(_retrieve_exception)
+        self._speculation = speculation
+
+    async def _speculative_result(self, speculation: Speculation, transcription: str) -> tuple[dict, bool]:
+        # Interim results change with almost every word, wait for the text to settle
+        try:
+            await asyncio.wait_for(speculation.settled.wait(), SPECULATION_DELAY)
+        except asyncio.TimeoutError:
+            pass
+        result = await get_fast_order_result(transcription, speculation.context)
+        if result is not None:
+            return result, False
+        return await process_order_with_llm(transcription, speculation.context), True
+
+    def _cancel_speculation(self):
+        speculation, self._speculation = self._speculation, None
+        if speculation is not None and not speculation.task.done():
+            speculation.task.cancel()
+            SPECULATIONS.labels("cancelled").inc()
+
+    async def _process(self, transcription: str) -> dict:
+        """process_order, reusing the speculative result when it was for this text and order state"""
+        speculation, self._speculation = self._speculation, None
+        if (speculation is not None
+                and speculation.key == normalize_transcript(transcription)
+                and speculation.context == self.context):
+            # Done, under way or still waiting for the text to settle, which it has now
+            speculation.settled.set()
+            try:
+                result, from_llm = await speculation.task
+            except Exception as e:
+                # Degraded or failed, process_order handles it the usual way
+                logger.warning(f"Speculative order failed: {str(e)}")
+                SPECULATIONS.labels("failed").inc()
+            else:
+                SPECULATIONS.labels("hit").inc()
+                if from_llm:
+                    await remember_llm_result(transcription, self.context, result)
+                return result
+        elif speculation is not None:
+            self._speculation = speculation
+            self._cancel_speculation()
+            SPECULATIONS.labels("miss").inc()
+
+        return await process_order(transcription, self.context)
+
+    async def handle_chunk(self, transcription: str) -> dict:
+        await self._renew()
+
+        # Handle 'done' case
+        if "done" in transcription.lower():
+            self._cancel_speculation()
+            before_done = transcription.lower().split('done')[0].strip()
+            if before_done:
+                await self._record(before_done, await process_order(before_done, self.context))
+            async with AsyncSessionLocal() as session:
+                await release_order_session(session, self.base_id, self.owner, self.context, self.next_version)
+                await new_customer_session(session)
+                await self._claim(session)
+            return {"order_details": "", "sizes": "", "toppings": ""}
+
+        result = await self._process(transcription)
+        await self._record(transcription, result)
+        return result
+
+    async def close(self):
+        self._cancel_speculation()
+        try:
+            async with AsyncSessionLocal() as session:
+                await release_order_session(session, self.base_id, self.owner, self.context, self.next_version)
+        except Exception as e:
+            # HTTP chunks get the session once the lease runs out
+            logger.error(f"Failed to release order session {self.base_id}: {str(e)}")
+
+
+@conversation_ws_router.websocket("/ws")
+async def ordering_session_socket(websocket: WebSocket):
+    """One ordering session per connection.
+
+    Send transcript chunks as {"text": "..."} (or plain text); every chunk is
+    answered with the updated order, or {"error": "..."} if it failed.
+    Interim transcripts, {"text": "...", "interim": true}, get no answer: they
+    only start processing early for the final chunk with the same text.
+    """
+    await websocket.accept()
+    try:
+        session = await OrderingSession.start()
+    except HTTPException as e:
+        await websocket.send_json({"error": e.detail})
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+    logger.info(f"WebSocket ordering session started: {session.base_id}")
+
+    try:
+        while True:
+            message = await websocket.receive_text()
+            interim = False
+            try:
+                payload = json.loads(message)
+                transcription = str(payload.get("text", ""))
+                interim = bool(payload.get("interim", False))
+            except (ValueError, AttributeError):
+                transcription = message
+            transcription = transcription.strip()
+            if not transcription:
+                continue
+            if interim:
+                session.speculate(transcription)
+                continue
+
+            try:
+                result = await session.handle_chunk(transcription)
+            except Exception as e:
+                logger.error(f"Error processing order: {str(e)}")
+                await websocket.send_json({"error": f"Failed to process order: {str(e)}"})
+                continue
+            await websocket.send_json(result)
+
+    except WebSocketDisconnect:
+        logger.info(f"WebSocket ordering session closed: {session.base_id}")
+    finally:
+        await session.close()
@@ -0,0 +1,108 @@
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from app.users_app.schemas import UserSchema, AnonymousUserSchema
+from app.utils import auth_cache
+from app.utils.security import create_token_for_user
+from app.users_app.models import UserModel
+from app.middleware.auth_middleware import AuthMiddleware, InvalidToken, authenticate
+
+# Per-request cost of AuthMiddleware as a pure ASGI middleware, against the same
+# checks run from a BaseHTTPMiddleware (how it was implemented before) and no
+# middleware at all. The user comes from the auth cache, so no database is needed.
+#
+#   python -m app.loadtest.auth_benchmark --requests 5000
+
+
+class BaseHTTPAuthMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        authorization = request.headers.get('Authorization')
+        request.state.user = AnonymousUserSchema()
+        request.state.is_authenticated = False
+        if authorization:
+            try:
+                request.state.user = await authenticate(authorization)
+                request.state.is_authenticated = True
+            except InvalidToken as e:
+                return Response(str(e), status_code=401)
+        return await call_next(request)
+
+
+def create_app(middleware) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping(request: Request):
+        user = getattr(request.state, "user", None)
+        return {"user": user.username if user else None}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for index in range(100):
+                yield f"{index}\n".encode()
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    if middleware is not None:
+        app.add_middleware(middleware)
+    return app
+
+
+async def measure(app: FastAPI, path: str, headers: dict, requests: int) -> float:
+    """Mean microseconds per request"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(min(200, requests)):
+            await client.get(path, headers=headers)
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get(path, headers=headers)
+            assert response.status_code == 200, response.text
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def main(args: argparse.Namespace):
+    # The middleware logs every request, that would be measured too
+    logging.disable(logging.INFO)
+    # Every verification is answered by the in-process cache for the whole run
+    auth_cache.AUTH_CACHE_REDIS = False
+    auth_cache.AUTH_CACHE_TTL = auth_cache.AUTH_CACHE_LOCAL_TTL = 3600
+
+    user = UserModel(id=1, username="bench", email="bench@example.com", full_name="Bench", is_admin=False, is_verified=True)
+    await create_token_for_user(None, user)
+    await auth_cache.cache_user(
+        user.id, user.token, UserSchema.model_validate(user, from_attributes=True), time.time() + 3600,
+        await auth_cache.user_generation(user.id),
+    )
+
+    scenarios = {
+        "anonymous": ("/ping", {}),
+        "bearer": ("/ping", {"Authorization": f"Bearer {user.token}"}),
+        "stream": ("/stream", {"Authorization": f"Bearer {user.token}"}),
+    }
+    variants = {"none": None, "base_http_middleware": BaseHTTPAuthMiddleware, "asgi_middleware": AuthMiddleware}
+
+    report = {}
+    for scenario, (path, headers) in scenarios.items():
+        results = {}
+        for variant, middleware in variants.items():
+            results[variant] = round(await measure(create_app(middleware), path, headers, args.requests), 1)
+        results["asgi_saved_us"] = round(results["base_http_middleware"] - results["asgi_middleware"], 1)
+        report[scenario] = results
+        print(f"{scenario}: {results}", file=sys.stderr)
+
+    json.dump({"requests": args.requests, "us_per_request": report}, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the per-request cost of AuthMiddleware")
+    parser.add_argument("--requests", type=int, default=5000, help="Requests per scenario and variant")
+    asyncio.run(main(parser.parse_args()))
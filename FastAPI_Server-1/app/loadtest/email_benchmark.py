@@ -0,0 +1,84 @@
+import sys
+import json
+import time
+import logging
+import argparse
+from app.loadtest.smtp_standin import start_standin, standin_connection
+from app.users_app.tasks import build_message, send_batch
+from app.utils.smtp_pool import SMTPPool
+
+# Emails per second of one worker, connecting for every email (how emails used
+# to be sent), over a pooled connection one email at a time, and in batches
+# over one session. Sends to the local SMTP stand-in (needs aiosmtpd), whose
+# connect delay stands in for the TLS handshake and login of a real server.
+#
+#   python -m app.loadtest.email_benchmark --emails 500 --connect-delay-ms 50
+
+
+def emails(count: int) -> list[dict]:
+    return [
+        {"subject": "Your Email Verification Code", "message": f"Verification Code: {index:06}", "to": [f"user{index}@example.com"]}
+        for index in range(count)
+    ]
+
+
+def connection_per_email(connect, batch: list[dict]):
+    for email in batch:
+        server = connect()
+        try:
+            server.send_message(build_message(email["subject"], email["message"], email["to"]))
+        finally:
+            server.quit()
+
+
+def pooled(pool: SMTPPool, batch: list[dict]):
+    for email in batch:
+        with pool.connection() as smtp:
+            smtp.send_message(build_message(email["subject"], email["message"], email["to"]))
+
+
+def batched(pool: SMTPPool, batch: list[dict], batch_size: int):
+    for start in range(0, len(batch), batch_size):
+        unsent = send_batch(batch[start:start + batch_size], pool)
+        if unsent:
+            raise RuntimeError(f"{len(unsent)} emails not sent")
+
+
+def main(args: argparse.Namespace):
+    logging.disable(logging.INFO)
+    controller, handler = start_standin(args.host, args.port, args.connect_delay_ms)
+    connect = standin_connection(args.host, args.port)
+    batch = emails(args.emails)
+
+    report = {}
+    try:
+        for name, run in (
+            ("connection_per_email", lambda: connection_per_email(connect, batch)),
+            ("pooled_connection", lambda: pooled(SMTPPool(size=1, connect=connect), batch)),
+            ("batched", lambda: batched(SMTPPool(size=1, connect=connect), batch, args.batch_size)),
+        ):
+            sessions, sent = handler.sessions, handler.emails
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            report[name] = {
+                "emails_per_s": round(args.emails / elapsed, 1),
+                "smtp_sessions": handler.sessions - sessions,
+                "emails_received": handler.emails - sent,
+            }
+            print(f"{name}: {report[name]}", file=sys.stderr)
+    finally:
+        controller.stop()
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emails per second of one worker")
+    parser.add_argument("--emails", type=int, default=500, help="Emails per mode")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--connect-delay-ms", type=float, default=50, help="Simulated TLS handshake and login time")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    main(parser.parse_args())
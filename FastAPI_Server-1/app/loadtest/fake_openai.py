@@ -0,0 +1,185 @@
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from dataclasses import dataclass, field
+from typing import Optional
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.conversations_app.order_parser import parse_order_locally
+from app.conversations_app.prompt import count_tokens
+
+# OpenAI compatible chat-completions stand-in for load tests and offline runs.
+# Point the API at it with OPENAI_BASE_URL=http://localhost:8100/v1.
+#
+#   python -m app.loadtest.fake_openai --port 8100 --latency-ms 800 --latency-sigma 0.5 --error-rate 0.01
+#
+# Orders are answered from the scripted responses (first "match" substring of
+# the customer order wins), else by the local order parser, else with the
+# previous order state unchanged.
+
+_CUSTOMER_ORDER = "Customer order: "
+_PREVIOUS_STATE = "Previous order state: "
+_REPEAT_ANSWER = "Sorry, could you repeat that?"
+
+
+@dataclass
+class FakeOpenAIConfig:
+    # Lognormal latency around the median, sigma 0 for a fixed latency
+    latency_ms: float = 500
+    latency_sigma: float = 0.0
+    error_rate: float = 0.0
+    error_status: int = 500
+    stream_chunk_chars: int = 12
+    scripted: list[dict] = field(default_factory=list)
+
+    def latency(self) -> float:
+        if self.latency_sigma <= 0:
+            return self.latency_ms / 1000
+        return random.lognormvariate(0, self.latency_sigma) * self.latency_ms / 1000
+
+
+def _user_fields(messages: list[dict]) -> tuple[str, str]:
+    """(customer order, previous order state) from the prompt of build_order_messages"""
+    content = next((message.get("content") or "" for message in reversed(messages) if message.get("role") == "user"), "")
+    transcription, previous_output = "", ""
+    for line in content.splitlines():
+        if line.startswith(_CUSTOMER_ORDER):
+            transcription = line[len(_CUSTOMER_ORDER):]
+        elif line.startswith(_PREVIOUS_STATE):
+            previous_output = line[len(_PREVIOUS_STATE):]
+    return transcription, previous_output
+
+
+def order_response(config: FakeOpenAIConfig, messages: list[dict]) -> dict:
+    transcription, previous_output = _user_fields(messages)
+    for script in config.scripted:
+        if script["match"].lower() in transcription.lower():
+            return script["response"]
+
+    result = parse_order_locally(transcription, previous_output).result
+    if result is not None:
+        return result
+    try:
+        previous = json.loads(previous_output) if previous_output.strip() else {}
+    except ValueError:
+        previous = {}
+    return {
+        "order_details": previous.get("order_details", ""),
+        "sizes": previous.get("sizes", ""),
+        "toppings": previous.get("toppings", ""),
+        "answer": _REPEAT_ANSWER,
+    }
+
+
+def _usage(messages: list[dict], content: str, cached_prefix: bool) -> dict:
+    prompt_tokens = sum(count_tokens(message.get("content") or "") for message in messages)
+    system_tokens = sum(count_tokens(message.get("content") or "") for message in messages if message.get("role") == "system")
+    # Like OpenAI: prompts of 1024+ tokens get their repeated prefix cached in 128 token steps
+    cached = system_tokens // 128 * 128 if cached_prefix and prompt_tokens >= 1024 else 0
+    completion_tokens = count_tokens(content)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached},
+    }
+
+
+def create_app(config: FakeOpenAIConfig) -> FastAPI:
+    app = FastAPI()
+    seen_prefixes: set[int] = set()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        model = body.get("model", "gpt-4o")
+        latency = config.latency()
+
+        if random.random() < config.error_rate:
+            await asyncio.sleep(latency)
+            return JSONResponse(
+                status_code=config.error_status,
+                content={"error": {"message": "Injected failure", "type": "server_error"}}
+            )
+
+        content = json.dumps(order_response(config, messages))
+        prefix = hash(next((message.get("content") for message in messages if message.get("role") == "system"), ""))
+        usage = _usage(messages, content, prefix in seen_prefixes)
+        seen_prefixes.add(prefix)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        async def events():
+            def chunk(choices: list, usage: Optional[dict] = None) -> str:
+                return "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": choices,
+                    "usage": usage,
+                }) + "\n\n"
+
+            pieces = [content[i:i + config.stream_chunk_chars] for i in range(0, len(content), config.stream_chunk_chars)]
+            # Half of the latency before the first token, the rest spread over the stream
+            await asyncio.sleep(latency / 2)
+            yield chunk([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            for piece in pieces:
+                await asyncio.sleep(latency / 2 / len(pieces))
+                yield chunk([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                yield chunk([], usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=500, help="Median response latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.0, help="Lognormal sigma of the latency, 0 for fixed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--responses", help='JSON file of scripted responses: [{"match": "...", "response": {...}}]')
+    args = parser.parse_args()
+
+    scripted = []
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as responses_file:
+            scripted = json.load(responses_file)
+
+    config = FakeOpenAIConfig(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        scripted=scripted,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,135 @@
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional
+import httpx
+from app.conversations_app.menu import MENU, ONE_SIZE_OPTION, NO_TOPPING_OPTION
+from app.conversations_app.replay import percentile
+
+# Drives /conversations/create_and_update with concurrent simulated customers,
+# each placing orders chunk by chunk and finishing with "done", and reports
+# throughput, latency percentiles and DB queries per request (from the
+# X-DB-Queries header, start the API with DB_QUERY_COUNTING=true).
+#
+#   python -m app.loadtest.load_generator --customers 1,5,10,25,50 --duration 30
+#
+# Every concurrency level runs for --duration seconds, the level where
+# throughput stops growing and latency climbs is where the server saturates.
+
+ORDER_PATH = "/conversations/create_and_update"
+QUANTITIES = ("a", "one", "two", "three")
+
+
+@dataclass
+class LevelStats:
+    customers: int
+    started: float = field(default_factory=time.perf_counter)
+    latencies: list[float] = field(default_factory=list)
+    db_queries: list[int] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+
+    def report(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        requests = sum(self.statuses.values())
+        return {
+            "customers": self.customers,
+            "requests": requests,
+            "errors": sum(count for status, count in self.statuses.items() if not 200 <= status < 300),
+            "statuses": dict(self.statuses),
+            "duration_s": round(elapsed, 2),
+            "throughput_rps": round(requests / elapsed, 2) if elapsed else None,
+            "latency_ms": {f"p{p}": percentile(self.latencies, p) for p in (50, 95, 99)},
+            "db_queries_per_request": {
+                "mean": round(sum(self.db_queries) / len(self.db_queries), 2) if self.db_queries else None,
+                "p95": percentile(self.db_queries, 95),
+                "max": max(self.db_queries, default=None),
+            },
+        }
+
+
+def random_order(rng: random.Random) -> list[str]:
+    """Chunks of one customer order, a mix of simple and conversational phrasing"""
+    chunks = []
+    for _ in range(rng.randint(1, 3)):
+        item = rng.choice(list(MENU.values()))
+        size = "" if item.sizes == (ONE_SIZE_OPTION,) else rng.choice(item.sizes + ("",)).lower()
+        topping = "" if item.toppings == (NO_TOPPING_OPTION,) else rng.choice(item.toppings + ("",)).lower()
+        chunk = f"{rng.choice(QUANTITIES)} {size} {item.name.lower()}".replace("  ", " ")
+        if topping:
+            chunk += f" with {topping}"
+        if rng.random() < 0.3:
+            # Phrasing the local parser leaves to the LLM
+            chunk = f"um can I get {chunk} please"
+        chunks.append(chunk)
+    if rng.random() < 0.2:
+        chunks.append("actually what do you recommend")
+    chunks.append("that's it, done")
+    return chunks
+
+
+def load_orders(path: str) -> list[list[str]]:
+    """Orders from an NDJSON file of sessions, as used by the bulk CLI"""
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line)["chunks"] for line in file if line.strip()]
+
+
+async def customer(client: httpx.AsyncClient, stats: LevelStats, deadline: float, rng: random.Random,
+                   orders: Optional[list[list[str]]], think_time: float):
+    while time.perf_counter() < deadline:
+        for chunk in rng.choice(orders) if orders else random_order(rng):
+            if time.perf_counter() >= deadline:
+                return
+            started = time.perf_counter()
+            try:
+                response = await client.post(ORDER_PATH, json={"text": chunk})
+                status = response.status_code
+                if "x-db-queries" in response.headers:
+                    stats.db_queries.append(int(response.headers["x-db-queries"]))
+            except httpx.HTTPError:
+                status = 0
+            stats.latencies.append((time.perf_counter() - started) * 1000)
+            stats.statuses[status] += 1
+            if think_time:
+                await asyncio.sleep(rng.uniform(0, 2 * think_time))
+
+
+async def run_level(args: argparse.Namespace, customers: int, orders: Optional[list[list[str]]]) -> dict:
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    limits = httpx.Limits(max_connections=customers, max_keepalive_connections=customers)
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits, timeout=args.timeout) as client:
+        stats = LevelStats(customers)
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(*(
+            customer(client, stats, deadline, random.Random(f"{args.seed}-{customers}-{index}"), orders, args.think_time_ms / 1000)
+            for index in range(customers)
+        ))
+    return stats.report()
+
+
+async def main(args: argparse.Namespace):
+    orders = load_orders(args.sessions) if args.sessions else None
+    reports = []
+    for customers in (int(level) for level in args.customers.split(",")):
+        report = await run_level(args, customers, orders)
+        print(json.dumps(report), file=sys.stderr)
+        reports.append(report)
+    json.dump(reports, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the order API with concurrent customers")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--customers", default="10", help="Comma separated concurrency levels, e.g. 1,5,10,25")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per concurrency level")
+    parser.add_argument("--think-time-ms", type=float, default=0, help="Mean pause between a customer's chunks")
+    parser.add_argument("--sessions", help="NDJSON file of recorded sessions to replay instead of generated orders")
+    parser.add_argument("--token", help="Bearer token sent with every request")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", default="0")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,88 @@
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+from fastapi import HTTPException
+from app.conversations_app.api import get_fast_order_result
+from app.conversations_app.replay import percentile
+from app.utils.password_hashing import pwd_context, verify_password
+
+# Order chunk latency while many users log in at once, with bcrypt run on the
+# event loop (how logins used to work) and on the hashing thread pool.
+# Order chunks are ones the local parser answers, plus a short await standing
+# in for the database, so no services are needed.
+#
+#   python -m app.loadtest.login_storm_benchmark --duration 10 --logins 16
+
+CHUNKS = ("a coke", "one cheeseburger", "two cokes", "a cheeseburger")
+
+
+async def customer(latencies: list[float], deadline: float, io_seconds: float, rng: random.Random):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await get_fast_order_result(rng.choice(CHUNKS), "")
+        await asyncio.sleep(io_seconds)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def login(hashed_password: str, deadline: float, on_loop: bool, counts: dict):
+    while time.perf_counter() < deadline:
+        try:
+            if on_loop:
+                pwd_context.verify("password", hashed_password)
+                # Let the other logins and customers run between the hashes
+                await asyncio.sleep(0)
+            else:
+                await verify_password("password", hashed_password)
+            counts["logins"] += 1
+        except HTTPException:
+            counts["rejected"] += 1
+            await asyncio.sleep(0.05)
+
+
+async def run_scenario(args: argparse.Namespace, hashed_password: str, logins: int, on_loop: bool) -> dict:
+    latencies: list[float] = []
+    counts = {"logins": 0, "rejected": 0}
+    deadline = time.perf_counter() + args.duration
+    await asyncio.gather(
+        *(customer(latencies, deadline, args.io_ms / 1000, random.Random(index)) for index in range(args.customers)),
+        *(login(hashed_password, deadline, on_loop, counts) for _ in range(logins)),
+    )
+    return {
+        "order_chunks": len(latencies),
+        "order_latency_ms": {
+            **{f"p{p}": percentile(latencies, p) for p in (50, 95, 99)},
+            "max": round(max(latencies, default=0), 2),
+        },
+        "logins_per_s": round(counts["logins"] / args.duration, 1),
+        "logins_rejected": counts["rejected"],
+    }
+
+
+async def main(args: argparse.Namespace):
+    logging.disable(logging.INFO)
+    hashed_password = pwd_context.hash("password")
+
+    report = {}
+    for name, logins, on_loop in (
+        ("no_logins", 0, False),
+        ("login_storm_on_event_loop", args.logins, True),
+        ("login_storm_on_thread_pool", args.logins, False),
+    ):
+        report[name] = await run_scenario(args, hashed_password, logins, on_loop)
+        print(f"{name}: {report[name]}", file=sys.stderr)
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Order latency during a login storm")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per scenario")
+    parser.add_argument("--customers", type=int, default=20, help="Customers sending order chunks back to back")
+    parser.add_argument("--logins", type=int, default=16, help="Concurrent users logging in over and over")
+    parser.add_argument("--io-ms", type=float, default=5, help="Simulated database time per order chunk")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,75 @@
+import time
+import asyncio
+import argparse
+from functools import partial
+from app.utils.smtp_pool import open_connection
+
+# A local SMTP server that accepts any login and every email and only counts
+# them, to measure email throughput without a real mail server. Needs aiosmtpd
+# (poetry install --with loadtest). Connecting to a real server costs a TLS handshake and
+# a login, --connect-delay-ms stands in for that.
+#
+#   python -m app.loadtest.smtp_standin --port 8025
+#   EMAIL_HOST=localhost EMAIL_PORT=8025 EMAIL_SECURITY=none celery -A app.celery worker
+
+
+class CountingHandler:
+    def __init__(self, connect_delay: float):
+        self.connect_delay = connect_delay
+        self.sessions = 0
+        self.emails = 0
+        self.recipients = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        if session.host_name is None:
+            self.sessions += 1
+            await asyncio.sleep(self.connect_delay)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.emails += 1
+        self.recipients += len(envelope.rcpt_tos)
+        return "250 Message accepted for delivery"
+
+
+def start_standin(host: str = "127.0.0.1", port: int = 8025, connect_delay_ms: float = 0):
+    """Starts the server on a background thread, returns its controller and handler"""
+    try:
+        from aiosmtpd.controller import Controller
+        from aiosmtpd.smtp import AuthResult
+    except ImportError:
+        raise SystemExit("The SMTP stand-in needs aiosmtpd: pip install aiosmtpd")
+
+    handler = CountingHandler(connect_delay_ms / 1000)
+    controller = Controller(
+        handler,
+        hostname=host,
+        port=port,
+        auth_require_tls=False,
+        authenticator=lambda *args: AuthResult(success=True),
+    )
+    controller.start()
+    return controller, handler
+
+
+def standin_connection(host: str, port: int):
+    """Connects the SMTP pool to the stand-in, which has no TLS"""
+    return partial(open_connection, host, port, "none")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local SMTP server that counts emails")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--connect-delay-ms", type=float, default=50, help="Simulated TLS handshake and login time")
+    args = parser.parse_args()
+
+    controller, handler = start_standin(args.host, args.port, args.connect_delay_ms)
+    print(f"SMTP stand-in on {args.host}:{args.port}, Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"sessions: {handler.sessions}, emails: {handler.emails}, recipients: {handler.recipients}")
+    except KeyboardInterrupt:
+        controller.stop()
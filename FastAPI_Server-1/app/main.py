@@ -1,6 +1,9 @@
 import uvicorn
 import os
-from fastapi import FastAPI
+import asyncio
+from typing import Optional
+from fastapi import FastAPI, Response, Depends
+from prometheus_client import CONTENT_TYPE_LATEST
 from starlette.middleware.cors import CORSMiddleware
 from authlib.integrations.starlette_client import OAuth
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -9,10 +12,22 @@ from contextlib import asynccontextmanager
 from .admin import admin
 from .users_app.api import user_router
 from .conversations_app.api import conversation_router
+from .conversations_app.websocket import conversation_ws_router
+from .conversations_app.id_pool import run_id_pool
+from .conversations_app.conversation_writer import conversation_writer
+from .utils.redis_pool import open_redis, close_redis
+from .conversations_app.bulk import bulk_router
+from .conversations_app.export import export_router
+from .conversations_app.review import review_router
 from .users_app.models import UserModel
-from .settings import logger, SETTINGS, AsyncSessionLocal, DEFAULT_ADMIN_EMAIL, DEFAULT_ADMIN_PASSWORD, DEFAULT_ADMIN_USERNAME, DEFAULT_ADMIN_FULLNAME
-from .utils.security import get_password_hash, login_app, conversation_app
+from .settings import logger, SETTINGS, AsyncSessionLocal, DB_QUERY_COUNTING, DEFAULT_ADMIN_EMAIL, DEFAULT_ADMIN_PASSWORD, DEFAULT_ADMIN_USERNAME, DEFAULT_ADMIN_FULLNAME
+from .utils.security import get_password_hash, login_app, conversation_app, check_if_admin
+from .utils.log_settings import current_settings, update_settings, run_log_settings_sync
+from .utils.metrics import generate_metrics, run_pool_metrics, remove_dead_workers, mark_worker_dead
 from .middleware.auth_middleware import AuthMiddleware
+from .middleware.query_count import QueryCountMiddleware
+from .middleware.metrics import MetricsMiddleware
+from .middleware.request_id import RequestIdMiddleware
 from .tasks_wrapper_app.api import tasks_router
 from .users_app.models import UserModel
 from fastapi.staticfiles import StaticFiles
@@ -22,10 +37,25 @@ from .voice_agent_app.api import va_router
 @asynccontextmanager
 async def lifespan(app : FastAPI):
     logger.info("FAST API: Starting the app")
+    remove_dead_workers()
+    await open_redis()
     # Initialize the database and create the default user
     async with AsyncSessionLocal() as session:
         await init_db(session)  # Call init_db with the session
+        # Keep the conversation id pool filled in the background
+        id_pool_task = asyncio.create_task(run_id_pool())
+        # Apply the logging settings changed on PUT /logging in any worker
+        log_settings_task = asyncio.create_task(run_log_settings_sync())
+        pool_metrics_task = asyncio.create_task(run_pool_metrics())
+        # Insert Conversation rows in batches, after recovering any a crash left behind
+        await conversation_writer.start()
         yield
+        await conversation_writer.stop()
+        pool_metrics_task.cancel()
+        log_settings_task.cancel()
+        id_pool_task.cancel()
+    await close_redis()
+    mark_worker_dead()
     logger.info("FAST API: Stopping the app")  # Log stopping the app
 
 config_data = {
@@ -58,6 +88,14 @@ app.add_middleware(
 
 app.add_middleware(AuthMiddleware)
 
+if DB_QUERY_COUNTING:
+    app.add_middleware(QueryCountMiddleware)
+
+app.add_middleware(MetricsMiddleware)
+
+# Outermost, so every log line of a request carries its id
+app.add_middleware(RequestIdMiddleware)
+
 # OAuth client setup
 oauth = OAuth()
 
@@ -79,8 +117,28 @@ admin.mount_to(app)
 async def health_check():
     return {"status": "ok", "message" : "Voiceagent API Server"}
 
+@app.get("/metrics", tags=["health"], include_in_schema=False)
+async def metrics():
+    return Response(generate_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/logging", tags=["health"], dependencies=[Depends(check_if_admin)])
+async def logging_settings():
+    """The logging settings of the worker answering"""
+    return {**current_settings(), "worker_pid": os.getpid()}
+
+@app.put("/logging", tags=["health"], dependencies=[Depends(check_if_admin)])
+async def update_logging_settings(sql_echo: Optional[bool] = None, debug_sample_rate: Optional[float] = None):
+    """Switch SQL statement logging and the debug log sample rate, at once in the worker
+    answering and within LOG_SETTINGS_SYNC_INTERVAL seconds in the others"""
+    await update_settings(sql_echo, debug_sample_rate)
+    return await logging_settings()
+
 app.include_router(user_router, prefix=login_app, tags=["users"])
 app.include_router(conversation_router, prefix=conversation_app, tags=["conversations"])
+app.include_router(conversation_ws_router, prefix=conversation_app, tags=["conversations"])
+app.include_router(bulk_router, prefix=conversation_app, tags=["conversations"])
+app.include_router(export_router, prefix=conversation_app, tags=["conversations"])
+app.include_router(review_router, prefix=conversation_app, tags=["reviews"])
 # app.include_router(tasks_router, prefix="/tasks", tags=["tasks"])
 
 ######################## INIT DB ########################
@@ -94,7 +152,7 @@ async def init_db(session: AsyncSession):
     logger.info(f"Existing user: {existing_user}")
 
     if existing_user is None:
-        hashed_password = get_password_hash(DEFAULT_ADMIN_PASSWORD)
+        hashed_password = await get_password_hash(DEFAULT_ADMIN_PASSWORD)
         user = UserModel(
             username=DEFAULT_ADMIN_USERNAME,
             email=DEFAULT_ADMIN_EMAIL,
@@ -1,6 +1,6 @@
-from fastapi import Request
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.requests import HTTPConnection
+from starlette.responses import JSONResponse
+from starlette.websockets import WebSocketClose
 import starlette.status as status_code
 import jwt
 from sqlalchemy.future import select
@@ -8,74 +8,101 @@ from app.users_app.schemas import AnonymousUserSchema, UserSchema
 from app.users_app.models import UserModel
 from app.utils.security import login_url
 from app.settings import SETTINGS, logger, AsyncSessionLocal
+from app.utils.metrics import STAGE_SECONDS
+from app.utils.auth_cache import get_cached_user, user_generation, cache_user
 
+# Served to anyone, requests to these never look at the Authorization header
+PUBLIC_PATHS = ("/", "/media", login_url)
+PUBLIC_PREFIXES = ("/media/",)
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        authorization: str = request.headers.get('Authorization')
-        logger.info(f"Authorization: {authorization}")
-        logger.info(f"Request: {request.url.path}")
 
-        # Special case for the login path
-        if request.url.path == login_url:
-            request.state.user = AnonymousUserSchema()
-            request.state.is_authenticated = False
-            response = await call_next(request)
-            return response
+class InvalidToken(Exception):
+    """Rejected credentials, the message is the 401 response body"""
+
+
+async def authenticate(authorization: str) -> UserSchema:
+    """The user a 'Bearer <token>' Authorization value belongs to"""
+    try:
+        scheme, token = authorization.split()
+        if scheme.lower() != 'bearer':
+            raise InvalidToken("Invalid Authorization header")
+
+        payload = jwt.decode(
+            token, SETTINGS.SECRET_KEY.get_secret_value(), algorithms=[SETTINGS.ALGORITHM])
+        user_id = int(payload.get("sub"))
+    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, ValueError, TypeError) as e:
+        logger.error(f"Error: {e}")
+        raise InvalidToken("Invalid or expired token")
+
+    logger.debug(f"User ID: {user_id}")
+
+    user_schema = await get_cached_user(user_id, token)
+    if user_schema is None:
+        generation = await user_generation(user_id)
+        with STAGE_SECONDS.labels("auth_user_query").time():
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(select(UserModel).where(UserModel.id == user_id))
+                user = result.scalars().first()
+                await session.commit()
+
+        if user is None or user.token != token:
+            logger.info(f"Invalid token for user {user_id}")
+            raise InvalidToken("Invalid token")
+
+        user_schema = UserSchema.model_validate(user, from_attributes=True)
+        await cache_user(user_id, token, user_schema, payload.get("exp", 0), generation)
+
+    logger.debug(f"User: {user_schema.username}")
+    return user_schema
+
+
+class AuthMiddleware:
+    """Sets request.state.user and request.state.is_authenticated.
+
+    Requests without credentials get the anonymous user, a bearer token that
+    doesn't check out is answered with 401 (WebSockets are closed with 1008
+    before the handshake completes). Browsers can't set headers on WebSockets,
+    so those can pass the token as ?token= instead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        state = scope.setdefault("state", {})
+        path = scope["path"]
+        state["user"] = AnonymousUserSchema()
+        state["is_authenticated"] = False
+        if path in PUBLIC_PATHS or path.startswith(PUBLIC_PREFIXES):
+            return await self.app(scope, receive, send)
+
+        connection = HTTPConnection(scope)
+        authorization = connection.headers.get('Authorization')
+        if not authorization and scope["type"] == "websocket" and connection.query_params.get("token"):
+            authorization = f"Bearer {connection.query_params['token']}"
+        logger.debug(f"Request: {path}")
 
         if authorization:
-            logger.info(f"Authorization: {authorization}")
             try:
-                scheme, token = authorization.split()
-                if scheme.lower() != 'bearer':
-                    return JSONResponse(
-                        status_code=status_code.HTTP_401_UNAUTHORIZED,
-                        content="Invalid Authorization header",
-                        headers={"WWW-Authenticate": "Bearer"}
-                    )
-
-                payload = jwt.decode(
-                    token, SETTINGS.SECRET_KEY.get_secret_value(), algorithms=[SETTINGS.ALGORITHM])
-                user_id = int(payload.get("sub"))
-
-                if user_id is None:
-                    return JSONResponse(
-                        status_code=status_code.HTTP_401_UNAUTHORIZED,
-                        content="Invalid token",
-                        headers={"WWW-Authenticate": "Bearer"}
-                    )
-                    
-                logger.info(f"User ID: {user_id}")
-                    
-                async with AsyncSessionLocal() as session:
-                    result = await session.execute(select(UserModel).where(UserModel.id == user_id))
-                    user = result.scalars().first()
-                    await session.commit()
-
-                logger.info(f"User: {user.username}")
-                if user is None or user.token != token:
-                    logger.info(f"Invalid token {user.token != token}")
-                    return JSONResponse(
-                        status_code=status_code.HTTP_401_UNAUTHORIZED,
-                        content="Invalid token",
-                        headers={"WWW-Authenticate": "Bearer"}
-                    )
-
-                request.state.user = UserSchema.model_validate(user, from_attributes=True)
-                request.state.is_authenticated = True
-
-            except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, ValueError) as e:
-                logger.error(f"Error: {e}")
-                return JSONResponse(
-                    status_code=status_code.HTTP_401_UNAUTHORIZED,
-                    content="Invalid or expiredtoken",
-                    headers={"WWW-Authenticate": "Bearer"}
-                )
-
+                state["user"] = await authenticate(authorization)
+                state["is_authenticated"] = True
+            except InvalidToken as e:
+                return await self.reject(scope, receive, send, str(e))
         else:
-            logger.info("Authentication token not found")
-            request.state.user = AnonymousUserSchema()  # Return anonymous user
-            request.state.is_authenticated = False
+            logger.debug("Authentication token not found")
 
-        response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
+
+    async def reject(self, scope, receive, send, detail: str):
+        if scope["type"] == "websocket":
+            response = WebSocketClose(code=status_code.WS_1008_POLICY_VIOLATION, reason=detail)
+        else:
+            response = JSONResponse(
+                status_code=status_code.HTTP_401_UNAUTHORIZED,
+                content=detail,
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+        await response(scope, receive, send)
@@ -0,0 +1,41 @@
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from app.settings import async_engine
+
+# Counts the SQL statements run while handling a request and reports them in the
+# X-DB-Queries response header, for load tests. The counter is a mutable list so
+# tasks spawned by the request (which get a copy of the context) share it.
+
+_query_count: ContextVar[Optional[list[int]]] = ContextVar("query_count", default=None)
+
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_count.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+class QueryCountMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        counter = [0]
+        token = _query_count.set(counter)
+
+        async def send_with_count(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(counter[0]).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _query_count.reset(token)
@@ -0,0 +1,37 @@
+import re
+import uuid
+from app.utils.log import request_id_var, debug_sampled_var, sample_debug
+
+REQUEST_ID_HEADER = b"x-request-id"
+# Ids from clients or proxies are reused, as long as they look like ids
+_VALID_REQUEST_ID = re.compile(r"[\w.:-]{1,64}")
+
+
+class RequestIdMiddleware:
+    """Tags the logs of a request (or WebSocket) with its id, returned in X-Request-ID"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        request_id = dict(scope["headers"]).get(REQUEST_ID_HEADER, b"").decode("latin-1")
+        if not _VALID_REQUEST_ID.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        id_token = request_id_var.set(request_id)
+        sampled_token = debug_sampled_var.set(sample_debug())
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((REQUEST_ID_HEADER, request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(id_token)
+            debug_sampled_var.reset(sampled_token)
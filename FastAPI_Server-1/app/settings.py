@@ -6,7 +6,7 @@ from pydantic.types import SecretStr
 from pydantic_settings import BaseSettings
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-import redis
+from app.utils.log import configure_logging
 
 #################################### ENV VARAIBLES #####################################
 
@@ -34,7 +34,13 @@ SETTINGS = _Settings()
 DATABASE_URL = f"postgresql+asyncpg://{os.getenv('SQL_USER')}:{os.getenv('SQL_PASSWORD')}@{os.getenv('SQL_HOST', 'db')}/{os.getenv('SQL_DATABASE')}"
 
 # SQLAlchemy engine for syncing operations
-async_engine = create_async_engine(DATABASE_URL, echo=True)
+async_engine = create_async_engine(DATABASE_URL)
+
+# Log every SQL statement (through the log queue), can be switched at runtime on PUT /logging
+SQL_ECHO = os.getenv('SQL_ECHO', 'false').lower() == 'true'
+
+# Report the SQL statements of every request in an X-DB-Queries header (load testing)
+DB_QUERY_COUNTING = os.getenv('DB_QUERY_COUNTING', 'false').lower() == 'true'
 
 # Create a configured "Session" class
 AsyncSessionLocal = async_sessionmaker(
@@ -53,7 +59,12 @@ class Base(DeclarativeBase):
 
 ######################################### REDIS ############################################
 REDIS_HOST = os.getenv('REDIS_HOST', 'redis')
-REDIS_PORT = os.getenv('REDIS_PORT', 6379)
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+# Connections of the asyncio client (app.utils.redis_pool) per worker, a command waits
+# up to REDIS_POOL_TIMEOUT for a free one and REDIS_SOCKET_TIMEOUT for Redis to answer
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 1))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 1))
 
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379")
 CELERY_RESULT_BACKEND = os.getenv(
@@ -64,6 +75,19 @@ EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.gmail.com")
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "team@voiceagent.dev")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "abcd1234")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "mapit.automaton@gmail.com")
+# 'ssl' or 'starttls' (the default for ports 465 and 587), 'none' only for a local test server
+EMAIL_SECURITY = os.getenv("EMAIL_SECURITY", "")
+EMAIL_TIMEOUT = float(os.getenv("EMAIL_TIMEOUT", 10))
+
+# SMTP sessions kept open per Celery worker process, replaced after EMAIL_CONNECTION_MAX_MESSAGES
+# messages or EMAIL_CONNECTION_MAX_IDLE idle seconds (servers drop idle sessions)
+EMAIL_POOL_SIZE = int(os.getenv("EMAIL_POOL_SIZE", 2))
+EMAIL_CONNECTION_MAX_MESSAGES = int(os.getenv("EMAIL_CONNECTION_MAX_MESSAGES", 100))
+EMAIL_CONNECTION_MAX_IDLE = float(os.getenv("EMAIL_CONNECTION_MAX_IDLE", 60))
+# Queued emails are sent together, up to EMAIL_BATCH_SIZE per session, EMAIL_BATCH_WINDOW
+# seconds after the first one was queued
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 50))
+EMAIL_BATCH_WINDOW = float(os.getenv("EMAIL_BATCH_WINDOW", 1))
 
 DEFAULT_ADMIN_EMAIL = os.getenv("DEFAULT_ADMIN_EMAIL")
 DEFAULT_ADMIN_USERNAME = os.getenv("DEFAULT_ADMIN_USERNAME")
@@ -77,14 +101,125 @@ AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
 # AWS_S3_REGION_NAME = os.environ.get('AWS_S3_REGION_NAME')
 # AWS_S3_CUSTOM_DOMAIN = f'{AWS_STORAGE_BUCKET_NAME}.s3.amazonaws.com'
 
-redis_client = redis.Redis(
-    host=REDIS_HOST,
-    port=REDIS_PORT,
-    db=0)
+########################################## AUTH ############################################
+# Users verified by AuthMiddleware are cached per worker and in Redis, so steady-state
+# auth needs no database query. Changed users and rotated tokens are dropped from Redis
+# at once, other workers can keep accepting the old state for AUTH_CACHE_LOCAL_TTL seconds
+AUTH_CACHE_ENABLED = os.getenv('AUTH_CACHE_ENABLED', 'true').lower() == 'true'
+AUTH_CACHE_REDIS = os.getenv('AUTH_CACHE_REDIS', 'true').lower() == 'true'
+AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 300))
+AUTH_CACHE_LOCAL_TTL = float(os.getenv('AUTH_CACHE_LOCAL_TTL', 10))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_CACHE_MAX_ENTRIES', 10000))
+
+# bcrypt runs on this many threads, logins beyond PASSWORD_HASH_MAX_PENDING waiting get a 503
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 64))
 
 ######################################## OPENAI Key ########################################
 OPENAI_KEY = os.getenv('OPENAI_KEY')
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o')
+# Point the client at an OpenAI compatible server, e.g. app.loadtest.fake_openai
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL')
+
+###################################### ORDER PARSING #######################################
+# Simple chunks are parsed locally and only fall back to OpenAI below this confidence
+LOCAL_PARSER_ENABLED = os.getenv('LOCAL_PARSER_ENABLED', 'true').lower() == 'true'
+LOCAL_PARSER_MIN_CONFIDENCE = float(os.getenv('LOCAL_PARSER_MIN_CONFIDENCE', 1.0))
+
+# Redis cache of OpenAI results for repeated chunks against the same order state
+ORDER_CACHE_ENABLED = os.getenv('ORDER_CACHE_ENABLED', 'true').lower() == 'true'
+ORDER_CACHE_TTL = int(os.getenv('ORDER_CACHE_TTL', 24 * 60 * 60))
+ORDER_CACHE_MAX_ENTRIES = int(os.getenv('ORDER_CACHE_MAX_ENTRIES', 100000))
+
+# Pre-generated conversation ids, refilled in the background below the low watermark
+CONVERSATION_ID_POOL_SIZE = int(os.getenv('CONVERSATION_ID_POOL_SIZE', 1000))
+CONVERSATION_ID_POOL_LOW_WATERMARK = int(os.getenv('CONVERSATION_ID_POOL_LOW_WATERMARK', 200))
+CONVERSATION_ID_REFILL_INTERVAL = float(os.getenv('CONVERSATION_ID_REFILL_INTERVAL', 30))
+# Ids handed out are remembered in a Bloom filter of this many bits (16 MB, about
+# 1% false positives at 14 million ids, a false positive only skips a fresh id)
+CONVERSATION_ID_BLOOM_BITS = int(os.getenv('CONVERSATION_ID_BLOOM_BITS', 2 ** 27))
+CONVERSATION_ID_BLOOM_HASHES = int(os.getenv('CONVERSATION_ID_BLOOM_HASHES', 7))
+
+# Interim transcripts sent over the WebSocket are processed ahead of the final one,
+# once they stop changing for SPECULATION_DELAY seconds
+SPECULATION_ENABLED = os.getenv('SPECULATION_ENABLED', 'true').lower() == 'true'
+SPECULATION_DELAY = float(os.getenv('SPECULATION_DELAY', 0.3))
+
+# A WebSocket connection owns the active order session for this many seconds, renewed
+# by its chunks, HTTP chunks for the session are turned away in the meantime
+ORDER_SESSION_LEASE = int(os.getenv('ORDER_SESSION_LEASE', 60))
+
+# Orders processed at once by the bulk endpoint and CLI
+BULK_CONCURRENCY = int(os.getenv('BULK_CONCURRENCY', 8))
+BULK_MAX_CONCURRENCY = int(os.getenv('BULK_MAX_CONCURRENCY', 16))
+
+################################### CONVERSATION WRITES ####################################
+# Conversation rows are inserted in the background, in batches of up to
+# CONVERSATION_BATCH_SIZE rows collected for at most CONVERSATION_FLUSH_INTERVAL seconds
+CONVERSATION_BATCH_SIZE = int(os.getenv('CONVERSATION_BATCH_SIZE', 200))
+CONVERSATION_FLUSH_INTERVAL = float(os.getenv('CONVERSATION_FLUSH_INTERVAL', 0.2))
+
+# Rows not yet inserted are kept here and inserted on the next start after a crash,
+# it should be on a volume that outlives the container (conversation_spool in prod)
+CONVERSATION_SPOOL_DIR = os.getenv(
+    'CONVERSATION_SPOOL_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'spool'))
+
+####################################### LLM GATEWAY ########################################
+# uvicorn worker processes, uvicorn takes --workers from WEB_CONCURRENCY too. Every
+# worker has its own gateway, the limits below are for the whole server and each
+# worker enforces its share of them (the LLM_WORKER_* values)
+WEB_CONCURRENCY = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+
+# OpenAI calls running at once, and waiting for a slot before new ones fail fast
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 16))
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', 32))
+LLM_WORKER_MAX_CONCURRENCY = max(1, LLM_MAX_CONCURRENCY // WEB_CONCURRENCY)
+LLM_WORKER_MAX_QUEUE = LLM_MAX_QUEUE // WEB_CONCURRENCY
+
+# Seconds a request may spend on the LLM, clients can ask for less or more with X-Request-Timeout
+LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', 10))
+LLM_MAX_REQUEST_TIMEOUT = float(os.getenv('LLM_MAX_REQUEST_TIMEOUT', 30))
+
+# Stop calling OpenAI for a cooldown when this share of the calls in the window failed.
+# Every worker's breaker judges the calls of that worker, about 1/WEB_CONCURRENCY of them
+LLM_BREAKER_WINDOW = float(os.getenv('LLM_BREAKER_WINDOW', 30))
+LLM_BREAKER_MIN_REQUESTS = int(os.getenv('LLM_BREAKER_MIN_REQUESTS', 10))
+LLM_WORKER_BREAKER_MIN_REQUESTS = max(1, -(-LLM_BREAKER_MIN_REQUESTS // WEB_CONCURRENCY))
+LLM_BREAKER_ERROR_RATE = float(os.getenv('LLM_BREAKER_ERROR_RATE', 0.5))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', 30))
+
+################################## LIST PAGES AND EXPORTS ##################################
+# Rows per page of the list endpoints, when the client asks for none and at most
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', 50))
+PAGE_MAX_SIZE = int(os.getenv('PAGE_MAX_SIZE', 500))
+
+# Rows fetched from the database cursor and written out at once by the conversation
+# export, which bounds its memory whatever the number of rows exported
+EXPORT_BATCH_ROWS = int(os.getenv('EXPORT_BATCH_ROWS', 5000))
+
+######################################### REVIEWS ##########################################
+# Conversations handed to a reviewer at once, and seconds they stay theirs before
+# they can be handed to someone else
+REVIEW_BATCH_SIZE = int(os.getenv('REVIEW_BATCH_SIZE', 20))
+REVIEW_MAX_BATCH_SIZE = int(os.getenv('REVIEW_MAX_BATCH_SIZE', 100))
+REVIEW_LEASE_SECONDS = int(os.getenv('REVIEW_LEASE_SECONDS', 600))
+
+######################################### METRICS ##########################################
+# Directory the uvicorn workers write their metrics to, /metrics serves them summed over
+# all workers (prometheus_client multiprocess mode). Needed with more than one worker,
+# and emptied before they start (docker-compose.prod.yml)
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+# Seconds between updates of the connection pool gauges of each worker
+DB_POOL_METRICS_INTERVAL = float(os.getenv('DB_POOL_METRICS_INTERVAL', 5))
 
 ######################################### LOGGING ##########################################
-logging.basicConfig(level=logging.INFO)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# 'json' (one object per line, with the request id) or 'text'
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+# Share of requests whose debug logs are kept, can be changed at runtime on PUT /logging
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', 0))
+# Seconds until a change on PUT /logging reaches every worker
+LOG_SETTINGS_SYNC_INTERVAL = float(os.getenv('LOG_SETTINGS_SYNC_INTERVAL', 5))
+
+configure_logging(LOG_LEVEL, LOG_FORMAT, LOG_DEBUG_SAMPLE_RATE, SQL_ECHO)
 logger = logging.getLogger(__name__)    # Used for logging in other files
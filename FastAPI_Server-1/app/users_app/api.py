@@ -1,14 +1,18 @@
-from fastapi import APIRouter, HTTPException, Request, Depends
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Response, Depends, Query
 import starlette.status as status_code
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 import jwt
+from redis.asyncio import Redis
 from app.utils.db_base import get_db
-from .schemas import AnonymousUserSchema, UserSchema, RegisterUserSchema, TokenSchema, VerifyUserSchema
+from app.utils.redis_pool import get_redis
+from .schemas import AnonymousUserSchema, UserSchema, UserPageSchema, RegisterUserSchema, TokenSchema, VerifyUserSchema
 from .models import UserModel
 from app.utils.exceptions import InvalidCredentialsException
-from app.settings import logger, SETTINGS
+from app.utils.pagination import parse_fields, keyset_query, page_rows
+from app.settings import logger, SETTINGS, PAGE_SIZE, PAGE_MAX_SIZE
 from app.utils.security import (
     get_password_hash,
     authenticate_user,
@@ -26,7 +30,7 @@ from .tasks import send_verification_email
 user_router = APIRouter()
 
 @user_router.post("/register")
-async def register_user(user: RegisterUserSchema, session: AsyncSession = Depends(get_db)):
+async def register_user(user: RegisterUserSchema, session: AsyncSession = Depends(get_db), redis: Redis = Depends(get_redis)):
     # Check if the user already exists
     existing_user = await session.execute(select(UserModel).where(UserModel.email == user.email))
     if existing_user.scalars().first():
@@ -40,7 +44,7 @@ async def register_user(user: RegisterUserSchema, session: AsyncSession = Depend
     new_user = UserModel(
         username=user.username,
         email=user.email,
-        hashed_password=get_password_hash(user.password.get_secret_value()),
+        hashed_password=await get_password_hash(user.password.get_secret_value()),
         full_name=user.full_name,
         is_admin=user.is_admin or False,
         is_verified=False  # Initially unverified
@@ -54,7 +58,7 @@ async def register_user(user: RegisterUserSchema, session: AsyncSession = Depend
         user.email, verification_code)
 
     # Store the token with redis
-    store_verification_token_for_user(user.email, verification_token)
+    await store_verification_token_for_user(redis, user.email, verification_token)
 
     # Send the verification code in the email
     send_verification_email.delay(user.email, verification_code)
@@ -63,7 +67,7 @@ async def register_user(user: RegisterUserSchema, session: AsyncSession = Depend
 
 
 @user_router.post("/verify")
-async def verify_user(verify_user: VerifyUserSchema, session: AsyncSession = Depends(get_db)):
+async def verify_user(verify_user: VerifyUserSchema, session: AsyncSession = Depends(get_db), redis: Redis = Depends(get_redis)):
     email = verify_user.email
     code = verify_user.code
     result = await session.execute(select(UserModel).where(UserModel.email == email))
@@ -78,7 +82,7 @@ async def verify_user(verify_user: VerifyUserSchema, session: AsyncSession = Dep
             status_code=status_code.HTTP_400_BAD_REQUEST, detail="User is already verified")
 
     # Retrieve the JWT token for verification
-    token = get_verification_token_for_user(email)
+    token = await get_verification_token_for_user(redis, email)
 
     try:
         payload = jwt.decode(token, SETTINGS.SECRET_KEY.get_secret_value(),
@@ -122,12 +126,31 @@ async def login_user(form_data: OAuth2PasswordRequestForm = Depends(), session:
 @user_router.get("/me", response_model=UserSchema | AnonymousUserSchema)
 async def whoami(request: Request):
     user = request.state.user
-    logger.info(f"Type of User: {type(user).__name__}")
+    logger.debug(f"Type of User: {type(user).__name__}")
     return user
 
 
-@user_router.get("/users", response_model=list[UserSchema], dependencies=[Depends(check_if_admin)])
-async def list_users(session: AsyncSession = Depends(get_db)):
-    result = await session.execute(select(UserModel))
-    users = result.scalars().all()
-    return users
+USER_FIELDS = tuple(UserSchema.model_fields)
+USER_KEYS = (UserModel.id,)
+
+
+@user_router.get("/users", response_model=UserPageSchema, dependencies=[Depends(check_if_admin)])
+async def list_users(
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_MAX_SIZE),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, all by default"),
+    is_admin: Optional[bool] = None,
+    is_verified: Optional[bool] = None,
+    session: AsyncSession = Depends(get_db)
+):
+    selected = parse_fields(fields, USER_FIELDS)
+    query = select(UserModel)
+    if is_admin is not None:
+        query = query.where(UserModel.is_admin == is_admin)
+    if is_verified is not None:
+        query = query.where(UserModel.is_verified == is_verified)
+
+    result = await session.execute(keyset_query(UserModel, selected, USER_KEYS, query, cursor, (int,), limit))
+    items, next_cursor = page_rows(result.mappings().all(), selected, USER_KEYS, limit)
+    page = UserPageSchema(items=items, next_cursor=next_cursor)
+    return Response(page.model_dump_json(exclude_unset=True), media_type="application/json")
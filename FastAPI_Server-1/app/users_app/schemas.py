@@ -47,6 +47,19 @@ class UserSchema(BaseSchema):
     is_admin: bool
     is_verified: bool
 
+# A page of /users, with only the fields asked for
+class UserFieldsSchema(UserSchema):
+    id: Optional[int] = None
+    username: Optional[str] = None
+    email: Optional[EmailStr] = None
+    full_name: Optional[str] = None
+    is_admin: Optional[bool] = None
+    is_verified: Optional[bool] = None
+
+class UserPageSchema(BaseSchema):
+    items: list[UserFieldsSchema]
+    next_cursor: Optional[str] = None
+
 # Schema for anonymous user defaults
 class AnonymousUserSchema(BaseSchema):
     username: str = "anonymous"
@@ -1,44 +1,195 @@
+import json
+import uuid
 import smtplib
-import ssl
+from typing import Callable, Optional
 from email.message import EmailMessage
-from app.settings import logger, EMAIL_HOST, EMAIL_HOST_PASSWORD, EMAIL_HOST_USER, EMAIL_PORT, DEFAULT_FROM_EMAIL
+from celery.signals import worker_process_shutdown
+from app.settings import logger, DEFAULT_FROM_EMAIL, EMAIL_BATCH_SIZE, EMAIL_BATCH_WINDOW
 from app.celery import celery
+from app.utils.redis_pool import get_sync_redis_client
+from app.utils.smtp_pool import SMTPPool, get_smtp_pool, close_smtp_pool
 
-# Sending verification code
-def send_mail(subject: str, message: str, user_emails: list[str]):
-    port = int(EMAIL_PORT)
-    smtp_server = EMAIL_HOST
-    username = EMAIL_HOST_USER
-    password = EMAIL_HOST_PASSWORD
+# Emails queued with queue_mail wait in a Redis list for EMAIL_BATCH_WINDOW
+# seconds, then one drain_email_outbox task sends everything queued so far over
+# a single SMTP session, instead of one task and one session per email.
+#
+# A batch is moved (LMOVE) to the processing list of the drain while it is sent
+# and every email is removed from there once it was, so an SMTP failure or a
+# worker dying mid-batch loses nothing: the emails not sent go back to the front
+# of the outbox, and the next drain starts with whatever dead ones left in their
+# processing lists. A crash between sending an email and its removal sends that
+# email again.
+#
+# One drain runs at a time, the one holding the drain lock (its token). The lock
+# is renewed with every email sent, so it only runs out on a drain that is gone,
+# and a drain that finds it taken by another one stops before sending anything more.
+OUTBOX_KEY = "email:outbox"
+# One per drain, "email:outbox:processing:<token>"
+PROCESSING_KEY = "email:outbox:processing"
+DRAIN_LOCK_KEY = "email:outbox:drain_lock"
+DRAIN_LOCK_TTL = 60
+# Set from the moment a drain is scheduled until it found the outbox empty, so
+# queue_mail schedules one drain at a time, expires in case the task is lost
+DRAIN_SCHEDULED_KEY = "email:outbox:drain_scheduled"
+DRAIN_SCHEDULED_TTL = 60
+
+# KEYS: lock, processing list  ARGV: token, lock ttl
+# Renew the lock of the drain (taken again if it ran out and nobody took it) and
+# drop the email sent from the front of its processing list, 0 if the lock is
+# someone else's
+ACKNOWLEDGE_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner and owner ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('LPOP', KEYS[2])
+return 1
+"""
+
+# KEYS: lock, processing list, outbox  ARGV: token
+# Put the unsent emails of the drain back at the front of the outbox, in order,
+# unless another drain holds the lock (and did so already)
+GIVE_BACK_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+while redis.call('LMOVE', KEYS[2], KEYS[3], 'RIGHT', 'LEFT') do end
+return 1
+"""
 
-    # Create the email message
+# KEYS: lock  ARGV: token
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def build_message(subject: str, message: str, user_emails: list[str]) -> EmailMessage:
     msg = EmailMessage()
     msg['Subject'] = subject
     msg['From'] = DEFAULT_FROM_EMAIL
     msg['To'] = user_emails # Supports List of email addresses
     msg.set_content(message)
+    return msg
 
-    try:
-        # Handling SSL and TLS based on the port number
-        if port == 465:
-            context = ssl.create_default_context()
-            with smtplib.SMTP_SSL(smtp_server, port, context=context) as server:
-                server.login(username, password)
-                server.send_message(msg)
-        elif port == 587:
-            with smtplib.SMTP(smtp_server, port) as server:
-                server.starttls()  # Secure the connection with TLS
-                server.login(username, password)
-                server.send_message(msg)
-        else:
-            logger.error(f"Invalid port number: {port}. Use 465 (SSL) or 587 (TLS).")
-            return
 
+# Sending verification code
+def send_mail(subject: str, message: str, user_emails: list[str]):
+    try:
+        with get_smtp_pool().connection() as smtp:
+            smtp.send_message(build_message(subject, message, user_emails))
         logger.info("Email sent successfully.")
 
-    except smtplib.SMTPException as e:
+    except (smtplib.SMTPException, OSError, ValueError) as e:
         logger.error(f"Failed to send email: {e}")
 
+
+def send_batch(emails: list[dict], pool: Optional[SMTPPool] = None,
+               acknowledge: Optional[Callable[[], bool]] = None) -> list[dict]:
+    """Sends the emails over one session, returns the ones left unsent because the server can't be used.
+
+    acknowledge() is called once each email is done with (sent, or refused for
+    good), the batch stops when it returns False and the rest is returned.
+    """
+    with (pool or get_smtp_pool()).connection() as smtp:
+        for index, email in enumerate(emails):
+            try:
+                smtp.send_message(build_message(email["subject"], email["message"], email["to"]))
+            except smtplib.SMTPRecipientsRefused as e:
+                # Retrying won't help this email, but the session can go on
+                logger.error(f"Email to {email['to']} refused: {e.recipients}")
+            except smtplib.SMTPDataError as e:
+                if e.smtp_code < 500:
+                    logger.error(f"Failed to send email: {e}")
+                    return emails[index:]
+                logger.error(f"Email to {email['to']} rejected: {e}")
+            except (smtplib.SMTPException, OSError, ValueError) as e:
+                logger.error(f"Failed to send email: {e}")
+                return emails[index:]
+            if acknowledge is not None and not acknowledge():
+                return emails[index + 1:]
+    logger.info(f"Sent {len(emails)} emails.")
+    return []
+
+
+def queue_mail(subject: str, message: str, user_emails: list[str]):
+    redis = get_sync_redis_client()
+    redis.rpush(OUTBOX_KEY, json.dumps({"subject": subject, "message": message, "to": user_emails}))
+    if redis.set(DRAIN_SCHEDULED_KEY, 1, nx=True, ex=DRAIN_SCHEDULED_TTL):
+        drain_email_outbox.apply_async(countdown=EMAIL_BATCH_WINDOW)
+
+
+def requeue_processing(redis, own_key: str):
+    """Put the emails of the batches dead drains left back at the front of the outbox, in order"""
+    for key in list(redis.scan_iter(match=f"{PROCESSING_KEY}*")):
+        if key.decode() == own_key:
+            continue
+        while redis.lmove(key, OUTBOX_KEY, "RIGHT", "LEFT") is not None:
+            pass
+
+
+def take_batch(redis, processing_key: str) -> list[bytes]:
+    """Move the next EMAIL_BATCH_SIZE emails of the outbox to the processing list"""
+    with redis.pipeline(transaction=False) as pipe:
+        for _ in range(EMAIL_BATCH_SIZE):
+            pipe.lmove(OUTBOX_KEY, processing_key, "LEFT", "RIGHT")
+        return [email for email in pipe.execute() if email is not None]
+
+
+@celery.task(name="drain_email_outbox", bind=True, max_retries=8)
+def drain_email_outbox(self):
+    redis = get_sync_redis_client()
+    token = uuid.uuid4().hex
+    if not redis.set(DRAIN_LOCK_KEY, token, nx=True, ex=DRAIN_LOCK_TTL):
+        # Another drain is sending, this one comes back once it may be done
+        drain_email_outbox.apply_async(countdown=EMAIL_BATCH_WINDOW)
+        return
+    processing_key = f"{PROCESSING_KEY}:{token}"
+    owned = True
+
+    def acknowledge() -> bool:
+        nonlocal owned
+        owned = bool(redis.eval(ACKNOWLEDGE_SCRIPT, 2, DRAIN_LOCK_KEY, processing_key, token, DRAIN_LOCK_TTL))
+        return owned
+
+    try:
+        # No other drain is running, any processing list is a dead drain's
+        requeue_processing(redis, processing_key)
+        while True:
+            redis.expire(DRAIN_SCHEDULED_KEY, DRAIN_SCHEDULED_TTL)
+            batch = take_batch(redis, processing_key)
+            if not batch:
+                # Emails queued from here on schedule the next drain
+                redis.delete(DRAIN_SCHEDULED_KEY)
+                # One queued before the delete did not
+                if redis.llen(OUTBOX_KEY) and redis.set(DRAIN_SCHEDULED_KEY, 1, nx=True, ex=DRAIN_SCHEDULED_TTL):
+                    continue
+                return
+
+            unsent = send_batch([json.loads(email) for email in batch], acknowledge=acknowledge)
+            if not owned:
+                # The lock ran out while this drain was stuck, the drain holding
+                # it now has put this one's batch back in the outbox
+                logger.error("Email drain lost its lock to another drain, stopping")
+                return
+            if unsent:
+                # Back at the front of the outbox, in order, for the retry
+                redis.eval(GIVE_BACK_SCRIPT, 3, DRAIN_LOCK_KEY, processing_key, OUTBOX_KEY, token)
+                countdown = min(5 * 2 ** self.request.retries, 300)
+                if self.request.retries < self.max_retries:
+                    # No other drain until the retry has run
+                    redis.expire(DRAIN_SCHEDULED_KEY, countdown + DRAIN_SCHEDULED_TTL)
+                else:
+                    # Giving up, the next email queued schedules a new drain
+                    redis.delete(DRAIN_SCHEDULED_KEY)
+                raise self.retry(countdown=countdown)
+    finally:
+        redis.eval(RELEASE_SCRIPT, 1, DRAIN_LOCK_KEY, token)
+
+
 @celery.task(name="send_verification_email")
 def send_verification_email(email: str, verification_code: str):
     subject = "Your Email Verification Code"
@@ -54,4 +205,9 @@ def send_verification_email(email: str, verification_code: str):
     Best regards,
     Team Voiceagent
     """
-    send_mail(subject, message, [email])
\ No newline at end of file
+    queue_mail(subject, message, [email])
+
+
+@worker_process_shutdown.connect
+def close_smtp_connections(**kwargs):
+    close_smtp_pool()
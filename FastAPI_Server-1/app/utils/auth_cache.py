@@ -0,0 +1,181 @@
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+import redis
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from app.settings import (
+    logger,
+    AUTH_CACHE_ENABLED,
+    AUTH_CACHE_REDIS,
+    AUTH_CACHE_TTL,
+    AUTH_CACHE_LOCAL_TTL,
+    AUTH_CACHE_MAX_ENTRIES,
+)
+from app.users_app.models import UserModel
+from app.users_app.schemas import UserSchema
+from app.utils.metrics import AUTH_CACHE
+from app.utils.redis_pool import get_redis_client
+
+# Users verified by AuthMiddleware, in an LRU of this process and in Redis. An
+# entry belongs to a user id and holds a hash of the token it was verified for,
+# so a rotated token never matches an entry of the old one. Entries expire with
+# the token. Every committed change to a UserModel (login, verification, admin
+# edits) drops the user from both tiers.
+#
+# A user read from the database before such a change can be stored after it was
+# dropped. Each drop bumps a generation, the user's in Redis and the process's
+# own, and an entry is only stored if the generation is still the one taken
+# before the read.
+
+REDIS_PREFIX = "auth_user:"
+GENERATION_PREFIX = "auth_user_generation:"
+# Outlives any database read of the user, an expired generation reads as 0
+GENERATION_TTL = 86400
+
+# KEYS[1] entry, KEYS[2] generation, ARGV generation taken before the read, entry, ttl
+STORE_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[2]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+# user id -> (expires at, token hash, UserSchema fields)
+_local: "OrderedDict[int, tuple[float, str, dict]]" = OrderedDict()
+# Users dropped by this process so far
+_local_generation = 0
+# Redis invalidations still running, referenced so they aren't garbage collected
+_invalidations: set[asyncio.Task] = set()
+
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _remember_locally(user_id: int, token_hash: str, user: dict, expires_at: float):
+    _local[user_id] = (min(expires_at, time.time() + AUTH_CACHE_LOCAL_TTL), token_hash, user)
+    _local.move_to_end(user_id)
+    while len(_local) > AUTH_CACHE_MAX_ENTRIES:
+        _local.popitem(last=False)
+
+
+async def get_cached_user(user_id: int, token: str) -> Optional[UserSchema]:
+    """The user this token was verified for, if it still is"""
+    if not AUTH_CACHE_ENABLED:
+        return None
+    token_hash = _token_hash(token)
+
+    entry = _local.get(user_id)
+    if entry is not None:
+        expires_at, cached_hash, user = entry
+        if expires_at > time.time() and cached_hash == token_hash:
+            _local.move_to_end(user_id)
+            AUTH_CACHE.labels("local").inc()
+            return UserSchema(**user)
+
+    if AUTH_CACHE_REDIS:
+        try:
+            cached = await get_redis_client().get(REDIS_PREFIX + str(user_id))
+        except redis.RedisError as e:
+            # The cache is an optimisation, the database still answers
+            logger.warning(f"Auth cache lookup failed: {str(e)}")
+            cached = None
+        if cached is not None:
+            entry = json.loads(cached)
+            if entry["token"] == token_hash and entry["expires_at"] > time.time():
+                _remember_locally(user_id, token_hash, entry["user"], entry["expires_at"])
+                AUTH_CACHE.labels("redis").inc()
+                return UserSchema(**entry["user"])
+
+    AUTH_CACHE.labels("miss").inc()
+    return None
+
+
+async def user_generation(user_id: int) -> tuple[int, Optional[int]]:
+    """Taken before reading the user from the database, for cache_user"""
+    redis_generation = None
+    if AUTH_CACHE_ENABLED and AUTH_CACHE_REDIS:
+        try:
+            redis_generation = int(await get_redis_client().get(GENERATION_PREFIX + str(user_id)) or 0)
+        except redis.RedisError as e:
+            logger.warning(f"Auth cache generation lookup failed: {str(e)}")
+    return _local_generation, redis_generation
+
+
+async def cache_user(
+    user_id: int, token: str, user: UserSchema, token_expires_at: float, generation: tuple[int, Optional[int]],
+):
+    """Remember a user verified against the database, at most until the token expires.
+
+    generation: user_generation() from before the read, nothing is stored if the user was dropped since.
+    """
+    if not AUTH_CACHE_ENABLED:
+        return
+    ttl = min(AUTH_CACHE_TTL, int(token_expires_at - time.time()))
+    if ttl <= 0:
+        return
+    local_generation, redis_generation = generation
+    token_hash = _token_hash(token)
+    fields = user.model_dump(mode="json")
+    if local_generation == _local_generation:
+        _remember_locally(user_id, token_hash, fields, time.time() + ttl)
+
+    if AUTH_CACHE_REDIS and redis_generation is not None:
+        entry = {"token": token_hash, "user": fields, "expires_at": time.time() + ttl}
+        try:
+            await get_redis_client().eval(
+                STORE_SCRIPT, 2, REDIS_PREFIX + str(user_id), GENERATION_PREFIX + str(user_id),
+                redis_generation, json.dumps(entry), ttl,
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Auth cache store failed: {str(e)}")
+
+
+async def _invalidate_in_redis(user_id: int):
+    try:
+        async with get_redis_client().pipeline(transaction=True) as pipe:
+            pipe.delete(REDIS_PREFIX + str(user_id))
+            pipe.incr(GENERATION_PREFIX + str(user_id))
+            pipe.expire(GENERATION_PREFIX + str(user_id), GENERATION_TTL)
+            await pipe.execute()
+    except redis.RedisError as e:
+        logger.error(f"Auth cache invalidation of user {user_id} failed: {str(e)}")
+
+
+def invalidate_user(user_id: int):
+    """Drop the user from this process at once and from Redis in the background"""
+    global _local_generation
+    _local_generation += 1
+    _local.pop(user_id, None)
+    if AUTH_CACHE_REDIS:
+        try:
+            task = asyncio.get_running_loop().create_task(_invalidate_in_redis(user_id))
+        except RuntimeError:
+            logger.error(f"Auth cache invalidation of user {user_id} outside an event loop, Redis keeps it until it expires")
+            return
+        _invalidations.add(task)
+        task.add_done_callback(_invalidations.discard)
+
+
+@event.listens_for(UserModel, "after_update")
+@event.listens_for(UserModel, "after_delete")
+def _remember_changed_user(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_users", set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop("changed_users", ()):
+        invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_changed_users(session, previous_transaction):
+    session.info.pop("changed_users", None)
@@ -1,7 +1,10 @@
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.settings import AsyncSessionLocal
+from app.utils.metrics import STAGE_SECONDS
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    async with AsyncSessionLocal() as session:
-        yield session
+    # Covers the whole request the session is used for, closing included
+    with STAGE_SECONDS.labels("db_session").time():
+        async with AsyncSessionLocal() as session:
+            yield session
@@ -0,0 +1,121 @@
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+# Logging for the API. Records are put on a queue by the thread that logs them
+# and written by a background thread, so a slow stdout never blocks the event
+# loop. Every record carries the id of the request it was logged for.
+#
+# Debug records are kept for a sampled share of the requests (and never outside
+# of one), which allows debug logging in production without logging every
+# request. The sample rate and SQL statement logging can be changed at runtime.
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+debug_sampled_var: ContextVar[bool] = ContextVar("debug_sampled", default=False)
+
+APP_LOGGER = "app.settings"
+SQL_LOGGER = "sqlalchemy.engine"
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_level = logging.INFO
+_debug_sample_rate = 0.0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+TEXT_FORMATTER = logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records with the request id and drops debug records of unsampled requests"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        if record.levelno < _level:
+            return debug_sampled_var.get()
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only render the message here, formatting happens on the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def sample_debug() -> bool:
+    return _debug_sample_rate > 0 and random.random() < _debug_sample_rate
+
+
+def set_debug_sample_rate(rate: float):
+    """Share of requests (0 to 1) whose debug records are logged"""
+    global _debug_sample_rate
+    _debug_sample_rate = min(max(rate, 0.0), 1.0)
+    # Debug records are only created when some requests are sampled
+    logging.getLogger(APP_LOGGER).setLevel(logging.DEBUG if _debug_sample_rate > 0 else logging.NOTSET)
+
+
+def get_debug_sample_rate() -> float:
+    return _debug_sample_rate
+
+
+def set_sql_echo(enabled: bool):
+    """Log every SQL statement, like create_engine(echo=True) but through the log queue"""
+    logging.getLogger(SQL_LOGGER).setLevel(logging.INFO if enabled else logging.WARNING)
+
+
+def get_sql_echo() -> bool:
+    return logging.getLogger(SQL_LOGGER).isEnabledFor(logging.INFO)
+
+
+def configure_logging(level: str = "INFO", fmt: str = "json", debug_sample_rate: float = 0.0, sql_echo: bool = False):
+    global _level
+    _level = logging.getLevelNamesMapping().get(level.upper(), logging.INFO)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if fmt == "json" else TEXT_FORMATTER)
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    # Write what is still queued on shutdown
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(_level)
+    # Uvicorn sets up its own synchronous handlers before the app is imported
+    for name in UVICORN_LOGGERS:
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+
+    set_debug_sample_rate(debug_sample_rate)
+    set_sql_echo(sql_echo)
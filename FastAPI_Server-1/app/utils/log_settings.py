@@ -0,0 +1,58 @@
+import json
+import asyncio
+from typing import Optional
+import redis
+from fastapi import HTTPException
+import starlette.status as status_code
+from app.settings import logger, LOG_SETTINGS_SYNC_INTERVAL
+from app.utils.redis_pool import get_redis_client
+from app.utils.log import set_sql_echo, get_sql_echo, set_debug_sample_rate, get_debug_sample_rate
+
+# The logging settings changed on PUT /logging apply to every uvicorn worker,
+# not just the one that handled the request: they are stored in Redis and each
+# worker applies them within LOG_SETTINGS_SYNC_INTERVAL seconds, workers
+# started later included. They override SQL_ECHO and LOG_DEBUG_SAMPLE_RATE
+# until changed again.
+
+SETTINGS_KEY = "logging:settings"
+
+
+def current_settings() -> dict:
+    return {"sql_echo": get_sql_echo(), "debug_sample_rate": get_debug_sample_rate()}
+
+
+def apply_settings(settings: dict):
+    if settings.get("sql_echo") is not None and settings["sql_echo"] != get_sql_echo():
+        set_sql_echo(settings["sql_echo"])
+    if settings.get("debug_sample_rate") is not None and settings["debug_sample_rate"] != get_debug_sample_rate():
+        set_debug_sample_rate(settings["debug_sample_rate"])
+
+
+async def update_settings(sql_echo: Optional[bool] = None, debug_sample_rate: Optional[float] = None) -> dict:
+    """Store the changes for every worker and apply them to this one"""
+    changes = {"sql_echo": sql_echo, "debug_sample_rate": debug_sample_rate}
+    changes = {name: value for name, value in changes.items() if value is not None}
+    if changes:
+        try:
+            await get_redis_client().hset(SETTINGS_KEY, mapping={name: json.dumps(value) for name, value in changes.items()})
+        except redis.RedisError as e:
+            raise HTTPException(
+                status_code=status_code.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=f"Logging settings not changed, Redis is unavailable: {str(e)}")
+        apply_settings(changes)
+    return current_settings()
+
+
+async def sync_settings():
+    stored = await get_redis_client().hgetall(SETTINGS_KEY)
+    apply_settings({name.decode(): json.loads(value) for name, value in stored.items()})
+
+
+async def run_log_settings_sync():
+    """Background task: apply the logging settings stored in Redis"""
+    while True:
+        try:
+            await sync_settings()
+        except redis.RedisError as e:
+            logger.warning(f"Could not read the logging settings: {str(e)}")
+        await asyncio.sleep(LOG_SETTINGS_SYNC_INTERVAL)
@@ -0,0 +1,120 @@
+import os
+import glob
+import asyncio
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, multiprocess
+from app.settings import async_engine, PROMETHEUS_MULTIPROC_DIR, DB_POOL_METRICS_INTERVAL
+
+# Prometheus metrics of the ordering hot path, exposed on /metrics.
+# Time a stage with:  with STAGE_SECONDS.labels("openai").time(): ...
+#
+# With PROMETHEUS_MULTIPROC_DIR set every worker writes its metrics there and
+# /metrics serves the sum over all of them, whichever worker answers the scrape.
+# Gauges say how they add up (multiprocess_mode), "livesum" leaves out workers
+# that are gone.
+
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time to the end of the response, by route template",
+    ["method", "route", "status"],
+    buckets=_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled", multiprocess_mode="livesum")
+
+STAGE_SECONDS = Histogram(
+    "order_stage_duration_seconds",
+    "Time spent in each stage of auth, session handling and order processing",
+    ["stage"],
+    buckets=_BUCKETS,
+)
+ORDER_SOURCE = Counter("order_results_total", "Processed chunks by where the result came from", ["source"])
+SPECULATIONS = Counter("order_speculations_total", "Speculatively processed interim transcripts by outcome", ["outcome"])
+
+CONVERSATION_BACKLOG = Gauge("conversation_write_backlog", "Conversation rows waiting to be inserted",
+                             multiprocess_mode="livesum")
+CONVERSATION_BATCH_ROWS = Histogram(
+    "conversation_write_batch_rows",
+    "Rows per Conversation insert batch",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 200, 500),
+)
+
+AUTH_CACHE = Counter("auth_cache_lookups_total", "Token verifications by the cache tier that answered", ["result"])
+
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_duration_seconds",
+    "Time to hash or verify a password, waiting for a hashing thread included",
+    ["operation"],
+    buckets=_BUCKETS,
+)
+PASSWORD_HASH_PENDING = Gauge("password_hash_pending", "Password hashes running or waiting for a thread",
+                              multiprocess_mode="livesum")
+PASSWORD_HASH_REJECTED = Counter("password_hash_rejected_total", "Password hashes refused because too many were pending")
+
+OPENAI_TOKENS = Counter("openai_tokens_total", "OpenAI tokens used", ["kind"])
+OPENAI_REQUESTS = Counter("openai_requests_total", "OpenAI chat completion calls", ["outcome"])
+
+LLM_IN_FLIGHT = Gauge("llm_in_flight", "OpenAI calls holding a gateway slot", multiprocess_mode="livesum")
+LLM_QUEUE_DEPTH = Gauge("llm_queue_depth", "OpenAI calls waiting for a gateway slot", multiprocess_mode="livesum")
+LLM_REJECTED = Counter("llm_rejected_total", "OpenAI calls turned away by the gateway", ["reason"])
+LLM_BREAKER_OPEN = Gauge("llm_circuit_breaker_open", "Workers whose LLM circuit breaker is open",
+                         multiprocess_mode="livesum")
+
+# Connection pool usage of the SQLAlchemy engine, set by every worker every
+# DB_POOL_METRICS_INTERVAL seconds (a collector would only see the scraped worker)
+_POOL_GAUGES = [
+    (Gauge(name, documentation, multiprocess_mode="livesum"), read)
+    for name, documentation, read in (
+        ("db_pool_size", "Configured pool size", "size"),
+        ("db_pool_checked_out", "Connections in use", "checkedout"),
+        ("db_pool_checked_in", "Idle connections in the pool", "checkedin"),
+        ("db_pool_overflow", "Connections opened beyond the pool size", "overflow"),
+    )
+]
+
+
+def update_pool_metrics():
+    pool = async_engine.sync_engine.pool
+    for gauge, read in _POOL_GAUGES:
+        reader = getattr(pool, read, None)
+        if reader is not None:
+            gauge.set(reader())
+
+
+async def run_pool_metrics():
+    """Background task: keep the connection pool gauges of this worker current"""
+    while True:
+        update_pool_metrics()
+        await asyncio.sleep(DB_POOL_METRICS_INTERVAL)
+
+
+def generate_metrics() -> bytes:
+    """The /metrics page, of every worker in multiprocess mode"""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        update_pool_metrics()
+        return generate_latest()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def remove_dead_workers():
+    """Drop the live gauges of workers that died without mark_worker_dead"""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return
+    pids = set()
+    for path in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "gauge_live*_*.db")):
+        pids.add(int(os.path.basename(path).rsplit("_", 1)[1][:-len(".db")]))
+    for pid in pids:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            multiprocess.mark_process_dead(pid, PROMETHEUS_MULTIPROC_DIR)
+        except PermissionError:
+            pass
+
+
+def mark_worker_dead():
+    """Leave the live gauges of this worker out of the sums, on shutdown"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid(), PROMETHEUS_MULTIPROC_DIR)
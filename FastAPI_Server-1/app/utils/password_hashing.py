@@ -0,0 +1,45 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+import starlette.status as status_code
+from app.settings import PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING
+from app.utils.metrics import PASSWORD_HASH_SECONDS, PASSWORD_HASH_PENDING, PASSWORD_HASH_REJECTED
+
+# bcrypt takes a few hundred milliseconds of CPU per call by design. It runs on
+# a small thread pool (bcrypt releases the GIL while hashing) instead of the
+# event loop, where it would stall every other request. A login storm fills
+# the pool and then gets 503s instead of piling up.
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_pending = 0
+
+
+async def _run(operation: str, func, *args):
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        PASSWORD_HASH_REJECTED.inc()
+        raise HTTPException(
+            status_code=status_code.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many logins at once, please try again.",
+            headers={"Retry-After": "1"}
+        )
+
+    _pending += 1
+    PASSWORD_HASH_PENDING.set(_pending)
+    try:
+        with PASSWORD_HASH_SECONDS.labels(operation).time():
+            return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
+    finally:
+        _pending -= 1
+        PASSWORD_HASH_PENDING.set(_pending)
+
+
+async def hash_password(password: str) -> str:
+    return await _run("hash", pwd_context.hash, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> bool:
+    return await _run("verify", pwd_context.verify, password, hashed_password)
@@ -0,0 +1,74 @@
+from typing import Optional
+import redis
+import redis.asyncio as aioredis
+from app.settings import (
+    logger,
+    REDIS_HOST,
+    REDIS_PORT,
+    REDIS_MAX_CONNECTIONS,
+    REDIS_POOL_TIMEOUT,
+    REDIS_SOCKET_TIMEOUT,
+)
+
+# One asyncio Redis client per process, on a bounded connection pool, so a slow
+# Redis only delays the requests waiting on it instead of the event loop. The
+# app lifespan opens and closes it, code running outside the app (CLIs,
+# benchmarks) gets it on first use. Endpoints take it with Depends(get_redis).
+# For several keys at once use a pipeline, one round trip:
+#
+#   async with get_redis_client().pipeline() as pipe:
+#       hits, misses = await pipe.get(a).get(b).execute()
+
+_client: Optional[aioredis.Redis] = None
+_sync_client: Optional[redis.Redis] = None
+
+
+def get_redis_client() -> aioredis.Redis:
+    global _client
+    if _client is None:
+        pool = aioredis.BlockingConnectionPool(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=0,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+            health_check_interval=30,
+        )
+        _client = aioredis.Redis(connection_pool=pool)
+    return _client
+
+
+def get_sync_redis_client() -> redis.Redis:
+    """For Celery tasks, which run outside of an event loop"""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = redis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=0,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+            health_check_interval=30,
+        )
+    return _sync_client
+
+
+async def get_redis() -> aioredis.Redis:
+    return get_redis_client()
+
+
+async def open_redis():
+    """Connect at startup, Redis being down is logged but doesn't stop the app"""
+    try:
+        await get_redis_client().ping()
+    except redis.RedisError as e:
+        logger.error(f"Redis unavailable at startup: {str(e)}")
+
+
+async def close_redis():
+    global _client
+    if _client is not None:
+        await _client.aclose(close_connection_pool=True)
+        _client = None
@@ -1,4 +1,3 @@
-from passlib.context import CryptContext
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 import starlette.status as status_code
@@ -11,20 +10,21 @@ from datetime import datetime, timedelta
 import secrets
 from app.settings import async_engine
 from app.users_app.models import UserModel
-from app.settings import SETTINGS, redis_client
+from redis.asyncio import Redis
+from app.settings import SETTINGS
 from app.users_app.schemas import UserSchema
 from app.utils.db_base import get_db
+from app.utils.password_hashing import hash_password, verify_password
 
 login_app = "/auth"
 login_path = "/login"
 conversation_app = "/conversations"
 login_url = login_app + login_path
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=login_url)
 
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await hash_password(password)
 
 # Return user if exists otherwise return None
 
@@ -33,7 +33,7 @@ async def authenticate_user(session: AsyncSession, username: str, password: str)
     user = await get_user_from_username(session, username)
     if user is None:
         return None
-    if not pwd_context.verify(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return None
     return user
 
@@ -53,7 +53,7 @@ async def create_token_for_user(session: AsyncSession, user: UserModel) -> UserM
     token = jwt.encode({"sub": token_content, "exp": expiration},
                        SETTINGS.SECRET_KEY.get_secret_value(), algorithm=SETTINGS.ALGORITHM)
 
-    # Store the token in the database
+    # Store the token in the database, committing it drops the user from the auth cache
     user.token = token
 
     return user
@@ -64,6 +64,12 @@ async def check_if_admin(request: Request):
         raise HTTPException(
             status_code=status_code.HTTP_401_UNAUTHORIZED, detail="User is not an admin.")
 
+
+async def check_if_reviewer(request: Request):
+    if not getattr(request.state.user, "is_verified", False):
+        raise HTTPException(
+            status_code=status_code.HTTP_401_UNAUTHORIZED, detail="Only verified users can review conversations.")
+
 # JWT token generation for email verification
 
 
@@ -84,15 +90,15 @@ def generate_verification_code(length: int = 6) -> str:
 # Store the token with the email as the key
 
 
-def store_verification_token_for_user(email: str, token: str, expire_time: int = 600):
+async def store_verification_token_for_user(redis: Redis, email: str, token: str, expire_time: int = 600):
     # Set token with expiration (10 minutes)
-    redis_client.setex(email, expire_time, token)
+    await redis.setex(email, expire_time, token)
 
 # Retrieve the token by email
 
 
-def get_verification_token_for_user(email: str) -> str:
-    token = redis_client.get(email)
+async def get_verification_token_for_user(redis: Redis, email: str) -> str:
+    token = await redis.get(email)
     if not token:
         raise HTTPException(status_code=status_code.HTTP_404_NOT_FOUND,
                             detail="Verification token not found")
@@ -0,0 +1,181 @@
+import os
+import ssl
+import time
+import queue
+import smtplib
+from contextlib import contextmanager
+from email.message import EmailMessage
+from typing import Callable, Optional
+from app.settings import (
+    logger,
+    EMAIL_HOST,
+    EMAIL_PORT,
+    EMAIL_HOST_USER,
+    EMAIL_HOST_PASSWORD,
+    EMAIL_SECURITY,
+    EMAIL_TIMEOUT,
+    EMAIL_POOL_SIZE,
+    EMAIL_CONNECTION_MAX_MESSAGES,
+    EMAIL_CONNECTION_MAX_IDLE,
+)
+
+# SMTP connections kept open between emails. Connecting to the mail server
+# (TCP, TLS handshake, EHLO and AUTH) costs several round trips, sending one
+# email over an open session only MAIL, RCPT and DATA. Every Celery worker
+# process has its own pool, a connection is used by one thread at a time:
+#
+#   with get_smtp_pool().connection() as smtp:
+#       smtp.send_message(msg)
+#
+# A connection the server has dropped is reopened once and the email sent
+# again. Connections are replaced after EMAIL_CONNECTION_MAX_MESSAGES emails,
+# and reopened when they were idle for EMAIL_CONNECTION_MAX_IDLE seconds,
+# since servers close idle sessions anyway.
+
+# Errors after which the connection is unusable, on top of the server closing it
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError, ssl.SSLError)
+
+
+def email_security(port: int, security: str = EMAIL_SECURITY) -> str:
+    if security:
+        return security.lower()
+    return {465: "ssl", 587: "starttls"}.get(port, "")
+
+
+def open_connection(
+    host: str = EMAIL_HOST,
+    port: int = int(EMAIL_PORT),
+    security: str = EMAIL_SECURITY,
+    username: str = EMAIL_HOST_USER,
+    password: str = EMAIL_HOST_PASSWORD,
+) -> smtplib.SMTP:
+    """Connects and logs in, 'ssl' on port 465 and 'starttls' on 587 unless security is given"""
+    security = email_security(port, security)
+    if security == "ssl":
+        server = smtplib.SMTP_SSL(host, port, context=ssl.create_default_context(), timeout=EMAIL_TIMEOUT)
+    elif security in ("starttls", "none"):
+        server = smtplib.SMTP(host, port, timeout=EMAIL_TIMEOUT)
+    else:
+        raise ValueError(f"Invalid port number: {port}. Use 465 (SSL) or 587 (TLS), or set EMAIL_SECURITY.")
+
+    try:
+        if security == "starttls":
+            server.starttls(context=ssl.create_default_context())
+        server.ehlo()
+        # A local test server may not ask for a login
+        if username and server.has_extn("auth"):
+            server.login(username, password)
+    except BaseException:
+        server.close()
+        raise
+    return server
+
+
+class SMTPConnection:
+    """An SMTP session, opened on first use and reopened when the server has dropped it"""
+
+    def __init__(self, connect: Callable[[], smtplib.SMTP], max_messages: int, max_idle: float):
+        self._connect = connect
+        self._max_messages = max_messages
+        self._max_idle = max_idle
+        self.server: Optional[smtplib.SMTP] = None
+        self.sent = 0
+        self.last_used = 0.0
+
+    def send_message(self, msg: EmailMessage):
+        if self.sent >= self._max_messages:
+            self.close()
+        for attempt in range(2):
+            if self.server is None:
+                self.server = self._connect()
+                self.sent = 0
+            try:
+                self.server.send_message(msg)
+            except (smtplib.SMTPException, OSError) as e:
+                # smtplib closes the socket when the server answers 421 (closing)
+                if self.server.sock is not None and not isinstance(e, CONNECTION_ERRORS):
+                    raise
+                self.close(quit=False)
+                if attempt:
+                    raise
+                logger.warning(f"SMTP connection lost, reconnecting: {e}")
+            else:
+                self.sent += 1
+                self.last_used = time.monotonic()
+                return
+
+    def retire_if_stale(self):
+        if self.sent >= self._max_messages or time.monotonic() - self.last_used > self._max_idle:
+            self.close()
+
+    def close(self, quit: bool = True):
+        if self.server is None:
+            return
+        try:
+            if quit:
+                self.server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        finally:
+            self.server.close()
+            self.server = None
+
+
+class SMTPPool:
+    def __init__(
+        self,
+        size: int = EMAIL_POOL_SIZE,
+        connect: Callable[[], smtplib.SMTP] = open_connection,
+        max_messages: int = EMAIL_CONNECTION_MAX_MESSAGES,
+        max_idle: float = EMAIL_CONNECTION_MAX_IDLE,
+    ):
+        # Last in, first out, so the connections used most are the ones kept open
+        self._connections: queue.LifoQueue = queue.LifoQueue()
+        for _ in range(size):
+            self._connections.put(SMTPConnection(connect, max_messages, max_idle))
+
+    @contextmanager
+    def connection(self):
+        """Waits for a free connection, there are at most `size` open"""
+        connection = self._connections.get()
+        try:
+            connection.retire_if_stale()
+            yield connection
+        finally:
+            connection.retire_if_stale()
+            self._connections.put(connection)
+
+    def close(self):
+        while True:
+            try:
+                connection = self._connections.get_nowait()
+            except queue.Empty:
+                return
+            connection.close()
+
+
+_pool: Optional[SMTPPool] = None
+
+
+def get_smtp_pool() -> SMTPPool:
+    global _pool
+    if _pool is None:
+        _pool = SMTPPool()
+    return _pool
+
+
+def close_smtp_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+
+def _forget_parent_pool():
+    # The connections belong to the parent process, a forked worker opens its own
+    global _pool
+    _pool = None
+
+
+os.register_at_fork(after_in_child=_forget_parent_pool)
+
@@ -0,0 +1,31 @@
+import os
+import pytest
+
+# app.settings reads its configuration from the environment on import
+os.environ.setdefault("OPENAI_KEY", "test")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db_sessionmaker():
+    """Sessions on empty tables of the test database, TEST_DATABASE_URL
+    (postgresql+asyncpg://...), the test is skipped when it isn't set"""
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from app.settings import Base
+    import app.conversations_app.models  # noqa: F401
+    import app.voice_agent_app.models  # noqa: F401
+
+    engine = create_async_engine(url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    await engine.dispose()
@@ -0,0 +1,59 @@
+import time
+import asyncio
+import pytest
+from app.utils import auth_cache
+from app.users_app.schemas import UserSchema
+
+fakeredis = pytest.importorskip("fakeredis")
+
+pytestmark = pytest.mark.anyio
+
+USER = UserSchema(id=1, username="alice", email="alice@example.com", full_name="Alice", is_admin=False, is_verified=True)
+TOKEN = "old-token"
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(auth_cache, "get_redis_client", lambda: client)
+    monkeypatch.setattr(auth_cache, "AUTH_CACHE_ENABLED", True)
+    monkeypatch.setattr(auth_cache, "AUTH_CACHE_REDIS", True)
+    auth_cache._local.clear()
+    yield client
+    auth_cache._local.clear()
+
+
+async def invalidate(user_id: int):
+    auth_cache.invalidate_user(user_id)
+    await asyncio.gather(*auth_cache._invalidations)
+
+
+async def cache(generation):
+    await auth_cache.cache_user(USER.id, TOKEN, USER, time.time() + 3600, generation)
+
+
+async def test_a_user_read_before_a_change_is_not_cached_after_it(redis_client):
+    generation = await auth_cache.user_generation(USER.id)
+    # The token is rotated while the old one is being verified
+    await invalidate(USER.id)
+    await cache(generation)
+
+    assert await redis_client.get(auth_cache.REDIS_PREFIX + str(USER.id)) is None
+    assert await auth_cache.get_cached_user(USER.id, TOKEN) is None
+
+
+async def test_a_change_drops_the_user_cached_before_it(redis_client):
+    await cache(await auth_cache.user_generation(USER.id))
+    assert await auth_cache.get_cached_user(USER.id, TOKEN) == USER
+
+    await invalidate(USER.id)
+    assert await auth_cache.get_cached_user(USER.id, TOKEN) is None
+
+
+async def test_a_user_read_after_a_change_reaches_the_other_workers(redis_client):
+    await invalidate(USER.id)
+    await cache(await auth_cache.user_generation(USER.id))
+
+    # Another worker, with nothing in its own cache
+    auth_cache._local.clear()
+    assert await auth_cache.get_cached_user(USER.id, TOKEN) == USER
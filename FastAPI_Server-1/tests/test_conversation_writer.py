@@ -0,0 +1,128 @@
+import io
+import os
+import json
+import asyncio
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy.future import select
+from app.conversations_app import api, conversation_writer as writer_module
+from app.conversations_app.conversation_writer import ConversationWriter, read_spool
+from app.conversations_app.models import Conversation
+
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def spool_line(conversation_id: str, chunk: str = "a coke") -> str:
+    return json.dumps({"chunk": chunk, "context": "", "conversation_id": conversation_id, "timestamp": NOW.isoformat()}) + "\n"
+
+
+def test_read_spool_skips_rolled_back_rows():
+    spool = io.StringIO(
+        spool_line("apple_0") + spool_line("apple_1") + json.dumps({"rolled_back": ["apple_1"]}) + "\n"
+        # The version was allocated again by a transaction that committed
+        + spool_line("apple_1", "a water") + "\n"
+    )
+    rows = read_spool(spool)
+    assert [(row["conversation_id"], row["chunk"]) for row in rows] == [("apple_0", "a coke"), ("apple_1", "a water")]
+    assert rows[0]["timestamp"] == NOW
+
+
+def row(conversation_id: str) -> dict:
+    return {"chunk": "a coke", "context": "", "conversation_id": conversation_id, "timestamp": NOW}
+
+
+@pytest.fixture
+def inserted(monkeypatch):
+    inserted = []
+
+    async def insert_conversations(rows):
+        inserted.extend(row["conversation_id"] for row in rows)
+    monkeypatch.setattr(writer_module, "insert_conversations", insert_conversations)
+    return inserted
+
+
+@pytest.mark.anyio
+async def test_spool_emptied_after_a_flush_is_recovered_after_a_crash(tmp_path, inserted):
+    writer = ConversationWriter(str(tmp_path))
+    await writer.start()
+    writer.spool([row("apple_0")])
+    writer.submit([row("apple_0")])
+    # Inserted by the writer, which empties the spool
+    for _ in range(50):
+        if inserted:
+            break
+        await asyncio.sleep(0.05)
+    assert inserted == ["apple_0"]
+    writer.spool([row("apple_1")])
+
+    # The process dies, the next one finds its spool
+    with open(writer._spool.name, "rb") as spool:
+        assert spool.read().startswith(b'{"chunk"')
+    inserted.clear()
+    writer._spool.close()
+    writer._task.cancel()
+    await ConversationWriter(str(tmp_path)).recover()
+
+    assert inserted == ["apple_1"]
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.anyio
+async def test_unreadable_spools_do_not_stop_the_recovery(tmp_path, inserted):
+    # Left by the truncate without seek, and a line cut short by a crash
+    (tmp_path / "conversations-1-a.jsonl").write_text("\x00" * 20 + spool_line("apple_0") + '{"chunk": "a co')
+    (tmp_path / "conversations-2-b.jsonl").write_text(spool_line("pear_0").replace("pear_0", "pear_0\"") + "\n")
+    (tmp_path / "conversations-3-c.jsonl").write_text(spool_line("plum_0"))
+
+    await ConversationWriter(str(tmp_path)).recover()
+
+    assert sorted(inserted) == ["apple_0", "plum_0"]
+
+
+@pytest.fixture
+async def order_session(db_sessionmaker, monkeypatch):
+    async def no_pool():
+        return None
+    monkeypatch.setattr(api, "allocate_conversation_id", no_pool)
+    monkeypatch.setattr(writer_module, "AsyncSessionLocal", db_sessionmaker)
+    async with db_sessionmaker() as session:
+        base_id, _ = await api.new_customer_session(session)
+    return base_id
+
+
+async def conversation_ids(sessionmaker) -> list[str]:
+    async with sessionmaker() as session:
+        return sorted((await session.scalars(select(Conversation.conversation_id))).all())
+
+
+@pytest.mark.anyio
+async def test_without_a_running_writer_rows_are_inserted_in_the_transaction(db_sessionmaker, order_session):
+    async with db_sessionmaker() as session:
+        await api.record_conversation(session, order_session, "a coke", "{}")
+    assert await conversation_ids(db_sessionmaker) == [f"{order_session}_0", f"{order_session}_1"]
+
+
+@pytest.mark.anyio
+async def test_writer_recovers_a_spool_left_under_its_own_pid(db_sessionmaker, order_session, monkeypatch, tmp_path):
+    # A crashed process of an earlier container had the same pid
+    leftover = tmp_path / f"conversations-{os.getpid()}.jsonl"
+    leftover.write_text(spool_line(f"{order_session}_1"))
+    writer = ConversationWriter(str(tmp_path))
+    monkeypatch.setattr(writer_module, "conversation_writer", writer)
+
+    await writer.start()
+    assert not leftover.exists()
+    assert await conversation_ids(db_sessionmaker) == [f"{order_session}_0", f"{order_session}_1"]
+
+    async with db_sessionmaker() as session:
+        conversation_id = await api.record_conversation(session, order_session, "a water", "{}")
+    # Spooled with the commit, inserted by the writer
+    assert conversation_id in open(writer._spool.name).read()
+    for _ in range(50):
+        if conversation_id in await conversation_ids(db_sessionmaker):
+            break
+        await asyncio.sleep(0.05)
+    assert conversation_id in await conversation_ids(db_sessionmaker)
+
+    await writer.stop()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,52 @@
+import json
+import pytest
+from app.conversations_app import api
+from app.conversations_app.api import degraded_order, REPEAT_ANSWER
+
+PREVIOUS = {"order_details": "1 x Fries, 1 x Coke", "sizes": "1 x Large, 1 x Small",
+            "toppings": "1 x Ketchup, 1 x No Topping Option"}
+
+
+def previous_output() -> str:
+    return json.dumps({**PREVIOUS, "answer": ""})
+
+
+@pytest.fixture
+def parser_disabled(monkeypatch):
+    # Only then is the local parse left to degraded_order
+    monkeypatch.setattr(api, "LOCAL_PARSER_ENABLED", False)
+
+
+def test_confident_local_parse_is_used(parser_disabled):
+    result = degraded_order("and a water", previous_output(), "circuit_open")
+    assert result["order_details"] == "1 x Fries, 1 x Coke, 1 x Water"
+
+
+def test_the_fast_path_parse_is_not_run_again(monkeypatch):
+    def parse_again(*args):
+        raise AssertionError("parsed again")
+    monkeypatch.setattr(api, "parse_order_locally", parse_again)
+
+    result = degraded_order("a coke for my brother", previous_output(), "circuit_open")
+    assert result == {**PREVIOUS, "answer": REPEAT_ANSWER}
+
+
+@pytest.mark.parametrize("chunk", [
+    "remove the fries",
+    "no coke",
+    "I dont want a coke",
+    "take off the ketchup",
+    "cancel the fries",
+    "fries without ketchup",
+    "a coke instead of the fries",
+    # Only partly understood
+    "a coke for my brother",
+])
+def test_keeps_the_order_unless_the_local_parse_is_confident(chunk, parser_disabled):
+    result = degraded_order(chunk, previous_output(), "circuit_open")
+    assert result == {**PREVIOUS, "answer": REPEAT_ANSWER}
+
+
+def test_without_a_previous_order_asks_to_repeat():
+    result = degraded_order("no coke", "", "queue_full")
+    assert result == {"order_details": "", "sizes": "", "toppings": "", "answer": REPEAT_ANSWER}
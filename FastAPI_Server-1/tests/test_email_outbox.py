@@ -0,0 +1,163 @@
+import json
+import pytest
+from app.users_app import tasks
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def email(number: int) -> dict:
+    return {"subject": "Code", "message": str(number), "to": [f"user{number}@example.com"]}
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeStrictRedis()
+    monkeypatch.setattr(tasks, "get_sync_redis_client", lambda: client)
+    monkeypatch.setattr(tasks, "EMAIL_BATCH_SIZE", 2)
+    return client
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    sent = []
+
+    def send_batch(emails, acknowledge):
+        for email in emails:
+            sent.append(int(email["message"]))
+            acknowledge()
+        return []
+    monkeypatch.setattr(tasks, "send_batch", send_batch)
+    return sent
+
+
+def queue(redis, *numbers: int, key: str = tasks.OUTBOX_KEY):
+    redis.rpush(key, *(json.dumps(email(number)) for number in numbers))
+    redis.set(tasks.DRAIN_SCHEDULED_KEY, 1)
+
+
+def processing_lists(redis) -> dict[bytes, list[bytes]]:
+    return {key: redis.lrange(key, 0, -1) for key in redis.scan_iter(match=f"{tasks.PROCESSING_KEY}*")}
+
+
+def test_drain_sends_everything_in_order_and_clears_the_schedule(redis, sent):
+    queue(redis, 1, 2, 3, 4, 5)
+    tasks.drain_email_outbox.apply()
+
+    assert sent == [1, 2, 3, 4, 5]
+    assert not redis.exists(tasks.OUTBOX_KEY, tasks.DRAIN_SCHEDULED_KEY, tasks.DRAIN_LOCK_KEY)
+    assert processing_lists(redis) == {}
+
+
+def test_drain_starts_with_the_batches_dead_drains_left(redis, sent):
+    queue(redis, 1, 2, key=f"{tasks.PROCESSING_KEY}:dead")
+    queue(redis, 3)
+    tasks.drain_email_outbox.apply()
+
+    assert sent == [1, 2, 3]
+
+
+def test_emails_stay_queued_when_the_worker_dies_mid_batch(redis, monkeypatch):
+    queue(redis, 1, 2, 3)
+
+    def crash(emails, acknowledge):
+        acknowledge()
+        raise SystemExit
+    monkeypatch.setattr(tasks, "send_batch", crash)
+    with pytest.raises(SystemExit):
+        tasks.drain_email_outbox.apply(throw=True)
+
+    # The first email of the batch was sent
+    assert list(processing_lists(redis).values()) == [[json.dumps(email(2)).encode()]]
+    # Still scheduled, until the key expires or the task is redelivered
+    assert redis.exists(tasks.DRAIN_SCHEDULED_KEY)
+
+
+def test_unsent_emails_are_retried_first_and_the_drain_stays_scheduled(redis, monkeypatch):
+    queue(redis, 1, 2, 3)
+    attempts = []
+
+    def flaky(emails, acknowledge):
+        attempts.append([int(email["message"]) for email in emails])
+        # The server goes away after the first email
+        if len(attempts) == 1:
+            acknowledge()
+            return emails[1:]
+        for _ in emails:
+            acknowledge()
+        return []
+    monkeypatch.setattr(tasks, "send_batch", flaky)
+    ttls = []
+    monkeypatch.setattr(tasks.drain_email_outbox, "retry", lambda countdown: ttls.append(
+        redis.ttl(tasks.DRAIN_SCHEDULED_KEY)) or RuntimeError("retry"))
+    with pytest.raises(RuntimeError, match="retry"):
+        tasks.drain_email_outbox.apply(throw=True)
+
+    assert redis.lrange(tasks.OUTBOX_KEY, 0, -1) == [json.dumps(email(number)).encode() for number in (2, 3)]
+    assert processing_lists(redis) == {}
+    assert ttls[0] > tasks.DRAIN_SCHEDULED_TTL
+
+    tasks.drain_email_outbox.apply(throw=True)
+    assert attempts == [[1, 2], [2, 3]]
+    assert not redis.exists(tasks.OUTBOX_KEY, tasks.DRAIN_SCHEDULED_KEY)
+
+
+def test_giving_up_lets_the_next_email_schedule_a_drain(redis, monkeypatch):
+    queue(redis, 1)
+    monkeypatch.setattr(tasks, "send_batch", lambda emails, acknowledge: emails)
+    monkeypatch.setattr(tasks.drain_email_outbox, "max_retries", 0)
+    with pytest.raises(Exception):
+        tasks.drain_email_outbox.apply(throw=True)
+
+    assert redis.llen(tasks.OUTBOX_KEY) == 1
+    assert not redis.exists(tasks.DRAIN_SCHEDULED_KEY)
+
+
+def test_the_lock_is_renewed_with_every_email(redis, monkeypatch):
+    queue(redis, 1, 2)
+    ttls = []
+
+    def slow(emails, acknowledge):
+        for _ in emails:
+            # Most of the lock used up by a slow server
+            redis.expire(tasks.DRAIN_LOCK_KEY, 1)
+            acknowledge()
+            ttls.append(redis.ttl(tasks.DRAIN_LOCK_KEY))
+        return []
+    monkeypatch.setattr(tasks, "send_batch", slow)
+    tasks.drain_email_outbox.apply(throw=True)
+
+    assert ttls == [tasks.DRAIN_LOCK_TTL] * 2
+
+
+def test_a_second_drain_waits_for_the_running_one(redis, sent, monkeypatch):
+    queue(redis, 1)
+    redis.set(tasks.DRAIN_LOCK_KEY, "running")
+    rescheduled = []
+    monkeypatch.setattr(tasks.drain_email_outbox, "apply_async", lambda countdown: rescheduled.append(countdown))
+    tasks.drain_email_outbox.apply(throw=True)
+
+    assert sent == []
+    assert rescheduled == [tasks.EMAIL_BATCH_WINDOW]
+    assert redis.get(tasks.DRAIN_LOCK_KEY) == b"running"
+
+
+def test_a_drain_that_lost_its_lock_leaves_the_outbox_to_the_new_one(redis, monkeypatch):
+    queue(redis, 1, 2, 3)
+    sent = []
+
+    def stuck(emails, acknowledge):
+        sent.append(int(emails[0]["message"]))
+        # Stuck past the lock, another drain took over and put this batch back
+        redis.set(tasks.DRAIN_LOCK_KEY, "other")
+        tasks.requeue_processing(redis, f"{tasks.PROCESSING_KEY}:other")
+        if not acknowledge():
+            return emails[1:]
+        raise AssertionError("kept the lock")
+    monkeypatch.setattr(tasks, "send_batch", stuck)
+    tasks.drain_email_outbox.apply(throw=True)
+
+    assert sent == [1]
+    # Nothing given back twice or deleted, and the new drain keeps its lock
+    assert redis.lrange(tasks.OUTBOX_KEY, 0, -1) == [json.dumps(email(number)).encode() for number in (1, 2, 3)]
+    assert processing_lists(redis) == {}
+    assert redis.get(tasks.DRAIN_LOCK_KEY) == b"other"
@@ -0,0 +1,128 @@
+import io
+import csv
+import json
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import HTTPException
+from app.users_app.models import UserModel
+from app.conversations_app import export as export_module
+from app.conversations_app.export import COLUMNS, export_row, export_conversations, NdjsonWriter, CsvWriter
+
+NOW = datetime(2026, 2, 1, 12, 0, tzinfo=timezone.utc)
+ORDER = {"order_details": "a coke", "sizes": ["large"], "toppings": None, "answer": "Anything else?"}
+
+
+def conversation(context: str, id: int = 1) -> tuple:
+    return (id, f"apple_{id}", NOW, "a large coke", "{}", None, None, None, context)
+
+
+def test_export_row_puts_the_order_in_columns():
+    row = export_row(conversation(json.dumps(ORDER)))
+    assert list(row) == list(COLUMNS)
+    assert (row["conversation_id"], row["timestamp"]) == ("apple_1", NOW)
+    assert (row["order_details"], row["sizes"], row["toppings"], row["answer"]) == ("a coke", '["large"]', None, "Anything else?")
+    assert row["context_raw"] is None
+
+
+@pytest.mark.parametrize("context", ["not json", "[1, 2]"])
+def test_context_that_is_not_an_order_is_kept_as_is(context):
+    row = export_row(conversation(context))
+    assert row["order_details"] is None
+    assert row["context_raw"] == context
+
+
+def test_empty_context_is_an_empty_order():
+    row = export_row(conversation(""))
+    assert row["order_details"] is None and row["context_raw"] is None
+
+
+def test_ndjson_writes_a_line_per_row():
+    rows = [export_row(conversation("", id)) for id in (1, 2)]
+    lines = NdjsonWriter().write(rows).decode().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [1, 2]
+    assert json.loads(lines[0])["timestamp"] == NOW.isoformat()
+
+
+def test_csv_header_is_written_once():
+    writer = CsvWriter()
+    data = writer.write([export_row(conversation("", 1))]) + writer.write([export_row(conversation("", 2))]) + writer.close()
+    rows = list(csv.DictReader(io.StringIO(data.decode())))
+    assert [row["id"] for row in rows] == ["1", "2"]
+
+
+def test_csv_without_rows_still_has_its_header():
+    assert CsvWriter().close().decode().strip() == ",".join(COLUMNS)
+
+
+def test_parquet_writes_a_row_group_per_batch():
+    pq = pytest.importorskip("pyarrow.parquet")
+    writer = export_module.ParquetWriter()
+    data = writer.write([export_row(conversation(json.dumps(ORDER), 1))])
+    data += writer.write([export_row(conversation("not json", 2))]) + writer.close()
+
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.num_row_groups == 2
+    rows = parquet.read().to_pylist()
+    assert [row["id"] for row in rows] == [1, 2]
+    assert rows[0]["timestamp"] == NOW
+    assert (rows[0]["order_details"], rows[1]["context_raw"]) == ("a coke", "not json")
+
+
+@pytest.fixture
+async def conversations(db_sessionmaker, monkeypatch):
+    monkeypatch.setattr(export_module, "AsyncSessionLocal", db_sessionmaker)
+    async with db_sessionmaker() as session:
+        session.add_all(UserModel(id=user_id, username=name, email=f"{name}@example.com", hashed_password="", full_name=name)
+                        for user_id, name in ((1, "alice"), (2, "bob")))
+        await session.flush()
+        reviews = [(None, None), (1, None), (1, 2), (None, None), (2, None)]
+        session.add_all(
+            export_module.Conversation(
+                conversation_id=f"apple_{version}", timestamp=NOW + timedelta(minutes=version), context=json.dumps(ORDER),
+                initial_review_by=initial, final_review_by=final,
+            )
+            for version, (initial, final) in enumerate(reviews)
+        )
+        await session.commit()
+
+
+async def exported(*args, **kwargs) -> bytes:
+    return b"".join([chunk async for chunk in export_conversations(*args, **kwargs)])
+
+
+@pytest.mark.anyio
+async def test_export_is_written_in_batches_in_timestamp_order(conversations):
+    chunks = [chunk async for chunk in export_conversations("ndjson", batch_rows=2)]
+    # Three batches, then the writer's (empty) end
+    assert len(chunks) == 4
+    rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    assert [row["conversation_id"] for row in rows] == [f"apple_{version}" for version in range(5)]
+
+
+@pytest.mark.anyio
+async def test_export_filters_by_time_and_review_stage(conversations):
+    def ids(data: bytes) -> list[str]:
+        return [row["conversation_id"] for row in csv.DictReader(io.StringIO(data.decode()))]
+
+    assert ids(await exported("csv", since=NOW + timedelta(minutes=1), until=NOW + timedelta(minutes=3))) == ["apple_1", "apple_2"]
+    assert ids(await exported("csv", review="unreviewed")) == ["apple_0", "apple_3"]
+    assert ids(await exported("csv", review="initial")) == ["apple_1", "apple_4"]
+    assert ids(await exported("csv", review="final")) == ["apple_2"]
+    assert ids(await exported("csv", since=NOW + timedelta(days=1))) == []
+
+
+@pytest.mark.anyio
+async def test_endpoint_streams_the_export_as_an_attachment(conversations):
+    response = await export_module.export(format="csv", review="final")
+    assert response.media_type == "text/csv"
+    assert response.headers["content-disposition"] == 'attachment; filename="conversations.csv"'
+    data = b"".join([chunk async for chunk in response.body_iterator])
+    assert [row["conversation_id"] for row in csv.DictReader(io.StringIO(data.decode()))] == ["apple_2"]
+
+
+@pytest.mark.anyio
+async def test_parquet_without_pyarrow_is_a_bad_request(monkeypatch):
+    monkeypatch.setattr(export_module, "parquet_available", lambda: False)
+    with pytest.raises(HTTPException) as error:
+        await export_module.export(format="parquet")
+    assert error.value.status_code == 400
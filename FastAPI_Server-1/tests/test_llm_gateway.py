@@ -0,0 +1,149 @@
+import time
+import asyncio
+import pytest
+from app.conversations_app import llm_gateway
+from app.conversations_app.llm_gateway import LLMGateway, CircuitBreaker, LLMUnavailable
+
+pytestmark = pytest.mark.anyio
+
+
+def in_seconds(seconds: float) -> float:
+    return time.monotonic() + seconds
+
+
+async def hold_slot(gateway: LLMGateway, release: asyncio.Event, deadline: float = None):
+    async with gateway.admit(deadline or in_seconds(5)):
+        await release.wait()
+
+
+async def test_calls_beyond_the_slots_queue_and_beyond_the_queue_fail():
+    gateway = LLMGateway(max_concurrency=2, max_queue=1)
+    release = asyncio.Event()
+    holders = [asyncio.create_task(hold_slot(gateway, release)) for _ in range(2)]
+    await asyncio.sleep(0)
+    queued = asyncio.create_task(hold_slot(gateway, asyncio.Event()))
+    await asyncio.sleep(0)
+
+    with pytest.raises(LLMUnavailable, match="queue_full"):
+        async with gateway.admit(in_seconds(5)):
+            pass
+    assert not queued.done()
+
+    release.set()
+    await asyncio.gather(*holders)
+    await asyncio.sleep(0)
+    # The queued call got a slot once the others were done
+    assert gateway._waiting == 0
+    queued.cancel()
+
+
+async def test_a_call_that_waits_past_its_deadline_is_turned_away():
+    gateway = LLMGateway(max_concurrency=1, max_queue=1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold_slot(gateway, release))
+    await asyncio.sleep(0)
+
+    with pytest.raises(LLMUnavailable, match="deadline_queued"):
+        async with gateway.admit(in_seconds(0.05)):
+            pass
+
+    release.set()
+    await holder
+    # The slot is free again
+    async with gateway.admit(in_seconds(1)) as remaining:
+        assert 0 < remaining <= 1
+
+
+async def test_timeouts_and_errors_free_the_slot_and_count_as_failures():
+    gateway = LLMGateway(max_concurrency=1, max_queue=0)
+
+    with pytest.raises(LLMUnavailable, match="deadline"):
+        async with gateway.admit(in_seconds(1)):
+            raise TimeoutError
+    with pytest.raises(ValueError):
+        async with gateway.admit(in_seconds(1)):
+            raise ValueError
+
+    assert [ok for _, ok in gateway.breaker._outcomes] == [False, False]
+    async with gateway.admit(in_seconds(1)):
+        pass
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_WORKER_BREAKER_MIN_REQUESTS", 4)
+    monkeypatch.setattr(llm_gateway, "LLM_BREAKER_ERROR_RATE", 0.5)
+    monkeypatch.setattr(llm_gateway, "LLM_BREAKER_WINDOW", 60)
+    monkeypatch.setattr(llm_gateway, "LLM_BREAKER_COOLDOWN", 60)
+    return CircuitBreaker()
+
+
+def test_breaker_opens_once_enough_recent_calls_failed(breaker):
+    for success in (True, False, True):
+        breaker.record(success)
+    assert not breaker.is_open
+    breaker.record(False)
+    assert breaker.is_open
+    assert not breaker.allow()
+
+
+def test_breaker_needs_a_minimum_of_calls(breaker):
+    for _ in range(3):
+        breaker.record(False)
+    assert not breaker.is_open
+
+
+async def test_open_breaker_turns_calls_away(breaker):
+    gateway = LLMGateway(max_concurrency=1, max_queue=0)
+    gateway.breaker = breaker
+    for _ in range(4):
+        breaker.record(False)
+
+    with pytest.raises(LLMUnavailable, match="circuit_open"):
+        async with gateway.admit(in_seconds(1)):
+            pass
+
+
+async def test_a_probe_cancelled_while_queued_lets_the_next_one_through(breaker, monkeypatch):
+    gateway = LLMGateway(max_concurrency=1, max_queue=1)
+    gateway.breaker = breaker
+    release = asyncio.Event()
+    holder = asyncio.create_task(hold_slot(gateway, release))
+    await asyncio.sleep(0)
+    for _ in range(4):
+        breaker.record(False)
+    monkeypatch.setattr(llm_gateway, "LLM_BREAKER_COOLDOWN", 0)
+
+    # The half-open probe queues behind the call holding the slot, and is cancelled
+    probe = asyncio.create_task(hold_slot(gateway, asyncio.Event()))
+    await asyncio.sleep(0)
+    assert gateway._waiting == 1
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+    assert gateway._waiting == 0
+    # Before any other call ends, which would settle the probe either way
+    assert breaker.allow()
+
+    release.set()
+    await holder
+
+
+def test_after_the_cooldown_one_probe_closes_or_reopens_the_breaker(breaker, monkeypatch):
+    for _ in range(4):
+        breaker.record(False)
+    monkeypatch.setattr(llm_gateway, "LLM_BREAKER_COOLDOWN", 0)
+
+    # A single probe at a time
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(False)
+    assert breaker.is_open
+
+    # A probe that ended without an outcome lets the next one through
+    assert breaker.allow()
+    breaker.abandon()
+    assert breaker.allow()
+    breaker.record(True)
+    assert not breaker.is_open
+    assert breaker.allow() and breaker.allow()
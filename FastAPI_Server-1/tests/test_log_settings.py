@@ -0,0 +1,48 @@
+import pytest
+import redis
+from fastapi import HTTPException
+from app.utils import log_settings
+from app.utils.log import set_sql_echo, set_debug_sample_rate
+
+fakeredis = pytest.importorskip("fakeredis")
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def default_settings():
+    set_sql_echo(False)
+    set_debug_sample_rate(0)
+    yield
+    set_sql_echo(False)
+    set_debug_sample_rate(0)
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(log_settings, "get_redis_client", lambda: client)
+    return client
+
+
+async def test_changes_reach_the_other_workers(redis_client):
+    assert await log_settings.update_settings(debug_sample_rate=0.25) == {"sql_echo": False, "debug_sample_rate": 0.25}
+
+    # Another worker, still on the settings it started with
+    set_debug_sample_rate(0)
+    await log_settings.update_settings(sql_echo=True)
+    set_sql_echo(False)
+    await log_settings.sync_settings()
+    assert log_settings.current_settings() == {"sql_echo": True, "debug_sample_rate": 0.25}
+
+
+async def test_nothing_changes_when_redis_is_down(monkeypatch):
+    class DownRedis:
+        async def hset(self, *args, **kwargs):
+            raise redis.ConnectionError("down")
+    monkeypatch.setattr(log_settings, "get_redis_client", DownRedis)
+
+    with pytest.raises(HTTPException) as error:
+        await log_settings.update_settings(sql_echo=True)
+    assert error.value.status_code == 503
+    assert log_settings.current_settings() == {"sql_echo": False, "debug_sample_rate": 0.0}
@@ -0,0 +1,37 @@
+import os
+import sys
+import subprocess
+
+WORKER = """
+from app.utils import metrics
+metrics.ORDER_SOURCE.labels("local").inc()
+metrics.LLM_IN_FLIGHT.inc(2)
+metrics.update_pool_metrics()
+"""
+
+SCRAPE = """
+from app.utils import metrics
+print(metrics.generate_metrics().decode())
+metrics.remove_dead_workers()
+print("---")
+print(metrics.generate_metrics().decode())
+"""
+
+
+def run(code: str, multiproc_dir) -> str:
+    env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(multiproc_dir), "OPENAI_KEY": "test", "LOG_LEVEL": "WARNING"}
+    return subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True).stdout
+
+
+def test_metrics_add_up_the_workers_and_leave_out_dead_ones_live_gauges(tmp_path):
+    # Two uvicorn workers, scraped by a third process
+    run(WORKER, tmp_path)
+    run(WORKER, tmp_path)
+    scraped, after_cleanup = run(SCRAPE, tmp_path).split("---")
+
+    assert 'order_results_total{source="local"} 2.0' in scraped
+    assert "llm_in_flight 4.0" in scraped
+    assert "db_pool_size 10.0" in scraped
+    # Both workers are gone: their counters still count, their gauges no longer do
+    assert 'order_results_total{source="local"} 2.0' in after_cleanup
+    assert "llm_in_flight 4.0" not in after_cleanup
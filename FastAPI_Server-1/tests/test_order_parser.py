@@ -0,0 +1,114 @@
+import json
+import pytest
+from app.conversations_app.menu import format_order, parse_order_state, OrderLine
+from app.conversations_app.order_parser import parse_order_locally
+
+
+def order(order_details: str, sizes: str, toppings: str) -> str:
+    return json.dumps({"order_details": order_details, "sizes": sizes, "toppings": toppings, "answer": ""})
+
+
+def fields(result: dict) -> tuple[str, str, str]:
+    return result["order_details"], result["sizes"], result["toppings"]
+
+
+@pytest.mark.parametrize("chunk, expected", [
+    ("a large coke", ("1 x Coke", "1 x Large", "1 x No Topping Option")),
+    ("two fries with ketchup", ("2 x Fries", "2 x ?", "2 x Ketchup")),
+    ("a water", ("1 x Water", "1 x One Size Option", "1 x No Topping Option")),
+    ("a coke, large", ("1 x Coke", "1 x Large", "1 x No Topping Option")),
+    ("one cheeseburger and a small sprite",
+     ("1 x Cheeseburger, 1 x Sprite", "1 x ?, 1 x Small", "1 x ?, 1 x No Topping Option")),
+])
+def test_parses_simple_orders(chunk, expected):
+    local = parse_order_locally(chunk, "")
+    assert local.confidence == 1
+    assert fields(local.result) == expected
+
+
+def test_adds_to_the_previous_order():
+    local = parse_order_locally("and a coke", order("2 x Fries", "2 x Large", "2 x Ketchup"))
+    assert fields(local.result) == (
+        "2 x Fries, 1 x Coke", "2 x Large, 1 x ?", "2 x Ketchup, 1 x No Topping Option"
+    )
+
+
+def test_make_it_large_resizes_every_unit_of_the_last_line():
+    previous = fields(parse_order_locally("two fries", "").result)
+    local = parse_order_locally("make it large", order(*previous))
+    assert local.confidence == 1
+    assert fields(local.result) == ("2 x Fries", "2 x Large", "2 x ?")
+
+
+def test_make_it_large_leaves_earlier_lines_alone():
+    local = parse_order_locally("a coke and two fries make it small", "")
+    assert fields(local.result) == ("1 x Coke, 2 x Fries", "1 x ?, 2 x Small", "1 x No Topping Option, 2 x ?")
+
+
+def test_unavailable_size_is_marked():
+    local = parse_order_locally("a small mango juice", "")
+    assert fields(local.result) == ("1 x Mango Juice", "1 x !", "1 x No Topping Option")
+
+
+def test_clear_order():
+    local = parse_order_locally("cancel everything", order("1 x Coke", "1 x Large", "1 x No Topping Option"))
+    assert local.confidence == 1
+    assert fields(local.result) == ("", "", "")
+
+
+@pytest.mark.parametrize("chunk", [
+    "remove the fries",
+    "no coke",
+    "I dont want a coke",
+    "I don't want fries",
+    "take off the ketchup",
+    "a cheeseburger without mustard",
+    "a cheeseburger but no ketchup",
+    "hold the mayo",
+    "drop the sprite",
+    "cancel the coke",
+    "one less fries",
+])
+def test_negations_and_removals_are_left_to_the_llm(chunk):
+    previous = order("1 x Fries, 1 x Coke, 1 x Cheeseburger", "1 x Large, 1 x Small, 1 x ?", "1 x Ketchup, 1 x No Topping Option, 1 x Ketchup")
+    local = parse_order_locally(chunk, previous)
+    assert local.result is None
+    assert local.confidence == 0
+
+
+@pytest.mark.parametrize("chunk, previous", [
+    ("add ketchup to the cheeseburger", order("1 x Cheeseburger, 2 x Fries", "1 x ?, 2 x ?", "1 x ?, 2 x ?")),
+    ("ketchup on the fries please", order("2 x Fries, 1 x Cheeseburger", "2 x ?, 1 x ?", "2 x ?, 1 x ?")),
+    ("mustard on both cheeseburgers", order("2 x Cheeseburger", "2 x ?", "2 x ?")),
+    ("a coke and a sprite, large", ""),
+    ("two fries and a coke, small", ""),
+])
+def test_targets_and_sizes_for_a_list_are_left_to_the_llm(chunk, previous):
+    local = parse_order_locally(chunk, previous)
+    assert local.result is None
+    assert local.confidence == 0
+
+
+def test_trailing_size_after_each_item_is_parsed():
+    local = parse_order_locally("a coke, large, and a sprite, small", "")
+    assert local.confidence == 1
+    assert fields(local.result) == ("1 x Coke, 1 x Sprite", "1 x Large, 1 x Small", "1 x No Topping Option, 1 x No Topping Option")
+
+
+@pytest.mark.parametrize("chunk", ["what's on the menu", "how big is a large", "scratch that", "hello there", ""])
+def test_questions_and_chit_chat_are_left_to_the_llm(chunk):
+    assert parse_order_locally(chunk, "").result is None
+
+
+def test_unreadable_previous_order_is_left_to_the_llm():
+    assert parse_order_locally("a coke", "not json").result is None
+
+
+def test_format_order_groups_identical_lines():
+    lines = [OrderLine("Fries", "Large", "Ketchup"), OrderLine("Coke", "?", "No Topping Option"),
+             OrderLine("Fries", "Large", "Ketchup"), OrderLine("Fries", "Small", "Ketchup")]
+    result = format_order(lines)
+    assert fields(result) == ("2 x Fries, 1 x Coke, 1 x Fries", "2 x Large, 1 x ?, 1 x Small",
+                              "2 x Ketchup, 1 x No Topping Option, 1 x Ketchup")
+    # Reads back as the same lines, in grouped order
+    assert parse_order_state(json.dumps(result)) == [lines[0], lines[2], lines[1], lines[3]]
@@ -0,0 +1,158 @@
+import json
+import asyncio
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, update
+from sqlalchemy.future import select
+from app.conversations_app import api, websocket, conversation_writer
+from app.conversations_app.models import Conversation, OrderSession, SESSION_ACTIVE
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def no_id_pool(monkeypatch):
+    # Ids come from the database fallback, there is no Redis here
+    async def no_pool():
+        return None
+    monkeypatch.setattr(api, "allocate_conversation_id", no_pool)
+
+
+async def add_chunk(sessionmaker, marker: str, hold: float = 0.2) -> str:
+    """A chunk that takes `hold` seconds to process, appends `marker` to the context"""
+    async with sessionmaker() as session:
+        base_id, context = await api.lock_order_session(session)
+        await asyncio.sleep(hold)
+        await api.record_conversation(session, base_id, marker, context + marker)
+        return base_id
+
+
+async def test_chunks_of_a_session_are_processed_one_at_a_time(db_sessionmaker):
+    async with db_sessionmaker() as session:
+        base_id, _ = await api.new_customer_session(session)
+
+    # Separate connections stand in for chunks reaching different workers
+    await asyncio.gather(*(add_chunk(db_sessionmaker, marker) for marker in "abc"))
+
+    async with db_sessionmaker() as session:
+        order_session = await session.get(OrderSession, base_id)
+    assert sorted(order_session.latest_context) == ["a", "b", "c"]
+    assert order_session.next_version == 4
+
+
+async def test_concurrent_chunks_start_a_single_session(db_sessionmaker):
+    base_ids = await asyncio.gather(*(add_chunk(db_sessionmaker, marker, hold=0) for marker in "ab"))
+
+    assert base_ids[0] == base_ids[1]
+    async with db_sessionmaker() as session:
+        assert await session.scalar(select(func.count()).select_from(OrderSession)) == 1
+
+
+async def test_chunk_waiting_for_a_done_goes_to_the_new_session(db_sessionmaker):
+    async with db_sessionmaker() as session:
+        old_id, _ = await api.new_customer_session(session)
+
+    async def done():
+        async with db_sessionmaker() as session:
+            return (await api.new_customer_session(session))[0]
+
+    first = asyncio.create_task(add_chunk(db_sessionmaker, "a", hold=0.3))
+    await asyncio.sleep(0.1)
+    # Waits for the first chunk to commit before closing its session
+    finish = asyncio.create_task(done())
+    await asyncio.sleep(0.1)
+    # Resolves the old session, then waits for its lock until the done is committed
+    second = asyncio.create_task(add_chunk(db_sessionmaker, "b", hold=0))
+
+    assert await first == old_id
+    new_id = await finish
+    assert await second == new_id != old_id
+
+    async with db_sessionmaker() as session:
+        old = await session.get(OrderSession, old_id)
+        new = await session.get(OrderSession, new_id)
+    assert (old.status, old.latest_context) == ("closed", "a")
+    assert (new.status, new.latest_context) == (SESSION_ACTIVE, "b")
+
+
+async def append_order(transcription: str, previous_output: str, deadline=None) -> dict:
+    previous = json.loads(previous_output)["order_details"] if previous_output else ""
+    return {"order_details": previous + transcription, "sizes": "", "toppings": "", "answer": ""}
+
+
+async def http_chunk(sessionmaker, transcription: str) -> dict:
+    """A create_and_update call, on another worker"""
+    async with sessionmaker() as session:
+        base_id, context = await api.lock_order_session(session)
+        result = await append_order(transcription, context)
+        await api.save_conversation(session, base_id, transcription, result)
+        return result
+
+
+@pytest.fixture
+def sockets(db_sessionmaker, monkeypatch):
+    """Opened database sessions of the WebSocket connections"""
+    opened = []
+
+    def counting_sessionmaker():
+        opened.append(1)
+        return db_sessionmaker()
+    monkeypatch.setattr(websocket, "AsyncSessionLocal", counting_sessionmaker)
+    # The writer isn't running, rows are inserted right away
+    monkeypatch.setattr(conversation_writer, "AsyncSessionLocal", db_sessionmaker)
+    monkeypatch.setattr(websocket, "process_order", append_order)
+    monkeypatch.setattr(websocket, "SPECULATION_ENABLED", False)
+    return opened
+
+
+async def test_websocket_owns_the_session_until_it_closes(db_sessionmaker, sockets):
+    await http_chunk(db_sessionmaker, "a")
+    socket = await websocket.OrderingSession.start()
+    for chunk in "bc":
+        await socket.handle_chunk(chunk)
+    # Claimed once, the chunks don't wait on the database for the order
+    assert len(sockets) == 1
+
+    with pytest.raises(HTTPException) as error:
+        await http_chunk(db_sessionmaker, "x")
+    assert error.value.status_code == 409
+    with pytest.raises(HTTPException):
+        await websocket.OrderingSession.start()
+
+    await socket.close()
+    assert (await http_chunk(db_sessionmaker, "d"))["order_details"] == "abcd"
+    async with db_sessionmaker() as session:
+        ids = (await session.scalars(select(Conversation.conversation_id).order_by(Conversation.id))).all()
+    assert ids == [f"{socket.base_id}_{version}" for version in range(5)]
+
+
+async def test_websocket_builds_on_http_chunks_after_its_lease_ran_out(db_sessionmaker, sockets):
+    socket = await websocket.OrderingSession.start()
+    await socket.handle_chunk("a")
+    async with db_sessionmaker() as session:
+        await session.execute(update(OrderSession).values(owned_until=func.now()))
+        await session.commit()
+
+    assert (await http_chunk(db_sessionmaker, "b"))["order_details"] == "ab"
+    # Half of the lease has gone by, the next chunk renews it
+    socket._renew_at = 0
+    assert (await socket.handle_chunk("c"))["order_details"] == "abc"
+    with pytest.raises(HTTPException):
+        await http_chunk(db_sessionmaker, "x")
+    await socket.close()
+
+
+async def test_websocket_done_starts_a_session_it_owns(db_sessionmaker, sockets):
+    socket = await websocket.OrderingSession.start()
+    old_id = socket.base_id
+    await socket.handle_chunk("a")
+    assert await socket.handle_chunk("b done") == {"order_details": "", "sizes": "", "toppings": ""}
+    assert socket.base_id != old_id
+    assert (await socket.handle_chunk("c"))["order_details"] == "c"
+
+    async with db_sessionmaker() as session:
+        old = await session.get(OrderSession, old_id)
+    assert (old.status, json.loads(old.latest_context)["order_details"]) == ("closed", "ab")
+    with pytest.raises(HTTPException):
+        await http_chunk(db_sessionmaker, "x")
+    await socket.close()
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.future import select
+from app.utils.pagination import encode_cursor, decode_cursor, parse_fields, keyset_query, page_rows
+from app.conversations_app.api import CONVERSATION_KEYS
+from app.conversations_app.models import Conversation
+
+NOW = datetime(2026, 3, 1, 12, 0, tzinfo=timezone.utc)
+PARSERS = (datetime.fromisoformat, int)
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor([NOW, 42])
+    assert "=" not in cursor
+    assert decode_cursor(cursor, PARSERS) == [NOW, 42]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    encode_cursor([1, 2, 3]),
+    encode_cursor(["yesterday", 1]),
+    encode_cursor([NOW, "many"]),
+])
+def test_invalid_cursors_are_a_bad_request(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, PARSERS)
+    assert error.value.status_code == 400
+
+
+def test_parse_fields():
+    allowed = ("id", "chunk", "timestamp")
+    assert parse_fields(None, allowed) == list(allowed)
+    assert parse_fields(" chunk, id ,", allowed) == ["chunk", "id"]
+    with pytest.raises(HTTPException) as error:
+        parse_fields("id,password", allowed)
+    assert "password" in error.value.detail
+
+
+def test_page_rows_keeps_the_requested_fields_and_points_at_the_last_row():
+    rows = [{"id": number, "chunk": str(number), "timestamp": NOW} for number in (1, 2, 3)]
+    items, next_cursor = page_rows(rows, ["chunk"], CONVERSATION_KEYS, limit=2)
+    assert items == [{"chunk": "1"}, {"chunk": "2"}]
+    assert decode_cursor(next_cursor, PARSERS) == [NOW, 2]
+
+    assert page_rows(rows, ["chunk"], CONVERSATION_KEYS, limit=3)[1] is None
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("descending", [False, True])
+async def test_pages_split_rows_with_equal_timestamps(db_sessionmaker, descending):
+    async with db_sessionmaker() as session:
+        # Five conversations in the same instant, between two others
+        timestamps = [NOW - timedelta(seconds=1)] + [NOW] * 5 + [NOW + timedelta(seconds=1)]
+        session.add_all(Conversation(conversation_id=f"apple_{version}", timestamp=timestamp, context="")
+                        for version, timestamp in enumerate(timestamps))
+        await session.commit()
+
+        pages, cursor = [], None
+        while True:
+            result = await session.execute(keyset_query(
+                Conversation, ["id", "timestamp"], CONVERSATION_KEYS, select(Conversation), cursor,
+                PARSERS, 2, descending=descending,
+            ))
+            items, cursor = page_rows(result.mappings().all(), ["id", "timestamp"], CONVERSATION_KEYS, 2)
+            pages.append([item["id"] for item in items])
+            if cursor is None:
+                break
+
+    ids = [item for page in pages for item in page]
+    expected = sorted(range(1, 8), reverse=descending)
+    assert ids == expected
+    assert [len(page) for page in pages] == [2, 2, 2, 1]
@@ -0,0 +1,101 @@
+import json
+from datetime import datetime, timezone
+import pytest
+from app.conversations_app import api, replay as replay_module
+from app.conversations_app.models import Conversation
+from app.conversations_app.replay import (
+    RecordedBackend, ReplaySession, load_reviewed_sessions, pipeline_backend, replay, score_chunk, percentile,
+)
+from app.conversations_app.schemas import BulkSession
+
+
+def order(order_details: str, sizes: str, toppings: str) -> dict:
+    return {"order_details": order_details, "sizes": sizes, "toppings": toppings, "answer": ""}
+
+
+COKE = order("1 x Coke", "1 x ?", "1 x No Topping Option")
+LARGE_COKE = order("1 x Coke", "1 x Large", "1 x No Topping Option")
+FRIES = order("2 x Fries", "2 x ?", "2 x Ketchup")
+LARGE_FRIES = order("2 x Fries", "2 x Large", "2 x Ketchup")
+
+
+@pytest.fixture
+def backend():
+    backend = RecordedBackend()
+    # The same chunk in two sessions, on different orders
+    backend.record("a coke", "", COKE)
+    backend.record("make it large", json.dumps(COKE), LARGE_COKE)
+    backend.record("two fries with ketchup", "", FRIES)
+    backend.record("Make it  large", json.dumps(FRIES), LARGE_FRIES)
+    return backend
+
+
+@pytest.mark.anyio
+async def test_recorded_responses_answer_the_chunk_on_the_order_they_were_recorded_on(backend):
+    # The answer of the previous result is no part of the order
+    coke = json.dumps({**COKE, "answer": "Anything else?"})
+    assert await backend.process_order_with_llm("make it large", coke) == LARGE_COKE
+    assert await backend.process_order_with_llm("make it large", json.dumps(FRIES)) == LARGE_FRIES
+
+    with pytest.raises(ValueError):
+        await backend.process_order_with_llm("make it large", "")
+    assert (backend.calls, backend.misses) == (3, 1)
+
+
+def test_score_chunk():
+    assert score_chunk(LARGE_COKE, json.dumps(LARGE_COKE))["exact"] == 1
+    score = score_chunk(order("1 x Coke, 1 x Fries", "1 x Small, 1 x Large", "1 x No Topping Option, 1 x Ketchup"),
+                        json.dumps(order("1 x Coke", "1 x Large", "1 x No Topping Option")))
+    assert score == {"items": 0.5, "sizes": 0, "toppings": 0.5, "exact": 0}
+    # Plain text ideal inferences only list the items
+    assert score_chunk(COKE, "1 x Coke")["items"] == 1
+    assert score_chunk(None, json.dumps(COKE))["items"] == 0
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([4, 1, 3, 2], 50) == 2.5
+    assert percentile([1, 2, 3, 4], 99) == 3.97
+
+
+@pytest.mark.anyio
+async def test_replay_scores_each_session_against_its_own_recording(backend, monkeypatch):
+    monkeypatch.setattr(api, "LOCAL_PARSER_ENABLED", False)
+    sessions = [
+        ReplaySession(BulkSession(id="apple", chunks=["a coke", "make it large"]), {1: json.dumps(LARGE_COKE)}),
+        ReplaySession(BulkSession(id="pear", chunks=["two fries with ketchup", "make it large"]),
+                      {0: json.dumps(FRIES), 1: json.dumps(LARGE_FRIES)}),
+    ]
+
+    with pipeline_backend(backend, use_cache=False):
+        report = await replay(sessions, concurrency=2)
+
+    assert (report["chunks"], report["scored_chunks"], report["errors"]) == (4, 3, 0)
+    assert report["accuracy"] == {"items": 1.0, "sizes": 1.0, "toppings": 1.0, "exact": 1.0}
+    assert (backend.calls, backend.misses) == (4, 0)
+
+
+@pytest.mark.anyio
+async def test_reviewed_sessions_record_each_response_with_the_order_before_it(db_sessionmaker, monkeypatch):
+    monkeypatch.setattr(replay_module, "AsyncSessionLocal", db_sessionmaker)
+    now = datetime.now(timezone.utc)
+    async with db_sessionmaker() as session:
+        for base_id, first_chunk, first, second in (("apple", "a coke", COKE, LARGE_COKE),
+                                                      ("pear", "two fries with ketchup", FRIES, LARGE_FRIES)):
+            session.add_all([
+                Conversation(conversation_id=f"{base_id}_0", chunk="New customer session", context="", timestamp=now),
+                Conversation(conversation_id=f"{base_id}_1", chunk=first_chunk, context=json.dumps(first), timestamp=now),
+                Conversation(conversation_id=f"{base_id}_2", chunk="make it large", context=json.dumps(second),
+                             ideal_inference=json.dumps(second), timestamp=now),
+            ])
+        await session.commit()
+
+    backend = RecordedBackend()
+    sessions = await load_reviewed_sessions(backend)
+
+    assert sorted((s.session.id, s.session.chunks, s.ideals) for s in sessions) == [
+        ("apple", ["a coke", "make it large"], {1: json.dumps(LARGE_COKE)}),
+        ("pear", ["two fries with ketchup", "make it large"], {1: json.dumps(LARGE_FRIES)}),
+    ]
+    assert await backend.process_order_with_llm("make it large", json.dumps(COKE)) == LARGE_COKE
+    assert await backend.process_order_with_llm("make it large", json.dumps(FRIES)) == LARGE_FRIES
@@ -0,0 +1,118 @@
+import asyncio
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import update
+from sqlalchemy.future import select
+from app.users_app.models import UserModel
+from app.conversations_app.models import Conversation
+from app.conversations_app.review import claim_conversations, submit_reviews, release_claims
+from app.conversations_app.schemas import ReviewStage, SubmitReviewsRequest, ReleaseClaimsRequest
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime.now(timezone.utc)
+ALICE, BOB, CAROL = 1, 2, 3
+
+
+def as_reviewer(user_id: int):
+    return SimpleNamespace(state=SimpleNamespace(user=SimpleNamespace(id=user_id)))
+
+
+@pytest.fixture
+async def reviews(db_sessionmaker):
+    async with db_sessionmaker() as session:
+        session.add_all(
+            UserModel(id=user_id, username=name, email=f"{name}@example.com", hashed_password="", full_name=name)
+            for user_id, name in ((ALICE, "alice"), (BOB, "bob"), (CAROL, "carol"))
+        )
+        await session.flush()
+        session.add_all(
+            Conversation(conversation_id=f"apple_{version}", timestamp=NOW + timedelta(seconds=version), context="")
+            for version in range(6)
+        )
+        await session.commit()
+
+    async def claim(user_id: int, limit: int = 3, stage: ReviewStage = ReviewStage.initial) -> list[int]:
+        async with db_sessionmaker() as session:
+            claimed = await claim_conversations(as_reviewer(user_id), stage, limit, session)
+        return [conversation.id for conversation in claimed.conversations]
+
+    async def submit(user_id: int, ids: list[int], stage: ReviewStage = ReviewStage.initial):
+        request = SubmitReviewsRequest(stage=stage, reviews=[{"id": id, "ideal_inference": "{}"} for id in ids])
+        async with db_sessionmaker() as session:
+            return await submit_reviews(as_reviewer(user_id), request, session)
+
+    return SimpleNamespace(claim=claim, submit=submit, sessionmaker=db_sessionmaker)
+
+
+async def expire_leases(sessionmaker):
+    async with sessionmaker() as session:
+        await session.execute(update(Conversation).values(claimed_until=NOW - timedelta(minutes=1)))
+        await session.commit()
+
+
+async def test_claims_hand_out_the_oldest_conversations_once(reviews):
+    assert await reviews.claim(ALICE) == [1, 2, 3]
+    assert await reviews.claim(BOB) == [4, 5, 6]
+    assert await reviews.claim(CAROL) == []
+
+
+async def test_claims_skip_rows_locked_by_a_claim_in_progress(reviews):
+    async with reviews.sessionmaker() as session:
+        # Another reviewer's claim, not committed yet
+        await session.execute(select(Conversation.id).where(Conversation.id <= 2).with_for_update())
+
+        assert await asyncio.wait_for(reviews.claim(BOB), 5) == [3, 4, 5]
+        await session.rollback()
+
+
+async def test_claiming_again_renews_the_reviewers_own_claims(reviews):
+    assert await reviews.claim(ALICE, limit=2) == [1, 2]
+    async with reviews.sessionmaker() as session:
+        before = await session.scalar(select(Conversation.claimed_until).where(Conversation.id == 1))
+
+    assert await reviews.claim(ALICE, limit=3) == [1, 2, 3]
+    async with reviews.sessionmaker() as session:
+        assert await session.scalar(select(Conversation.claimed_until).where(Conversation.id == 1)) >= before
+
+
+async def test_expired_leases_are_claimed_by_the_next_reviewer(reviews):
+    assert await reviews.claim(ALICE) == [1, 2, 3]
+    await expire_leases(reviews.sessionmaker)
+
+    assert await reviews.claim(BOB) == [1, 2, 3]
+    result = await reviews.submit(ALICE, [1, 2])
+    assert (result.accepted, result.rejected) == ([], [1, 2])
+    result = await reviews.submit(BOB, [1, 2])
+    assert (result.accepted, result.rejected) == ([1, 2], [])
+
+
+async def test_reviews_are_accepted_past_the_lease_until_someone_else_claims(reviews):
+    assert await reviews.claim(ALICE, limit=1) == [1]
+    await expire_leases(reviews.sessionmaker)
+
+    result = await reviews.submit(ALICE, [1])
+    assert result.accepted == [1]
+    # Reviewed, no longer awaiting the initial review
+    assert await reviews.claim(BOB, limit=1) == [2]
+
+
+async def test_final_review_is_never_by_the_initial_reviewer(reviews):
+    await reviews.claim(ALICE, limit=2)
+    await reviews.submit(ALICE, [1, 2])
+
+    assert await reviews.claim(ALICE, stage=ReviewStage.final) == []
+    assert await reviews.claim(BOB, stage=ReviewStage.final) == [1, 2]
+    result = await reviews.submit(BOB, [1, 2], stage=ReviewStage.final)
+    assert result.accepted == [1, 2]
+    assert await reviews.claim(CAROL, stage=ReviewStage.final) == []
+
+
+async def test_released_claims_go_to_the_next_reviewer(reviews):
+    await reviews.claim(ALICE)
+    async with reviews.sessionmaker() as session:
+        released = await release_claims(as_reviewer(ALICE), ReleaseClaimsRequest(ids=[2, 3, 4]), session)
+    assert released == {"released": [2, 3]}
+
+    assert await reviews.claim(BOB) == [2, 3, 4]
@@ -0,0 +1,57 @@
+import gc
+import asyncio
+import pytest
+from app.conversations_app import websocket
+from app.conversations_app.websocket import OrderingSession
+
+pytestmark = pytest.mark.anyio
+
+RESULT = {"order_details": "1 x Coke", "sizes": "1 x Large", "toppings": "1 x No Topping Option", "answer": ""}
+
+
+@pytest.fixture(autouse=True)
+def speculation(monkeypatch):
+    monkeypatch.setattr(websocket, "SPECULATION_ENABLED", True)
+    monkeypatch.setattr(websocket, "SPECULATION_DELAY", 10)
+
+    async def not_expected(*args):
+        raise AssertionError("processed again")
+    monkeypatch.setattr(websocket, "process_order", not_expected)
+
+    async def release(*args):
+        pass
+    monkeypatch.setattr(websocket, "release_order_session", release)
+
+
+async def test_final_transcript_reuses_the_speculation_without_waiting_for_the_delay(monkeypatch):
+    async def fast_result(transcription, previous_output):
+        return RESULT
+    monkeypatch.setattr(websocket, "get_fast_order_result", fast_result)
+
+    session = OrderingSession("owner", "base", "", 1)
+    session.speculate("A large coke")
+    await asyncio.sleep(0)
+
+    result = await asyncio.wait_for(session._process("a large coke."), 1)
+    assert result == RESULT
+
+
+async def test_failed_speculations_nobody_waits_for_are_not_reported_to_the_loop(monkeypatch):
+    async def failing(transcription, previous_output):
+        raise RuntimeError("no")
+    monkeypatch.setattr(websocket, "get_fast_order_result", failing)
+    monkeypatch.setattr(websocket, "SPECULATION_DELAY", 0)
+    unhandled = []
+    asyncio.get_running_loop().set_exception_handler(lambda loop, context: unhandled.append(context))
+
+    session = OrderingSession("owner", "base", "", 1)
+    session.speculate("a coke")
+    task = session._speculation.task
+    await asyncio.wait([task])
+    session.speculate("a large coke")
+    await session.close()
+    del task
+    gc.collect()
+    await asyncio.sleep(0)
+
+    assert unhandled == []
@@ -0,0 +1,73 @@
+import json
+import random
+import pytest
+from app.conversations_app.streaming import PartialJSONFields
+
+ORDER = {
+    "order_details": "2 x Fries, 1 x Coke",
+    "sizes": "2 x Large, 1 x ?",
+    "toppings": "2 x Ketchup / Mustard, 1 x No Topping Option",
+    "answer": "Two large fries and a \"coke\" — what size?\nAnything else?",
+}
+
+
+def feed_all(deltas: list[str]) -> tuple[PartialJSONFields, list[dict]]:
+    parser = PartialJSONFields()
+    return parser, [parser.feed(delta) for delta in deltas]
+
+
+def split(text: str, rng: random.Random) -> list[str]:
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, 12)))
+    return [text[start:end] for start, end in zip([0, *cuts], [*cuts, len(text)])]
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+@pytest.mark.parametrize("seed", range(20))
+def test_any_split_gives_the_complete_fields(seed, ensure_ascii):
+    text = json.dumps(ORDER, ensure_ascii=ensure_ascii, indent=seed % 2 or None)
+    parser, _ = feed_all(split(text, random.Random(seed)))
+    assert parser.fields == ORDER
+
+
+def test_one_character_at_a_time_only_ever_grows():
+    text = json.dumps(ORDER)
+    parser = PartialJSONFields()
+    seen: dict[str, str] = {}
+    for char in text:
+        for key, value in parser.feed(char).items():
+            # A partial value is always a prefix of the final one
+            assert ORDER[key].startswith(value)
+            assert len(value) >= len(seen.get(key, ""))
+            seen[key] = value
+    assert seen == ORDER
+
+
+def test_returns_only_the_fields_that_changed():
+    _, changes = feed_all(['{"order_details": "1 x Co', 'ke", "si', 'zes": "1 x', ' Large"}'])
+    assert changes == [
+        {"order_details": "1 x Co"},
+        {"order_details": "1 x Coke"},
+        {"sizes": "1 x"},
+        {"sizes": "1 x Large"},
+    ]
+
+
+def test_partial_escapes_are_held_back():
+    parser = PartialJSONFields()
+    assert parser.feed('{"answer": "caf\\') == {"answer": "caf"}
+    assert parser.feed('u00') == {"answer": "caf"}
+    assert parser.feed('e9 ok') == {"answer": "café ok"}
+    assert parser.feed('\\"') == {"answer": 'café ok"'}
+    parser.feed('"}')
+    assert parser.fields == {"answer": 'café ok"'}
+
+
+def test_non_string_values_are_skipped():
+    text = '{"count": 2, "nested": {"a": "}", "b": [1, {"c": "]"}]}, "flag": null, "answer": "ok"}'
+    parser, _ = feed_all(list(text))
+    assert parser.fields == {"answer": "ok"}
+
+
+def test_text_after_the_object_is_ignored():
+    parser, _ = feed_all(['{"answer": "ok", "n": 1}', ' {"answer": "again"}'])
+    assert parser.fields == {"answer": "ok"}
@@ -0,0 +1,73 @@
+from app.conversations_app.validation import validate_order, expand_lenient
+
+
+def test_valid_order_is_returned_untouched():
+    result = {"order_details": "2 x Fries, 1 x Coke", "sizes": "2 x Large, 1 x ?",
+              "toppings": "2 x Ketchup, 1 x No Topping Option", "answer": "Anything else?"}
+    repaired, issues = validate_order(result)
+    assert issues == []
+    assert repaired is result
+
+
+def test_names_are_normalized_to_the_menu_spelling():
+    repaired, issues = validate_order({
+        "order_details": "1 x CHEESEburger, 2 x cokes, 1 x  egg   sandwich",
+        "sizes": "1 x large, 2 x SMALL, 1 x medium",
+        "toppings": "1 x ketchup / bbq, 2 x no topping option, 1 x MAYO",
+        "answer": "",
+    })
+    assert issues
+    assert repaired["order_details"] == "1 x Cheeseburger, 2 x Coke, 1 x Egg Sandwich"
+    assert repaired["sizes"] == "1 x Large, 2 x Small, 1 x Medium"
+    assert repaired["toppings"] == "1 x Ketchup / BBQ, 2 x No Topping Option, 1 x Mayo"
+
+
+def test_unknown_items_are_dropped_with_their_size_and_topping():
+    repaired, issues = validate_order({
+        "order_details": "1 x Pizza, 1 x Fries", "sizes": "1 x Large, 1 x Small",
+        "toppings": "1 x Pepperoni, 1 x Ketchup", "answer": "Sure",
+    })
+    assert "unknown item 'Pizza' dropped" in issues
+    assert (repaired["order_details"], repaired["sizes"], repaired["toppings"]) == ("1 x Fries", "1 x Small", "1 x Ketchup")
+    assert repaired["answer"] == "Sure"
+
+
+def test_sizes_the_item_does_not_come_in_are_marked_unavailable():
+    repaired, _ = validate_order({
+        "order_details": "1 x Mango Juice, 1 x Water, 1 x Coke", "sizes": "1 x Small, 1 x Large, 1 x Huge",
+        "toppings": "1 x No Topping Option, 1 x No Topping Option, 1 x No Topping Option", "answer": "",
+    })
+    assert repaired["sizes"] == "1 x !, 1 x !, 1 x !"
+
+
+def test_unavailable_size_marker_is_repaired():
+    repaired, issues = validate_order({
+        # One Size Option on an item that has sizes, and a real size on a one-size item
+        "order_details": "1 x Fries, 1 x Chicken and Rice", "sizes": "1 x One Size Option, 1 x Medium",
+        "toppings": "1 x ?, 1 x ?", "answer": "",
+    })
+    assert repaired["sizes"] == "1 x ?, 1 x !"
+    assert repaired["toppings"] == "1 x ?, 1 x No Topping Option"
+    assert any("size 'Medium'" in issue for issue in issues)
+
+
+def test_unavailable_toppings_are_marked():
+    repaired, _ = validate_order({
+        "order_details": "1 x Coke, 1 x Fries", "sizes": "1 x Large, 1 x Large",
+        "toppings": "1 x Ketchup, 1 x Ketchup / Whipped Cream", "answer": "",
+    })
+    assert repaired["toppings"] == "1 x !, 1 x !"
+
+
+def test_mismatched_counts_are_padded_as_unspecified():
+    repaired, issues = validate_order({
+        "order_details": "1 x Fries, 1 x Sprite", "sizes": "1 x Large", "toppings": "", "answer": "",
+    })
+    assert issues[0].startswith("counts differ")
+    assert repaired["sizes"] == "1 x Large, 1 x ?"
+    assert repaired["toppings"] == "1 x ?, 1 x No Topping Option"
+
+
+def test_expand_lenient_tolerates_missing_counts_and_echoed_field_names():
+    assert expand_lenient("sizes: 2 x Large, Small") == ["Large", "Large", "Small"]
+    assert expand_lenient(None) == []
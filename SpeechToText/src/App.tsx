@@ -1,4 +1,4 @@
-import { createAndUpdateOrder } from "./api/orderAPI";
+import { streamOrderUpdates, OrderSocket } from "./api/orderAPI";
 
 
 import React, {
@@ -408,12 +408,29 @@ const App: React.FC = () => {
     const [isProcessing, setIsProcessing] = useState<boolean>(false);
     const pendingTextRef = useRef<string>("");
     const processingTimeoutRef = useRef<number | null>(null);
+    const orderSocketRef = useRef<OrderSocket | null>(null);
+
+
+    // One server-side ordering session per visit; HTTP streaming is the fallback
+    useEffect(() => {
+        orderSocketRef.current = new OrderSocket();
+        return () => {
+            orderSocketRef.current?.close();
+            orderSocketRef.current = null;
+        };
+    }, []);
 
 
     const getText = async (text: string) => {
         try {
             setIsProcessing(true);
-            const responseData = await createAndUpdateOrder(text);
+            const socket = orderSocketRef.current;
+            const responseData = socket?.isOpen
+                ? await socket.send(text)
+                : await streamOrderUpdates(text, (update) => {
+                    // Show fields as soon as they arrive instead of waiting for the full order
+                    setData((prev) => ({ ...prev, ...update }));
+                });
             setData({ ...responseData });
         } catch (error) {
             console.error("Failed to fetch order data:", error);
@@ -431,6 +448,14 @@ const App: React.FC = () => {
     };
 
 
+    // Let the server start on what is being said before the final result arrives
+    useEffect(() => {
+        const socket = orderSocketRef.current;
+        if (!interimText.trim() || !socket?.isOpen) return;
+        socket.sendInterim(text.slice(lastSentTextRef.current.length) + interimText);
+    }, [text, interimText]);
+
+
     useEffect(() => {
         const newText = text.slice(lastSentTextRef.current.length);
         if (!newText) return;
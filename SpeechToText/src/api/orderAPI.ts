@@ -21,3 +21,120 @@ export const createAndUpdateOrder = async (text: string) => {
     throw error;
   }
 };
+
+
+export interface OrderUpdate {
+  order_details?: string;
+  sizes?: string;
+  toppings?: string;
+  answer?: string;
+}
+
+// Streams partial order fields as the server produces them (Server-Sent Events).
+// onUpdate receives only the fields that changed; the final order is returned.
+export const streamOrderUpdates = async (
+  text: string,
+  onUpdate: (update: OrderUpdate) => void
+): Promise<OrderUpdate> => {
+  const response = await fetch(`${API_BASE_URL}/create_and_update/stream`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "Accept": "text/event-stream",
+    },
+    body: JSON.stringify({ text }),
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error(`API error: ${response.statusText}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    const events = buffer.split(/\r?\n\r?\n/);
+    buffer = events.pop() ?? "";
+
+    for (const rawEvent of events) {
+      let event = "message";
+      const data: string[] = [];
+      for (const line of rawEvent.split(/\r?\n/)) {
+        if (line.startsWith("event:")) event = line.slice(6).trim();
+        else if (line.startsWith("data:")) data.push(line.slice(5).trimStart());
+      }
+      if (!data.length) continue;
+
+      const payload = JSON.parse(data.join("\n"));
+      if (event === "partial") {
+        onUpdate(payload);
+      } else if (event === "final") {
+        return payload;
+      } else if (event === "error") {
+        throw new Error(payload.detail);
+      }
+    }
+  }
+
+  throw new Error("Order stream ended without a final update");
+};
+
+const WS_URL = `${API_BASE_URL.replace(/^http/, "ws")}/ws`;
+
+// Keeps one ordering session open on the server for the whole customer visit.
+// Chunks are answered in the order they were sent.
+export class OrderSocket {
+  private socket: WebSocket;
+  private pending: {
+    resolve: (order: OrderUpdate) => void;
+    reject: (error: Error) => void;
+  }[] = [];
+
+  constructor() {
+    this.socket = new WebSocket(WS_URL);
+
+    this.socket.onmessage = (event: MessageEvent) => {
+      const request = this.pending.shift();
+      if (!request) return;
+      const payload = JSON.parse(event.data);
+      if (payload.error) {
+        request.reject(new Error(payload.error));
+      } else {
+        request.resolve(payload);
+      }
+    };
+
+    this.socket.onclose = () => {
+      this.pending.forEach(({ reject }) => reject(new Error("Order socket closed")));
+      this.pending = [];
+    };
+  }
+
+  get isOpen(): boolean {
+    return this.socket.readyState === WebSocket.OPEN;
+  }
+
+  send(text: string): Promise<OrderUpdate> {
+    return new Promise((resolve, reject) => {
+      this.pending.push({ resolve, reject });
+      this.socket.send(JSON.stringify({ text }));
+    });
+  }
+
+  // Interim speech results are not answered, the server only starts working on
+  // them so the final chunk with the same text is answered sooner
+  sendInterim(text: string) {
+    if (this.isOpen) {
+      this.socket.send(JSON.stringify({ text, interim: true }));
+    }
+  }
+
+  close() {
+    this.socket.close();
+  }
+}